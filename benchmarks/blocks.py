@@ -0,0 +1,94 @@
+from hashlib import sha256
+from time import perf_counter, time
+from blobchain.columnar import ColumnarChain
+import blobchain.blockchain as blockchain
+import blobchain.mining as mining
+import gc
+import sys
+import tracemalloc
+
+"""Memory per block and whole-chain scan speed of a list of Blobs with a __dict__, with __slots__, and of the columnar chain
+Run from the repository root: python -m benchmarks.blocks [blocks]"""
+
+
+class DictBlob:
+    # Blob as it was before __slots__, with a per-instance __dict__
+    def __init__(self, header, transactions):
+        self.index = header["index"]
+        self.timestamp = header["timestamp"]
+        self.previous_hash = header["previous_hash"]
+        self.transactions = transactions
+        self.merkle_root = header["merkle_root"]
+        self.target = header["target"]
+        self.nonce = header["nonce"]
+        self.own_hash = header["own_hash"]
+
+
+def headers(blocks):
+    # Headers shaped like real ones, without paying for the Proof of Work
+    previous_hash = "1"
+    for index in range(blocks):
+        own_hash = sha256(f"{index}".encode()).hexdigest()
+        yield {"index": index, "timestamp": time() + index, "previous_hash": previous_hash,
+               "merkle_root": sha256(own_hash.encode()).hexdigest(), "target": mining.initial_target(), "nonce": index,
+               "own_hash": own_hash}
+        previous_hash = own_hash
+
+
+def build(kind, blocks):
+    chain = ColumnarChain() if kind == 'columnar' else []
+    for header in headers(blocks):
+        transactions = [{"recipient": "bob", "sender": "alice", "amount": header["index"]}]
+        if kind == 'dict':
+            chain.append(DictBlob(header, transactions))
+        else:
+            chain.append(blockchain.Blob.from_header(header, transactions))
+    return chain
+
+
+def measure(kind, blocks):
+    gc.collect()
+    tracemalloc.start()
+    chain = build(kind, blocks)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return chain, size
+
+
+def timed(function):
+    start = perf_counter()
+    result = function()
+    return (perf_counter() - start) * 1000, result
+
+
+def broken_link(chain):
+    for height in range(1, len(chain)):
+        if chain[height].previous_hash != chain[height - 1].own_hash:
+            return height
+    return None
+
+
+def mean_interval(chain):
+    return (chain[-1].timestamp - chain[0].timestamp) / (len(chain) - 1)
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    print(f'{blocks:,} blocks, one transaction each')
+    for kind in ('dict', 'slots', 'columnar'):
+        chain, size = measure(kind, blocks)
+        if kind == 'columnar':
+            link_ms, broken = timed(lambda: chain.broken_link())
+            interval_ms, interval = timed(lambda: float(chain.intervals().mean()))
+        else:
+            link_ms, broken = timed(lambda: broken_link(chain))
+            interval_ms, interval = timed(lambda: sum(b.timestamp - a.timestamp for a, b in zip(chain, chain[1:]))
+                                          / (len(chain) - 1))
+        iterate_ms, _ = timed(lambda: [block.own_hash for block in chain])
+        print(f'{kind:>9}: {size / blocks:7.1f} bytes/block, linkage scan {link_ms:8.1f} ms (broken {broken}), '
+              f'mean interval {interval_ms:8.1f} ms ({interval:.2f} s), iteration {iterate_ms:8.1f} ms')
+        del chain
+
+
+if __name__ == "__main__":
+    main()
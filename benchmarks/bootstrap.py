@@ -0,0 +1,100 @@
+from time import perf_counter
+from blobchain.connection import NETWORK_ERRORS, extract_data
+import blobchain.mining as mining
+import blobchain.peer as peer
+import asyncio
+import logging
+import random
+import sys
+
+"""Time for a new node to fill its peer table, with the recursive one-peer-at-a-time crawl BlobNode used to run
+against the breadth-first concurrent crawl of BlobNode.discover
+The network is simulated in memory, so that thousands of nodes fit in one process: every message is handed straight
+to the Handler of the node it is sent to, after the one-way latency of the link
+Run from the repository root: python -m benchmarks.bootstrap [nodes] [latency ms] [peers per node] [seeds]"""
+
+host = '127.0.0.1'
+base_port = 20000
+
+
+class VirtualNode(peer.BlobNode):
+    def __init__(self, port, network, latency):
+        super().__init__(port, host, pooled=False, seeds=[])
+        self.address = (host, port)
+        self.network = network
+        self.latency = latency
+        self.queried = set()
+
+    async def send_echo(self, PEERHOST, PEERPORT, msgtype, message):
+        await asyncio.sleep(self.latency)
+        node = self.network.get(PEERPORT)
+        if node is None:
+            raise ConnectionRefusedError(f'Nothing is listening on {PEERHOST!r}:{PEERPORT!r}')
+        self.queried.add(PEERPORT)
+        handler = peer.Handler(node.maxpeers, peers=node.peers)
+        await handler.handle_data(msgtype, message, node.blo)
+        await asyncio.sleep(self.latency)
+        return extract_data(handler.packet)
+
+    async def build_peers(self, host, port):
+        # BlobNode.build_peers before discover, which only moves on to the next peer once a whole branch is crawled
+        try:
+            newpeer = (host, port)
+            if (host != self.host or port != self.port) and (newpeer not in self.peers):
+                if not self.peers.full() and await self.routine(host, port, 'PING', self.address):
+                    self.peers.add(newpeer)
+                    _, reply = await self.send_echo(host, port, 'LIST', None)
+                    for peerhost, peerport in reply:
+                        if peerhost != self.host or peerport != self.port:
+                            await self.build_peers(peerhost, peerport)
+        except NETWORK_ERRORS:
+            pass
+
+
+def build_network(nodes, latency, degree, rng):
+    """:return: <dict> Port -> VirtualNode, each node listing degree random others as peers"""
+    network = {}
+    for index in range(nodes):
+        network[base_port + index] = VirtualNode(base_port + index, network, latency)
+    ports = list(network)
+    for port, node in network.items():
+        node.peers.extend((host, other) for other in rng.sample(ports, degree + 1) if other != port)
+    return network
+
+
+async def bootstrap(nodes, latency, degree, seeds, recursive):
+    """:return: <tuple> (seconds, number of nodes queried, number of peers found) for a new node joining"""
+    rng = random.Random(0)
+    network = build_network(nodes, latency, degree, rng)
+    newcomer = VirtualNode(base_port - 1, network, latency)
+    network[newcomer.port] = newcomer
+    addresses = [(host, port) for port in rng.sample(range(base_port, base_port + nodes), seeds)]
+    start = perf_counter()
+    if recursive:
+        for seedhost, seedport in addresses:
+            await newcomer.build_peers(seedhost, seedport)
+    else:
+        await newcomer.discover(addresses)
+    return perf_counter() - start, len(newcomer.queried), len(newcomer.peers)
+
+
+def main():
+    sizes = [int(sys.argv[1])] if len(sys.argv) > 1 else [100, 1000, 5000]
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+    degree = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    seeds = int(sys.argv[4]) if len(sys.argv) > 4 else 3
+    # The genesis Block of every node is mined when it is built
+    mining.DIFFICULTY = 1
+    logging.getLogger('blobchain').setLevel(logging.ERROR)
+    print(f'{latency * 1000:.0f} ms one-way latency, {degree} peers per node, {seeds} seeds, '
+          f'tables of {peer.BlobNode(0, host, pooled=False).maxpeers} peers')
+
+    for nodes in sizes:
+        for name, recursive in (('recursive', True), ('discover', False)):
+            elapsed, queried, found = asyncio.run(bootstrap(nodes, latency, degree, seeds, recursive))
+            print(f'{nodes:>6,} nodes, {name:>9}: {elapsed * 1000:9.1f} ms, {queried:5,} nodes queried, '
+                  f'{found:4} peers found')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+from hashlib import sha256
+from time import perf_counter, time
+import blobchain.connection as connection
+import ast
+import sys
+
+"""Encoding and decoding of a REPL-BLOB reply with the binary codec against the old str() and ast.literal_eval path
+Run from the repository root: python -m benchmarks.codec [chain lengths...]"""
+
+
+def synthetic_chain(length):
+    # Blocks shaped like Blob.to_dict, without paying for the Proof of Work
+    chain = []
+    previous_hash = "1"
+    for index in range(length):
+        own_hash = sha256(f"{index}".encode()).hexdigest()
+        chain.append({"index": index, "timestamp": time(), "previous_hash": previous_hash,
+                      "transactions": [{"recipient": "bob", "sender": "alice", "amount": index}],
+                      "merkle_root": sha256(f"{own_hash}".encode()).hexdigest(), "nonce": index * 31,
+                      "own_hash": own_hash})
+        previous_hash = own_hash
+    return chain
+
+
+def legacy_encode(msgtype, message):
+    return str((msgtype, message)).encode('utf-8')
+
+
+def legacy_decode(data):
+    return ast.literal_eval(data.decode('utf-8'))
+
+
+def timed(function, *args):
+    start = perf_counter()
+    result = function(*args)
+    return result, perf_counter() - start
+
+
+def main():
+    lengths = [int(arg) for arg in sys.argv[1:]] or [10, 1000, 100000]
+    for length in lengths:
+        chain = synthetic_chain(length)
+
+        data, legacy_out = timed(legacy_encode, 'REPL-BLOB', chain)
+        _, legacy_in = timed(legacy_decode, data)
+        print(f'{length:7} blocks  legacy: {len(data):12,} bytes, encode {legacy_out * 1000:9.2f} ms, '
+              f'decode {legacy_in * 1000:9.2f} ms')
+
+        packet, binary_out = timed(connection.process_message, 'REPL-BLOB', chain)
+        _, binary_in = timed(connection.extract_data, packet)
+        print(f'{length:7} blocks  binary: {len(packet):12,} bytes, encode {binary_out * 1000:9.2f} ms, '
+              f'decode {binary_in * 1000:9.2f} ms')
+
+
+if __name__ == "__main__":
+    main()
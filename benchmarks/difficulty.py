@@ -0,0 +1,55 @@
+import blobchain.mining as mining
+import random
+import sys
+
+"""Convergence of the block interval under a changing hashrate, with the retargeting of blobchain.mining
+Block times are drawn from the exponential distribution a real network sees, so no Proof of Work is computed
+Run from the repository root: python -m benchmarks.difficulty [blocks per phase] [hashrate multiplier ...]"""
+
+# Hashes per second of the whole network at multiplier 1, which finds a block every BLOCK_INTERVAL at the initial target
+BASE_HASHRATE = mining.block_work(mining.initial_target()) / mining.BLOCK_INTERVAL
+
+
+def simulate(phases, blocks, rng):
+    """:param phases: <list> Hashrate multipliers, each held for the given number of blocks
+    :return: <tuple> (timestamps, targets, multipliers) of every block"""
+    timestamps, targets, multipliers = [0.0], [mining.initial_target()], [phases[0]]
+
+    def lookup(height):
+        return timestamps[height], targets[height]
+
+    for multiplier in phases:
+        for _ in range(blocks):
+            target = mining.next_target(len(timestamps), lookup)
+            # Expected hashes for the target, over the hashes the network performs each second
+            interval = rng.expovariate(BASE_HASHRATE * multiplier / mining.block_work(target))
+            timestamps.append(timestamps[-1] + interval)
+            targets.append(target)
+            multipliers.append(multiplier)
+    return timestamps, targets, multipliers
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    phases = [float(arg) for arg in sys.argv[2:]] or [1, 4, 0.5, 1]
+    interval = mining.RETARGET_INTERVAL
+    timestamps, targets, multipliers = simulate(phases, blocks, random.Random(0))
+    print(f'{len(timestamps) - 1:,} blocks, retarget every {interval}, aiming for {mining.BLOCK_INTERVAL} s per block')
+
+    # Each window holds the blocks mined at one target, from one retarget to the next
+    for height in range(interval, len(timestamps) - interval + 1, interval):
+        window = slice(height, height + interval)
+        mean = (timestamps[height + interval - 1] - timestamps[height - 1]) / interval
+        difficulty = mining.block_work(targets[height]) / mining.block_work(mining.initial_target())
+        hashrate = '/'.join(f'x{multiplier:g}' for multiplier in sorted(set(multipliers[window]), reverse=True))
+        print(f'height {height:6}: hashrate {hashrate:<8} difficulty x{difficulty:7.3f}, mean interval {mean:7.3f} s')
+
+    for number, multiplier in enumerate(phases):
+        # The second half of each phase, once retargeting has caught up with the new hashrate
+        first, last = number * blocks + blocks // 2, (number + 1) * blocks
+        mean = (timestamps[last] - timestamps[first]) / (last - first)
+        print(f'phase {number}, hashrate x{multiplier:g}: mean interval {mean:.3f} s over its second half')
+
+
+if __name__ == "__main__":
+    main()
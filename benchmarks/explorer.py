@@ -0,0 +1,152 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from statistics import median, quantiles
+from time import perf_counter
+from blobchain.explorer import Explorer
+from blobchain.gateway import Gateway
+from blobchain.mempool import transaction_hash
+from web.server import make_app
+import blobchain.mining as mining
+import blobchain.peer as peer
+import asyncio
+import json
+import multiprocessing
+import random
+import sys
+import threading
+
+"""Requests per second of the block explorer endpoints of the web server, with the reply cache disabled and enabled,
+and of conditional GETs revalidating cached replies
+A node holding a chain of the given length and the web servers run in separate processes, and requests follow a
+skewed popularity, with the tip and the most recent blocks much more popular than old blocks and transactions
+Run from the repository root: python -m benchmarks.explorer [blocks] [requests] [concurrency]"""
+
+host = '127.0.0.1'
+node_port = 9700
+web_ports = {"uncached": 9701, "cached": 9702}
+TRANSACTIONS = 20
+
+
+def transactions(height):
+    return [{'recipient': f'address{(height + n) % 97}', 'sender': f'address{n}', 'amount': height * TRANSACTIONS + n}
+            for n in range(TRANSACTIONS)]
+
+
+def serve_node(blocks, ready):
+    async def main():
+        node = peer.BlobNode(node_port, host, seeds=[])
+        for height in range(1, blocks):
+            node.blo.new_block(transactions(height))
+        await asyncio.start_server(node.handle_echo, host, node_port)
+        ready.set()
+        await asyncio.Event().wait()
+    mining.DIFFICULTY = 1
+    mining.RETARGET_INTERVAL = 0
+    asyncio.run(main())
+
+
+def serve_web(port, cache_size, ready):
+    async def main():
+        gateway = Gateway([(host, node_port)])
+        make_app(gateway, Explorer(gateway, cache_size)).listen(port, host)
+        ready.set()
+        await asyncio.Event().wait()
+    asyncio.run(main())
+
+
+def workload(blocks, requests, rng):
+    """:return: <list> Paths requested, drawn from a few hundred with a Zipf-like popularity"""
+    paths = ['/api/stats', '/api/blocks']
+    paths += [f'/api/blocks/{blocks - 1 - n}' for n in range(100)]
+    paths += [f'/api/blocks?before={blocks - 20 * n}' for n in range(1, 20)]
+    paths += [f'/api/transactions/{transaction_hash(rng.choice(transactions(height)))}'
+              for height in rng.sample(range(1, blocks), min(200, blocks - 1))]
+    paths += [f'/api/blocks/{height}' for height in rng.sample(range(blocks), min(200, blocks))]
+    weights = [1 / (rank + 1) for rank in range(len(paths))]
+    return rng.choices(paths, weights, k=requests)
+
+
+def load(port, paths, concurrency, etags=None):
+    """Sends the requests over one keep-alive connection per thread
+    :param etags: <dict> Path -> ETag sent as If-None-Match, or None for plain GETs
+    :return: <tuple> (latency of every request, seconds for all of them, Counter of statuses)"""
+    local = threading.local()
+    statuses = {}
+
+    def get(path):
+        if not hasattr(local, 'connection'):
+            local.connection = HTTPConnection(host, port)
+        headers = {'If-None-Match': etags[path]} if etags and path in etags else {}
+        start = perf_counter()
+        local.connection.request('GET', path, headers=headers)
+        response = local.connection.getresponse()
+        response.read()
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+        return perf_counter() - start
+
+    start = perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        latencies = list(executor.map(get, paths))
+    return latencies, perf_counter() - start, statuses
+
+
+def fetch_etags(port, paths):
+    connection = HTTPConnection(host, port)
+    etags = {}
+    for path in set(paths):
+        connection.request('GET', path)
+        response = connection.getresponse()
+        response.read()
+        etags[path] = response.getheader('Etag')
+    return etags
+
+
+def download(port):
+    """:return: <tuple> (number of Blocks, bytes, seconds) of a full chain download"""
+    connection = HTTPConnection(host, port)
+    start = perf_counter()
+    connection.request('GET', '/download')
+    body = connection.getresponse().read()
+    return len(json.loads(body)), len(body), perf_counter() - start
+
+
+def report(name, latencies, elapsed, statuses):
+    p99 = quantiles(latencies, n=100, method='inclusive')[98]
+    print(f'{name:>24}: {len(latencies) / elapsed:9,.0f} requests/s, median {median(latencies) * 1000:7.2f} ms, '
+          f'p99 {p99 * 1000:7.2f} ms, statuses {dict(sorted(statuses.items()))}')
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    ready = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=serve_node, args=(blocks, ready), daemon=True)]
+    processes[0].start()
+    ready.wait()
+    for name, port in web_ports.items():
+        ready = multiprocessing.Event()
+        processes.append(multiprocessing.Process(target=serve_web, args=(port, 0 if name == 'uncached' else 1024,
+                                                                          ready), daemon=True))
+        processes[-1].start()
+        ready.wait()
+    paths = workload(blocks, requests, random.Random(0))
+    print(f'{requests:,} requests to {len(set(paths))} paths over a chain of {blocks:,} blocks, '
+          f'{concurrency} at a time')
+
+    try:
+        for name, port in web_ports.items():
+            # A first pass warms up connections, and the cache of the cached server
+            load(port, paths[:requests // 10], concurrency)
+            report(name, *load(port, paths, concurrency))
+        etags = fetch_etags(web_ports["cached"], paths)
+        report('cached, conditional', *load(web_ports["cached"], paths, concurrency, etags))
+        count, size, elapsed = download(web_ports["cached"])
+        print(f'{"download":>24}: {count:,} blocks, {size / 1e6:.1f} MB in {elapsed * 1000:.0f} ms')
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+from itertools import count
+from statistics import median, quantiles
+from time import perf_counter, sleep
+from blobchain.connection import ConnectionPool, NETWORK_ERRORS, PeerBusy
+import blobchain.mining as mining
+import blobchain.peer as peer
+import asyncio
+import logging
+import multiprocessing
+import sys
+
+"""Latency of well-behaved peers while one abusive peer floods a node, with and without admission control
+The abusive peer keeps hundreds of requests in flight over its connection, alternating BLOB, which encodes the
+whole chain, and CASH, which has the node mine, while a few well-behaved peers each send TIPS and CASH at a
+steady pace and time every request
+Requests are rate limited per host, so every peer connects from its own loopback address
+The node, the abusive peer and the well-behaved peers each run in their own process
+Run from the repository root: python -m benchmarks.flood [seconds] [blocks] [abusive requests in flight]"""
+
+host = '127.0.0.1'
+base_port = 9750
+HONEST_PEERS = 4
+# Requests per second of every well-behaved peer
+HONEST_RATE = 20
+
+
+def serve(port, blocks, admission, ready):
+    async def main():
+        node = peer.BlobNode(port, host, seeds=[], admission=admission)
+        for height in range(1, blocks):
+            node.blo.new_block([{'recipient': 'bob', 'sender': 'alice', 'amount': height * 100 + n}
+                                for n in range(20)])
+        await asyncio.start_server(node.handle_echo, host, port)
+        asyncio.create_task(node.mine_forever())
+        ready.set()
+        await asyncio.Event().wait()
+    mining.DIFFICULTY = 2
+    mining.RETARGET_INTERVAL = 0
+    logging.getLogger('blobchain').setLevel(logging.ERROR)
+    asyncio.run(main())
+
+
+def abuse(port, inflight, served, shed):
+    async def worker(pool, number):
+        for n in count():
+            msgtype, message = ('BLOB', None) if n % 2 else ('CASH', {'recipient': 'mallory', 'sender': 'mallory',
+                                                                       'amount': number * 10 ** 9 + n})
+            try:
+                await pool.request(host, port, msgtype, message)
+                served.value += 1
+            except PeerBusy:
+                # Retried straight away, without backing off as the reply asks
+                shed.value += 1
+            except NETWORK_ERRORS:
+                await asyncio.sleep(0.01)
+
+    async def main():
+        pool = ConnectionPool(timeout=60)
+        await asyncio.gather(*(worker(pool, number) for number in range(inflight)))
+    asyncio.run(main())
+
+
+async def honest(port, number, duration):
+    """:return: <tuple> (latency of every request answered, number of requests which failed)"""
+    pool = ConnectionPool(timeout=10, source=f'127.0.0.{number + 2}')
+    latencies, failures = [], 0
+    start = perf_counter()
+    for n in count():
+        delay = start + n / HONEST_RATE - perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if perf_counter() - start > duration:
+            break
+        msgtype, message = ('TIPS', None) if n % 2 else ('CASH', {'recipient': 'bob', 'sender': f'peer{number}',
+                                                                  'amount': n})
+        sent = perf_counter()
+        try:
+            await pool.request(host, port, msgtype, message)
+            latencies.append(perf_counter() - sent)
+        except NETWORK_ERRORS:
+            failures += 1
+    pool.close()
+    return latencies, failures
+
+
+async def measure(port, duration):
+    results = await asyncio.gather(*(honest(port, number, duration) for number in range(HONEST_PEERS)))
+    return [latency for latencies, _ in results for latency in latencies], sum(failures for _, failures in results)
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    blocks = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    inflight = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    print(f'{HONEST_PEERS} well-behaved peers at {HONEST_RATE} requests/s each, one abusive peer with {inflight} '
+          f'requests in flight, a chain of {blocks} blocks, {duration:g} s per run')
+
+    for number, (name, admission, flooded) in enumerate((('no flood', True, False),
+                                                         ('flood, no admission', False, True),
+                                                         ('flood, admission', True, True))):
+        port = base_port + number
+        ready = multiprocessing.Event()
+        processes = [multiprocessing.Process(target=serve, args=(port, blocks, admission, ready), daemon=True)]
+        processes[0].start()
+        ready.wait()
+        served, shed = multiprocessing.Value('q', 0, lock=False), multiprocessing.Value('q', 0, lock=False)
+        if flooded:
+            processes.append(multiprocessing.Process(target=abuse, args=(port, inflight, served, shed), daemon=True))
+            processes[-1].start()
+            # Lets the flood build up before the well-behaved peers are timed
+            sleep(1)
+        before = served.value, shed.value
+        try:
+            latencies, failures = asyncio.run(measure(port, duration))
+        finally:
+            for process in processes:
+                process.terminate()
+        served_rate, shed_rate = (served.value - before[0]) / duration, (shed.value - before[1]) / duration
+        p99 = quantiles(latencies, n=100, method='inclusive')[98] if len(latencies) > 1 else float('nan')
+        print(f'{name:>20}: {len(latencies):4} answered, {failures} failed, median {median(latencies) * 1000:7.1f} ms, '
+              f'p99 {p99 * 1000:7.1f} ms, max {max(latencies) * 1000:7.1f} ms | abusive peer served '
+              f'{served_rate:6,.0f}/s, shed {shed_rate:6,.0f}/s')
+
+
+if __name__ == "__main__":
+    main()
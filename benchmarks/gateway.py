@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
+from statistics import median, quantiles
+from time import perf_counter
+from blobchain.gateway import Gateway, ThreadedGateway
+import blobchain.peer as peer
+import asyncio
+import multiprocessing
+import sys
+
+"""Requests per second and latency of transaction submissions from the web front-ends, with a node built per request
+as the Flask client used to, against the shared gateway called from threads (Flask) and from an event loop (Tornado)
+The nodes run in a separate process and do not mine, so that only the submission path is measured
+Run from the repository root: python -m benchmarks.gateway [requests] [concurrency] [nodes]"""
+
+host = '127.0.0.1'
+base_port = 9800
+
+
+def serve(ports, ready):
+    async def main():
+        nodes = [peer.BlobNode(port, host, seeds=[]) for port in ports]
+        for node in nodes:
+            await asyncio.start_server(node.handle_echo, host, node.port)
+        ready.set()
+        await asyncio.Event().wait()
+    asyncio.run(main())
+
+
+def transaction(number):
+    return {'recipient': 'bob', 'sender': 'alice', 'amount': number}
+
+
+def node_per_request(ports, number):
+    # What the Flask client did for every POST before the gateway
+    client = peer.BlobNode(5000, host, pooled=False)
+    for port in ports:
+        asyncio.run(client.send_echo(host, port, 'CASH', transaction(number)))
+
+
+def threaded(submit, requests, concurrency):
+    """:return: <list> Latency of every request, sent from a pool of threads as a WSGI server would"""
+    def timed(number):
+        start = perf_counter()
+        submit(number)
+        return perf_counter() - start
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        return list(executor.map(timed, range(requests)))
+
+
+async def evented(gateway, requests, concurrency, offset):
+    """:return: <list> Latency of every request, with concurrency requests in flight as a Tornado server would"""
+    latencies = []
+    numbers = iter(range(offset, offset + requests))
+
+    async def worker():
+        for number in numbers:
+            start = perf_counter()
+            await gateway.submit(transaction(number))
+            latencies.append(perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    gateway.close()
+    return latencies
+
+
+def report(name, latencies, elapsed):
+    p99 = quantiles(latencies, n=100, method='inclusive')[98]
+    print(f'{name:>24}: {len(latencies) / elapsed:9,.0f} requests/s, median {median(latencies) * 1000:8.2f} ms, '
+          f'p99 {p99 * 1000:8.2f} ms')
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    ports = [base_port + n for n in range(int(sys.argv[3]) if len(sys.argv) > 3 else 4)]
+    ready = multiprocessing.Event()
+    nodes = multiprocessing.Process(target=serve, args=(ports, ready), daemon=True)
+    nodes.start()
+    ready.wait()
+    print(f'{requests:,} submissions to {len(ports)} nodes, {concurrency} at a time')
+
+    try:
+        # Each transaction is distinct, so that none is dropped as already seen
+        start = perf_counter()
+        latencies = threaded(lambda number: node_per_request(ports, number), requests, concurrency)
+        report('node per request', latencies, perf_counter() - start)
+
+        gateway = ThreadedGateway([(host, port) for port in ports])
+        start = perf_counter()
+        latencies = threaded(lambda number: gateway.submit(transaction(requests + number)), requests, concurrency)
+        report('gateway, threads', latencies, perf_counter() - start)
+        gateway.close()
+
+        start = perf_counter()
+        latencies = asyncio.run(evented(Gateway([(host, port) for port in ports]), requests, concurrency,
+                                        2 * requests))
+        report('gateway, event loop', latencies, perf_counter() - start)
+    finally:
+        nodes.terminate()
+
+
+if __name__ == "__main__":
+    main()
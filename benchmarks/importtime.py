@@ -0,0 +1,58 @@
+import os
+import re
+import subprocess
+import sys
+
+"""Import time of the modules every node, wallet and web server loads, measured with python -X importtime
+Fails if a module takes longer than its budget or pulls in a heavy dependency, so that imports stay cheap
+Run from the repository root: python -m benchmarks.importtime [runs]"""
+
+# Module -> budget in milliseconds for its cumulative import time, dependencies included
+BUDGETS = {'blobchain.primes': 20,
+           'blobchain.key_generator': 50,
+           'blobchain.verifier': 150,
+           'blobchain.blockchain': 150,
+           'blobchain.peer': 250}
+# Dependencies which are only loaded by the code paths which need them
+HEAVY = ('sympy', 'numpy')
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def measure(module):
+    """Imports the module in a fresh interpreter, so that nothing is already cached in sys.modules
+    :return: <tuple> (cumulative import time in ms, list of heavy dependencies imported)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True, env=dict(os.environ, PYTHONPATH='.'))
+    cumulative, heavy = None, []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match is None:
+            continue
+        name = match.group(4)
+        if name == module:
+            cumulative = int(match.group(2)) / 1000
+        if name in HEAVY:
+            heavy.append(name)
+    return cumulative, heavy
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    failures = []
+    for module, budget in BUDGETS.items():
+        # The fastest run is kept, as the others only add noise from the machine
+        times, heavy = [], []
+        for _ in range(runs):
+            cumulative, heavy = measure(module)
+            times.append(cumulative)
+        fastest = min(times)
+        status = 'ok' if fastest <= budget and not heavy else 'FAIL'
+        print(f'{module:>24}: {fastest:8.1f} ms (budget {budget} ms), heavy imports {heavy or "none"}  {status}')
+        if status != 'ok':
+            failures.append(module)
+    if failures:
+        sys.exit(f'Import budget exceeded by {", ".join(failures)}')
+
+
+if __name__ == "__main__":
+    main()
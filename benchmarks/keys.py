@@ -0,0 +1,38 @@
+from time import perf_counter
+import blobchain.key_generator as key_generator
+import os
+import sys
+import tempfile
+
+"""Time to generate DSA domain parameters, to load them once saved, and to create a key in an existing domain
+Run from the repository root: python -m benchmarks.keys [keys] [L,N ...]"""
+
+SIZES = [(1024, 160), (2048, 224), (2048, 256), (3072, 256)]
+
+
+def timed(function):
+    start = perf_counter()
+    result = function()
+    return perf_counter() - start, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    sizes = [tuple(int(n) for n in size.split(',')) for size in sys.argv[2:]] or SIZES
+    with tempfile.TemporaryDirectory() as directory:
+        for L, N in sizes:
+            elapsed, domain = timed(lambda: key_generator.Domain(L, N, N + 64))
+            print(f'(L, N) = ({L}, {N})')
+            print(f'{"generate domain":>16}: {elapsed * 1000:10.1f} ms')
+
+            path = os.path.join(directory, f'domain-{L}-{N}.dat')
+            domain.save(path)
+            elapsed, _ = timed(lambda: key_generator.Domain.load(path))
+            print(f'{"load domain":>16}: {elapsed * 1000:10.1f} ms')
+
+            elapsed, _ = timed(lambda: [key_generator.PairKey(L, N, N + 64, domain) for _ in range(count)])
+            print(f'{"generate key":>16}: {elapsed * 1000 / count:10.3f} ms, {count / elapsed:,.0f} keys/s')
+
+
+if __name__ == "__main__":
+    main()
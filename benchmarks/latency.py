@@ -0,0 +1,81 @@
+from statistics import median, quantiles
+from time import perf_counter
+from blobchain.mempool import Mempool
+import blobchain.blockchain as blockchain
+import blobchain.mining as mining
+import blobchain.peer as peer
+import asyncio
+import sys
+
+"""Latency of LIST requests while a node is flooded with CASH transactions
+Compares mining on the event loop, as before Blobchain.new_block_async, against mining in the executor
+Run from the repository root: python -m benchmarks.latency [transactions] [difficulty]"""
+
+host = '127.0.0.1'
+
+
+class InlineBlobchain(blockchain.Blobchain):
+    # Mines on the event loop, which is how Handler.transaction used to call new_block
+    async def new_block_async(self, transactions):
+        return self.new_block(transactions)
+
+
+async def measure(node, transactions):
+    server = await asyncio.start_server(node.handle_echo, host, node.port)
+    node.address = server.sockets[0].getsockname()
+    mining_task = asyncio.create_task(node.mine_forever())
+
+    async def flood():
+        for n in range(transactions):
+            transaction = {'recipient': 'bob', 'sender': 'alice', 'amount': n}
+            await node.send_echo(host, node.port, 'CASH', transaction)
+
+    async def probe():
+        while True:
+            start = perf_counter()
+            await node.send_echo(host, node.port, 'LIST', None)
+            samples.append(perf_counter() - start)
+            await asyncio.sleep(0.01)
+
+    samples = []
+    probing = asyncio.create_task(probe())
+    await flood()
+    # Keeps probing until every queued transaction has been mined
+    while sum(len(block.transactions) for block in node.blo.chain) < transactions:
+        await asyncio.sleep(0.01)
+    probing.cancel()
+    mining_task.cancel()
+    node.pool.close()
+    await asyncio.sleep(0.1)
+    server.close()
+    await server.wait_closed()
+    return samples
+
+
+def milliseconds(seconds):
+    return f'{seconds * 1000:8.2f} ms' if seconds is not None else '       - ms'
+
+
+def report(name, samples):
+    # A run with very few blocks may end before the probe gets two replies, or even one
+    p99 = quantiles(samples, n=100, method='inclusive')[98] if len(samples) > 1 else None
+    print(f'{name:>8}: {len(samples):5} LIST requests, median {milliseconds(median(samples) if samples else None)}, '
+          f'p99 {milliseconds(p99)}, max {milliseconds(max(samples) if samples else None)}')
+
+
+def main():
+    transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    mining.DIFFICULTY = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    # Fixed difficulty, so that the Proof of Work does not drift as blocks are found faster than BLOCK_INTERVAL
+    mining.RETARGET_INTERVAL = 0
+    for name, chain_type, port in (('inline', InlineBlobchain, 9300), ('executor', blockchain.Blobchain, 9301)):
+        # The probe asks for LIST far more often than admission control allows a peer to
+        node = peer.BlobNode(port, host, admission=False)
+        # One transaction per block, so that every transaction costs a full Proof of Work
+        node.blo = chain_type(mempool=Mempool(max_batch=1))
+        samples = asyncio.run(measure(node, transactions))
+        report(name, samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from hashlib import sha256
+from time import perf_counter, time
+from blobchain.ledger import Ledger, value
+import blobchain.blockchain as blockchain
+import blobchain.mining as mining
+import os
+import random
+import sys
+import tempfile
+
+"""Balance and history lookups on a chain with millions of transactions, scanning the chain against the ledger index
+Run from the repository root: python -m benchmarks.ledger [blocks] [transactions per block] [addresses]"""
+
+
+def build(blocks, per_block, addresses):
+    # Blocks shaped like real ones, without paying for the Proof of Work
+    rng = random.Random(0)
+    chain, previous_hash = [], "1"
+    for index in range(blocks):
+        own_hash = sha256(f"{index}".encode()).hexdigest()
+        transactions = [{"recipient": f"address{rng.randrange(addresses)}",
+                         "sender": f"address{rng.randrange(addresses)}", "amount": rng.randrange(100)}
+                        for _ in range(per_block)]
+        header = {"index": index, "timestamp": time(), "previous_hash": previous_hash,
+                  "merkle_root": own_hash, "target": mining.initial_target(), "nonce": index, "own_hash": own_hash}
+        chain.append(blockchain.Blob.from_header(header, transactions))
+        previous_hash = own_hash
+    return chain
+
+
+def scan_balance(chain, address):
+    # What answering a balance query took before the ledger
+    balance = 0
+    for block in chain:
+        for transaction in block.transactions:
+            if transaction["sender"] == address:
+                balance -= value(transaction["amount"])
+            if transaction["recipient"] == address:
+                balance += value(transaction["amount"])
+    return balance
+
+
+def timed(name, function, repeat=1):
+    start = perf_counter()
+    for _ in range(repeat):
+        result = function()
+    print(f'{name:>22}: {(perf_counter() - start) * 1000 / repeat:12.4f} ms')
+    return result
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    per_block = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    addresses = int(sys.argv[3]) if len(sys.argv) > 3 else 10000
+    chain = build(blocks, per_block, addresses)
+    print(f'{blocks:,} blocks, {blocks * per_block:,} transactions, {addresses:,} addresses')
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'ledger.snap')
+        ledger = Ledger(path, snapshot_every=blocks + 1)
+        timed('build index', lambda: [ledger.apply(block) for block in chain])
+
+        scanned = timed('balance, chain scan', lambda: scan_balance(chain, 'address7'))
+        indexed = timed('balance, ledger', lambda: ledger.balance('address7'), repeat=100000)
+        assert scanned == indexed
+        entries = timed('history of 100, ledger', lambda: ledger.entries('address7', 100), repeat=10000)
+        timed('history, materialised', lambda: [chain[height].transactions[position]
+                                                for height, position in entries], repeat=1000)
+
+        timed('revert 10 blocks', lambda: [ledger.revert(block) for block in reversed(chain[-10:])])
+        timed('reapply 10 blocks', lambda: [ledger.apply(block) for block in chain[-10:]])
+
+        timed('snapshot', ledger.snapshot)
+        print(f'{"snapshot size":>22}: {os.path.getsize(path) / 2 ** 20:12.1f} MB')
+        restored = Ledger(path)
+        timed('restart from snapshot', lambda: restored.catch_up(chain))
+        assert restored.balance('address7') == indexed
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+from io import StringIO
+from time import perf_counter
+from blobchain.metrics import Metrics
+import blobchain.peer as peer
+import asyncio
+import logging
+import sys
+
+"""Cost of the node's instrumentation: each metric operation on its own, and requests per second served with
+per-message logging silenced, logged at DEBUG, and with the profiler running
+Run from the repository root: python -m benchmarks.metrics [requests]"""
+
+host = '127.0.0.1'
+
+
+def operation(name, function, count=200000):
+    start = perf_counter()
+    for _ in range(count):
+        function()
+    print(f'{name:>24}: {(perf_counter() - start) / count * 1e9:8.0f} ns')
+
+
+def timed_block(metrics):
+    with metrics.timer('block'):
+        pass
+
+
+async def serve(requests, port, profile=None):
+    """:return: <float> TIPS requests per second answered by a node, 100 in flight at a time"""
+    # Without admission control, which would shed the flood of TIPS rather than serve it
+    node = peer.BlobNode(port, host, admission=False)
+    server = await asyncio.start_server(node.handle_echo, host, port)
+    client = peer.BlobNode(port + 1, host)
+    if profile:
+        node.profiler.start(profile)
+    start = perf_counter()
+    for _ in range(requests // 100):
+        await asyncio.gather(*(client.send_echo(host, port, 'TIPS', None) for _ in range(100)))
+    elapsed = perf_counter() - start
+    if profile:
+        node.profiler.stop()
+    client.pool.close()
+    server.close()
+    await server.wait_closed()
+    return requests / elapsed
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    metrics = Metrics()
+    operation('increment', lambda: metrics.increment('counter'))
+    operation('observe', lambda: metrics.observe('histogram', 0.0003))
+    operation('timer', lambda: timed_block(metrics))
+
+    # Logging goes to a buffer, so that the terminal does not slow down the DEBUG run
+    handler = logging.StreamHandler(StringIO())
+    logging.getLogger().addHandler(handler)
+    for port, (name, level, profile) in enumerate((('WARNING', logging.WARNING, None),
+                                                   ('DEBUG', logging.DEBUG, None),
+                                                   ('WARNING, sampling', logging.WARNING, 'sampling'),
+                                                   ('WARNING, cProfile', logging.WARNING, 'cprofile'))):
+        logging.getLogger().setLevel(level)
+        rate = asyncio.run(serve(requests, 9500 + 2 * port, profile))
+        print(f'{name:>24}: {rate:10,.0f} requests/s')
+    logging.getLogger().removeHandler(handler)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+from hashlib import sha256
+from time import perf_counter
+import blobchain.mining as mining
+import sys
+
+"""Hashrate of the original Blob.work loop against the mining engines
+Run from the repository root: python -m benchmarks.mining [max difficulty] [blocks per difficulty]"""
+
+
+def legacy_work(index, previous_hash, difficulty):
+    # The loop Blob.work used before blobchain.mining existed
+    nonce = 0
+    while sha256(f"{index - 1}{nonce}{previous_hash}".encode()).hexdigest()[:difficulty] != "0" * difficulty:
+        nonce += 1
+    return nonce
+
+
+def run(name, solve, difficulty, blocks):
+    hashes = 0
+    start = perf_counter()
+    for index in range(1, blocks + 1):
+        previous_hash = sha256(f"{name}{index}".encode()).hexdigest()
+        hashes += solve(index, previous_hash, difficulty) + 1
+    elapsed = perf_counter() - start
+    print(f'{name:>8} difficulty {difficulty}: {hashes / elapsed:12,.0f} H/s, {elapsed / blocks * 1000:9.2f} ms/block')
+
+
+def main():
+    max_difficulty = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    blocks = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    serial = mining.SerialMiner()
+    pool = mining.PoolMiner()
+    engines = {'legacy': legacy_work,
+               'serial': lambda i, h, d: serial.mine(h, mining.difficulty_target(d)),
+               'pool': lambda i, h, d: pool.mine(h, mining.difficulty_target(d))}
+    try:
+        for difficulty in range(2, max_difficulty + 1):
+            for name, solve in engines.items():
+                run(name, solve, difficulty, blocks)
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
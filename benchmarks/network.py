@@ -0,0 +1,45 @@
+from blobchain.simulator import Network, run
+import blobchain.mining as mining
+import asyncio
+import logging
+import sys
+
+"""Transactions per second, block propagation, orphan rate and convergence time of a simulated local network
+The standard benchmark for changes to the peer and blockchain code, see blobchain.simulator
+Run from the repository root:
+python -m benchmarks.network [nodes] [topology] [latency ms] [loss %] [transactions/s] [seconds]"""
+
+
+def milliseconds(seconds):
+    return f'{seconds * 1000:9.1f} ms' if seconds is not None else '        - ms'
+
+
+def main():
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    kind = sys.argv[2] if len(sys.argv) > 2 else 'random'
+    latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.01
+    loss = float(sys.argv[4]) / 100 if len(sys.argv) > 4 else 0.0
+    rate = float(sys.argv[5]) if len(sys.argv) > 5 else 50
+    duration = float(sys.argv[6]) if len(sys.argv) > 6 else 4
+    # Cheap Proof of Work at a fixed difficulty, so that the network rather than hashing is measured
+    mining.DIFFICULTY = 2
+    mining.RETARGET_INTERVAL = 0
+
+    # Failed syncs are expected while chains compete, and are reflected in the orphan rate and convergence time
+    logging.getLogger('blobchain').setLevel(logging.ERROR)
+    network = Network(nodes, kind, latency=latency, loss=loss)
+    report = asyncio.run(run(network, rate, duration))
+    print(f'{nodes} nodes, {kind} topology, {latency * 1000:.0f} ms latency, {loss:.0%} loss, '
+          f'{rate:g} transactions/s for {duration:g} s')
+    print(f'{"throughput":>12}: {report["transactions_per_second"]:9.1f} transactions/s, '
+          f'{report["included"]} of {report["transactions"]} transactions included')
+    print(f'{"propagation":>12}: median {milliseconds(report["propagation_median"])}, '
+          f'p90 {milliseconds(report["propagation_p90"])}')
+    print(f'{"orphans":>12}: {report["orphan_rate"]:9.1%} of {report["mined"]} mined blocks, '
+          f'{report["blocks"]} blocks in the final chain')
+    print(f'{"convergence":>12}: {milliseconds(report["convergence"])} after the workload')
+    print(f'{"traffic":>12}: {report["messages"]:,} messages, {report["bytes"]:,} bytes, {report["lost"]} lost')
+
+
+if __name__ == "__main__":
+    main()
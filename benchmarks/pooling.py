@@ -0,0 +1,46 @@
+from time import perf_counter
+import blobchain.peer as peer
+import asyncio
+import sys
+
+"""Messages per second between local nodes, with a connection pool and with one connection per message
+Run from the repository root: python -m benchmarks.pooling [nodes] [messages per pair]"""
+
+host = '127.0.0.1'
+
+
+async def measure(nodes, messages, pooled, base_port):
+    # Without admission control, which would shed the flood of BEAT rather than carry it
+    network = [peer.BlobNode(base_port + n, host, pooled=pooled, admission=False) for n in range(nodes)]
+    servers = [await asyncio.start_server(node.handle_echo, host, node.port) for node in network]
+
+    async def chatter(sender, receiver):
+        for _ in range(messages):
+            await sender.send_echo(host, receiver.port, 'BEAT', None)
+
+    start = perf_counter()
+    await asyncio.gather(*(chatter(sender, receiver) for sender in network for receiver in network
+                           if sender is not receiver))
+    elapsed = perf_counter() - start
+
+    for node in network:
+        if node.pool:
+            node.pool.close()
+    # Lets every server-side handler see its connection close before the loop shuts down
+    await asyncio.sleep(0.1)
+    for server in servers:
+        server.close()
+        await server.wait_closed()
+    return nodes * (nodes - 1) * messages / elapsed
+
+
+def main():
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    for pooled, base_port in ((False, 9500), (True, 9600)):
+        rate = asyncio.run(measure(nodes, messages, pooled, base_port))
+        print(f'{"pooled" if pooled else "unpooled":>9}: {rate:10,.0f} messages/s')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+from time import perf_counter
+from blobchain.peertable import PeerTable
+import blobchain.peer as peer
+import asyncio
+import sys
+
+"""End-to-end propagation latency of a BLOC broadcast to 100 local nodes, a few of which are slow or dead
+Compares the concurrent broadcast against sending to one peer after another
+Run from the repository root: python -m benchmarks.propagation [nodes] [slow peers] [dead peers]"""
+
+host = '127.0.0.1'
+base_port = 9700
+transaction = {'recipient': 'bob', 'sender': 'alice', 'amount': 1}
+
+
+class TimedNode(peer.BlobNode):
+    # Records when the announcement arrives instead of mining it
+    def submit(self, anunctype, transactions):
+        self.arrival = perf_counter()
+
+
+class SerialNode(peer.BlobNode):
+    # Broadcasts one peer after another, as BlobNode.broadcast used to
+    async def broadcast(self, msgtype, message):
+        for peerhost, peerport in list(self.peers):
+            await self.reach(peerhost, peerport, msgtype, message)
+
+
+async def stall(reader, writer):
+    # A slow peer accepts connections but never replies, until the other side hangs up
+    await reader.read()
+    writer.close()
+
+
+async def measure(origin_type, nodes, slow, dead):
+    origin = origin_type(base_port, host, peer_timeout=1)
+    network = [TimedNode(base_port + n, host) for n in range(1, nodes)]
+    servers = [await asyncio.start_server(node.handle_echo, host, node.port) for node in network]
+    slow_ports = [base_port + nodes + n for n in range(slow)]
+    servers += [await asyncio.start_server(stall, host, port) for port in slow_ports]
+    dead_ports = [base_port + nodes + slow + n for n in range(dead)]
+
+    peers = [(host, port) for port in slow_ports + dead_ports + [node.port for node in network]]
+    origin.peers = PeerTable(len(peers))
+    origin.peers.extend(peers)
+    start = perf_counter()
+    await origin.broadcast('BLOC', [transaction])
+    finished = perf_counter() - start
+    arrivals = sorted(node.arrival - start for node in network if hasattr(node, 'arrival'))
+
+    origin.pool.close()
+    for server in servers:
+        server.close()
+    await asyncio.sleep(0.1)
+    return arrivals, finished
+
+
+def main():
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    slow = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    dead = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    for name, origin_type in (('serial', SerialNode), ('parallel', peer.BlobNode)):
+        arrivals, finished = asyncio.run(measure(origin_type, nodes, slow, dead))
+        print(f'{name:>8}: {len(arrivals)} of {nodes - 1} healthy nodes reached, '
+              f'median {arrivals[len(arrivals) // 2] * 1000:8.1f} ms, last {arrivals[-1] * 1000:8.1f} ms, '
+              f'broadcast returned after {finished * 1000:8.1f} ms')
+
+
+if __name__ == "__main__":
+    main()
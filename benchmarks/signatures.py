@@ -0,0 +1,44 @@
+from time import perf_counter
+import blobchain.key_generator as key_generator
+import sys
+
+"""DSA verifications per second for each supported (L, N), with two modular exponentiations against the FixedBase tables
+Key generation is not timed
+Run from the repository root: python -m benchmarks.signatures [signatures] [L,N ...]"""
+
+SIZES = [(1024, 160), (2048, 224), (2048, 256), (3072, 256)]
+
+
+def verify_pow(pair, M, r, s):
+    # Verification with the builtin modular exponentiation, one pow per base
+    w = pow(s, -1, pair.q)
+    z = key_generator.message_integer(M, pair.N)
+    v = pow(pair.g, z * w % pair.q, pair.p) * pow(pair.y, r * w % pair.q, pair.p) % pair.p % pair.q
+    return v == r
+
+
+def rate(name, verify, signed):
+    start = perf_counter()
+    valid = sum(verify(M, r, s) for M, (r, s) in signed)
+    elapsed = perf_counter() - start
+    print(f'{name:>24}: {len(signed) / elapsed:10,.0f} verifications/s, {valid}/{len(signed)} valid')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    sizes = [tuple(int(n) for n in size.split(',')) for size in sys.argv[2:]] or SIZES
+    for L, N in sizes:
+        pair = key_generator.PairKey(L, N, N + 64)
+        signed = [(f'transaction {n}', pair.gen_signature(f'transaction {n}')) for n in range(count)]
+        print(f'(L, N) = ({L}, {N})')
+
+        rate('pow', lambda M, r, s: verify_pow(pair, M, r, s), signed)
+        M, (r, s) = signed[0]
+        start = perf_counter()
+        pair.verify_signature(M, r, s)
+        print(f'{"FixedBase tables":>24}: {(perf_counter() - start) * 1000:10.1f} ms to build')
+        rate('FixedBase', pair.verify_signature, signed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+from contextlib import redirect_stdout
+from io import StringIO
+from time import perf_counter, sleep
+from blobchain.signer import Signer
+import blobchain.key_generator as key_generator
+import sys
+
+"""Signatures per second computing each nonce on the spot, against taking it from a precomputed pool
+Run from the repository root: python -m benchmarks.signing [signatures] [L,N]"""
+
+
+def rate(name, sign, count, pair):
+    messages = [f'transaction {n}' for n in range(count)]
+    start = perf_counter()
+    signatures = [sign(M) for M in messages]
+    elapsed = perf_counter() - start
+    valid = sum(pair.verify_signature(M, r, s) for M, (r, s) in zip(messages[:100], signatures))
+    print(f'{name:>28}: {count / elapsed:10,.0f} signatures/s, {valid}/{min(count, 100)} checked valid')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    L, N = (int(n) for n in sys.argv[2].split(',')) if len(sys.argv) > 2 else (1024, 160)
+    with redirect_stdout(StringIO()):
+        pair = key_generator.PairKey(L, N, N + 64)
+    print(f'{count:,} signatures with (L, N) = ({L}, {N})')
+
+    rate('no pool', pair.gen_signature, count, pair)
+
+    for name, workers in (('pool, background thread', 0), ('pool, background processes', 2)):
+        signer = Signer(pair, size=count, workers=workers)
+        # Bursts of signatures are served from a pool which was filled while the node was idle
+        while signer.ready() < count:
+            sleep(0.05)
+        rate(f'{name}, full', signer.sign, count, pair)
+        # Sustained signing outruns the refill, and falls back on computing nonces on the spot
+        signer.misses = 0
+        rate(f'{name}, sustained', signer.sign, 5 * count, pair)
+        print(f'{"":>28}  {signer.misses:,} of {5 * count:,} signatures found the pool empty')
+        signer.close()
+
+
+if __name__ == "__main__":
+    main()
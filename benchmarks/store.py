@@ -0,0 +1,60 @@
+from hashlib import sha256
+from time import perf_counter, time
+from blobchain.store import BlockStore
+import blobchain.blockchain as blockchain
+import blobchain.mining as mining
+import resource
+import subprocess
+import sys
+import tempfile
+
+"""Startup time and peak memory of a node holding a long chain, with the on-disk store against an in-memory list
+Run from the repository root: python -m benchmarks.store [blocks]"""
+
+
+def build(directory, blocks):
+    # Writes blocks shaped like real ones, without paying for the Proof of Work
+    store = BlockStore(directory, sync_every=10000)
+    previous_hash = "1"
+    for index in range(blocks):
+        own_hash = sha256(f"{index}".encode()).hexdigest()
+        store.append({"index": index, "timestamp": time(), "previous_hash": previous_hash,
+                      "merkle_root": sha256(own_hash.encode()).hexdigest(), "target": mining.initial_target(),
+                      "nonce": index, "own_hash": own_hash,
+                      "transactions": [{"recipient": "bob", "sender": "alice", "amount": index}]},
+                     own_hash)
+        previous_hash = own_hash
+    store.close()
+
+
+def start(mode, directory):
+    # Runs in a fresh process, so that peak memory belongs to one approach only
+    begin = perf_counter()
+    if mode == 'list':
+        store = BlockStore(directory)
+        chain = [blockchain.Blob.from_header(record, record["transactions"])
+                 for record in (store.read(height) for height in range(len(store)))]
+    else:
+        chain = blockchain.Blobchain(store=BlockStore(directory)).chain
+    tip = chain[-1].own_hash
+    elapsed = perf_counter() - begin
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'{mode:>6}: {len(chain):,} blocks, startup {elapsed * 1000:9.1f} ms, peak RSS {peak:8.1f} MB, tip {tip[:12]}')
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] in ('list', 'store'):
+        start(sys.argv[1], sys.argv[2])
+        return
+
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as directory:
+        begin = perf_counter()
+        build(directory, blocks)
+        print(f'wrote {blocks:,} blocks in {perf_counter() - begin:.1f} s')
+        for mode in ('list', 'store'):
+            subprocess.run([sys.executable, '-m', 'benchmarks.store', mode, directory], check=True)
+
+
+if __name__ == "__main__":
+    main()
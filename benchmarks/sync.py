@@ -0,0 +1,58 @@
+from time import perf_counter
+import blobchain.mining as mining
+import blobchain.peer as peer
+import asyncio
+import sys
+
+"""Time and bytes to catch up with a peer, with headers-first sync against downloading the whole chain through BLOB
+Run from the repository root: python -m benchmarks.sync [shared blocks] [blocks behind...]"""
+
+host = '127.0.0.1'
+
+
+def grow(node, blocks):
+    for n in range(blocks):
+        node.blo.new_block([{'recipient': 'bob', 'sender': 'alice', 'amount': n}])
+
+
+async def measure(source, shared, behind, full, port):
+    server = await asyncio.start_server(source.handle_echo, host, port)
+    node = peer.BlobNode(port + 1, host)
+    node.blo.replace_from(0, source.blo.chain[:shared + 1])
+
+    start = perf_counter()
+    if full:
+        await node.routine(host, port, 'BLOB', None)
+    else:
+        await node.sync(host, port)
+    elapsed = perf_counter() - start
+    assert node.blo.chain[-1].own_hash == source.blo.chain[shared + behind].own_hash
+
+    transferred = node.pool.traffic["sent"] + node.pool.traffic["received"]
+    node.pool.close()
+    await asyncio.sleep(0.1)
+    server.close()
+    return elapsed, transferred
+
+
+def main():
+    shared = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    behinds = [int(arg) for arg in sys.argv[2:]] or [10, 10000]
+    mining.DIFFICULTY = 1
+    # Fixed difficulty, so that the Proof of Work does not drift as blocks are found faster than BLOCK_INTERVAL
+    mining.RETARGET_INTERVAL = 0
+
+    source = peer.BlobNode(9900, host)
+    grow(source, shared + max(behinds))
+    for behind in behinds:
+        for name, full, port in (('BLOB', True, 9901), ('sync', False, 9903)):
+            # The source is cut back to exactly shared + behind blocks
+            chain = source.blo.chain[:]
+            source.blo.replace_from(shared + behind + 1, [])
+            elapsed, transferred = asyncio.run(measure(source, shared, behind, full, port))
+            source.blo.replace_from(0, chain)
+            print(f'{behind:6} blocks behind, {name}: {elapsed * 1000:9.1f} ms, {transferred:12,} bytes')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+from time import perf_counter
+from blobchain.mempool import Mempool
+import blobchain.blockchain as blockchain
+import blobchain.mining as mining
+import sys
+
+"""Transactions per second mined into the chain for different mempool batch sizes
+Run from the repository root: python -m benchmarks.throughput [transactions] [difficulty]"""
+
+
+def main():
+    transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    mining.DIFFICULTY = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    # Fixed difficulty, so that the Proof of Work does not drift as blocks are found faster than BLOCK_INTERVAL
+    mining.RETARGET_INTERVAL = 0
+
+    for batch in (1, 10, 100):
+        blo = blockchain.Blobchain(mempool=Mempool(max_batch=batch))
+        for n in range(transactions):
+            blo.mempool.add({'recipient': 'bob', 'sender': 'alice', 'amount': n, 'fee': n % 7})
+
+        start = perf_counter()
+        while len(blo.mempool):
+            blo.mine_pending()
+        elapsed = perf_counter() - start
+        print(f'batch {batch:4}: {len(blo.chain) - 1:5} blocks, {transactions / elapsed:10,.1f} transactions/s')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+from contextlib import redirect_stdout
+from io import StringIO
+from time import perf_counter
+from blobchain.validation import ChainValidator
+import blobchain.blockchain as blockchain
+import blobchain.mining as mining
+import sys
+
+"""Validation time of a long chain, in-process, across a process pool, and incrementally after a few new blocks
+Run from the repository root: python -m benchmarks.validation [blocks]"""
+
+
+def timed(name, validate):
+    start = perf_counter()
+    invalid = validate()
+    print(f'{name:>12}: {(perf_counter() - start) * 1000:10.1f} ms, first invalid block {invalid}')
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    mining.DIFFICULTY = 1
+    # Fixed difficulty, so that the Proof of Work does not drift as blocks are found faster than BLOCK_INTERVAL
+    mining.RETARGET_INTERVAL = 0
+    blo = blockchain.Blobchain()
+    with redirect_stdout(StringIO()):
+        for n in range(blocks):
+            blo.new_block([{'recipient': 'bob', 'sender': 'alice', 'amount': n}])
+    print(f'{len(blo.chain):,} blocks')
+
+    serial = ChainValidator(workers=0)
+    parallel = ChainValidator()
+    try:
+        timed('serial', lambda: serial.validate(blo))
+        timed('parallel', lambda: parallel.validate(blo))
+        for n in range(10):
+            blo.new_block([{'recipient': 'carol', 'sender': 'bob', 'amount': n}])
+        timed('incremental', lambda: parallel.validate(blo))
+
+        tampered = blo.chain[len(blo.chain) // 2]
+        tampered.transactions = [{'recipient': 'mallory', 'sender': 'bob', 'amount': 10 ** 6}]
+        # Without a checkpoint, so that the whole chain is checked up to the tampered block
+        parallel.checkpoint = None
+        timed('tampered', lambda: parallel.validate(blo))
+    finally:
+        parallel.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+from time import perf_counter
+from blobchain.verifier import BatchVerifier, sign_transaction, signing_message
+import blobchain.key_generator as key_generator
+import asyncio
+import sys
+
+"""Throughput of signature verification for signed transactions, one at a time on the event loop against batches
+Run from the repository root: python -m benchmarks.verifier [transactions] [keys]"""
+
+
+def signed_transactions(count, keys):
+    pairs = [key_generator.PairKey(1024, 160, 224) for _ in range(keys)]
+    transactions = [sign_transaction(pairs[n % keys], {'recipient': 'bob', 'amount': n}) for n in range(count)]
+    # Every tenth transaction is tampered with after signing, and has to be rejected
+    for transaction in transactions[::10]:
+        transaction['amount'] += 1
+    return transactions
+
+
+def one_by_one(transaction):
+    # What Handler.transaction would do without a verifier, with no tables and no cache
+    (p, q, g, y), (r, s) = transaction['key'], transaction['signature']
+    w = pow(s, -1, q)
+    z = key_generator.message_integer(signing_message(transaction), q.bit_length())
+    return pow(g, z * w % q, p) * pow(y, r * w % q, p) % p % q == r
+
+
+async def batched(verifier, transactions):
+    return await asyncio.gather(*(verifier.verify(transaction) for transaction in transactions))
+
+
+def report(name, start, results):
+    elapsed = perf_counter() - start
+    print(f'{name:>27}: {len(results) / elapsed:10,.0f} transactions/s, {sum(results):,} valid of {len(results):,}')
+
+
+async def run(transactions):
+    start = perf_counter()
+    report('one by one', start, [one_by_one(transaction) for transaction in transactions])
+
+    for name, workers in (('batch, in-process', 0), ('batch, process pool', None)):
+        verifier = BatchVerifier(workers=workers)
+        start = perf_counter()
+        report(name, start, await batched(verifier, transactions))
+        start = perf_counter()
+        report(f'{name}, cached', start, await batched(verifier, transactions))
+        verifier.shutdown()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    keys = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    transactions = signed_transactions(count, keys)
+    print(f'{count:,} transactions signed by {keys} keys of (L, N) = (1024, 160)')
+    asyncio.run(run(transactions))
+
+
+if __name__ == "__main__":
+    main()
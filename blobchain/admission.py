@@ -0,0 +1,137 @@
+from time import monotonic
+from blobchain.cache import LRUCache
+
+"""Admission control of the requests a node receives, so that a burst from one peer cannot starve the others
+- Every connection has at most peer_queue requests in flight, beyond which it is no longer read from and TCP pushes
+  back on the sender, and the node as a whole has at most global_queue, beyond which requests are shed
+- Every remote host has a token bucket per message type, refilled at the rate in RATES, and a request finding its
+  bucket empty is shed, the buckets outliving connections so that reconnecting does not refill them
+- Requests are checked against the shape of their message type before any handler runs, and packets larger than
+  max_request are refused before they are read
+A shed request gets a BUSY reply with the number of seconds to back off, which the sender raises as PeerBusy, and
+keeps its slot for that long, so that a peer which keeps sending anyway is pushed back by TCP"""
+
+PEER_QUEUE = 32
+GLOBAL_QUEUE = 256
+# Largest request accepted, far above any honest request since only replies carry whole chains
+MAX_REQUEST = 4 * 2 ** 20
+# Most items in the list of a TXNS, BLOC or BODY request
+MAX_ITEMS = 10000
+# Fields every transaction of a CASH, TXNS or BLOC request must have
+TRANSACTION_FIELDS = {"sender", "recipient", "amount"}
+# Message type -> (requests per second, burst) allowed from a single host
+# Reads of the whole chain are the most expensive requests and are limited the most
+RATES = {'PING': (5, 10), 'LIST': (5, 10), 'BEAT': (10, 20),
+         'BLOB': (1, 2), 'TIPS': (50, 100), 'HEAD': (20, 40), 'BODY': (20, 40),
+         'CASH': (500, 1000), 'TXNS': (1000, 2000), 'BLOC': (200, 400),
+         'PROF': (200, 400), 'BALN': (500, 1000),
+         'BLCK': (1000, 2000), 'BLKS': (200, 400), 'TXID': (1000, 2000), 'STAT': (1000, 2000)}
+# Rate of message types missing from the rates of an Admission
+DEFAULT_RATE = (100, 200)
+# Most remote hosts whose token buckets are remembered, the least recently heard from are forgotten first
+MAX_HOSTS = 10000
+# Seconds a peer is told to back off when the node as a whole is busy
+BUSY_RETRY = 0.05
+# Longest a refused request holds the slot of its connection
+MAX_BACKOFF = 1.0
+
+
+def pair(message):
+    return isinstance(message, (list, tuple)) and len(message) == 2
+
+
+def items(message):
+    return isinstance(message, list) and len(message) <= MAX_ITEMS
+
+
+def strings(message):
+    return items(message) and all(isinstance(item, str) for item in message)
+
+
+def transaction(message):
+    return isinstance(message, dict) and TRANSACTION_FIELDS.issubset(message)
+
+
+# Message type -> whether a message is well-formed, checked in O(1) apart from the items of a HEAD, BODY or BLOC
+SHAPES = {'PING': lambda message: pair(message) and isinstance(message[0], str) and type(message[1]) is int,
+          'LIST': lambda message: True,
+          'BLOB': lambda message: True,
+          'BEAT': lambda message: True,
+          'TIPS': lambda message: True,
+          'STAT': lambda message: True,
+          'HEAD': lambda message: pair(message) and strings(message[0]) and type(message[1]) is int,
+          'BODY': strings,
+          'CASH': transaction,
+          'TXNS': items,
+          'BLOC': lambda message: items(message) and all(transaction(t) for t in message),
+          'PROF': lambda message: isinstance(message, str),
+          'BALN': lambda message: isinstance(message, str),
+          'TXID': lambda message: isinstance(message, str),
+          'BLCK': lambda message: type(message) in (int, str),
+          'BLKS': lambda message: pair(message) and all(type(n) is int for n in message)}
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst):
+        """:param rate: <float> Tokens added per second
+        :param burst: <float> Most tokens held, i.e. the longest burst allowed after a quiet period"""
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = monotonic()
+
+    def take(self):
+        """:return: <bool> Whether a token was available"""
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def wait_time(self):
+        # Seconds until the next token
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class Admission:
+    def __init__(self, rates=None, peer_queue=PEER_QUEUE, global_queue=GLOBAL_QUEUE, max_request=MAX_REQUEST,
+                 max_hosts=MAX_HOSTS):
+        """:param rates: <dict> Message type -> (requests per second, burst) for a host, defaults to RATES
+        :param peer_queue: <int> Most requests of a connection in flight
+        :param global_queue: <int> Most requests in flight over every connection
+        :param max_request: <int> Largest request in bytes
+        :param max_hosts: <int> Most remote hosts whose token buckets are remembered"""
+        self.rates = RATES if rates is None else rates
+        self.peer_queue = peer_queue
+        self.global_queue = global_queue
+        self.max_request = max_request
+        # Requests admitted and not yet replied to
+        self.inflight = 0
+        # Remote host -> (message type -> TokenBucket)
+        self.buckets = LRUCache(max_hosts)
+
+    def busy(self):
+        return self.inflight >= self.global_queue
+
+    def check(self, host, msgtype, message):
+        """Decides whether to take on a decoded request, before any handler runs
+        :param host: <str> Address of the remote host the request came from
+        :return: <tuple> (reason, seconds to back off) if the request is refused, 'malformed' or 'limited',
+        or None if it is admitted"""
+        shape = SHAPES.get(msgtype) if isinstance(msgtype, str) else None
+        if shape is None or not shape(message):
+            return 'malformed', None
+        buckets = self.buckets.get(host)
+        if buckets is None:
+            buckets = {}
+            self.buckets.put(host, buckets)
+        bucket = buckets.get(msgtype)
+        if bucket is None:
+            bucket = buckets[msgtype] = TokenBucket(*self.rates.get(msgtype, DEFAULT_RATE))
+        if not bucket.take():
+            return 'limited', bucket.wait_time()
+        return None
@@ -1,74 +1,384 @@
+from concurrent.futures import ThreadPoolExecutor
 from hashlib import sha256
 from time import time
+from blobchain.columnar import ColumnarChain
+from blobchain.ledger import Ledger, TransactionIndex
+from blobchain.mempool import Mempool, transaction_hash
+from blobchain.merkle import MerkleTree, unique_root, verify_proof
+from blobchain.store import StoredChain, StoredHeights
+import blobchain.mining as mining
+import asyncio
 
 
 class Blobchain:
-    def __init__(self):
-        self.chain = []
-        self.genesis_block()
+    def __init__(self, miner=None, mempool=None, store=None, columnar=False, ledger=None):
+        """:param miner: <class> Proof of Work engine, see blobchain.mining
+        :param mempool: <class> Pool of transactions waiting to be mined, see blobchain.mempool
+        :param store: <class> BlockStore keeping the chain on disk, see blobchain.store, or None to keep it in memory
+        :param columnar: <bool> Keeps an in-memory chain in compact columns, see blobchain.columnar
+        :param ledger: <class> Index of balances by address, see blobchain.ledger"""
+        if store is None:
+            self.chain = ColumnarChain() if columnar else []
+            # Block hash -> position of the Block in the chain
+            self.heights = {}
+        else:
+            self.chain = StoredChain(store)
+            self.heights = StoredHeights(store)
+        # Each chain has a miner of its own, so that cancelling the Block of one chain leaves others mining
+        self.miner = mining.SerialMiner() if miner is None else miner
+        self.mempool = Mempool() if mempool is None else mempool
+        self.ledger = Ledger() if ledger is None else ledger
+        # Total work of the chain, worked out the first time it is needed and then kept up to date
+        self.work = None
+        # A single worker thread mines blocks one after another, so each builds on the previous tip
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # Block hash -> MerkleTree, built the first time a proof is requested from that Block
+        self.trees = {}
+        # Transaction hash -> location in the chain, caught up with the chain whenever a transaction is looked up
+        self.index = TransactionIndex()
+        if not self.chain:
+            self.genesis_block()
+        else:
+            self.ledger.catch_up(self.chain)
 
     def genesis_block(self):
         # Initialises the blockchain with the genesis block
-        self.chain.append(Blob(0, "1", None, None, None))
+        self.append(Blob(0, "1", [], miner=self.miner, target=mining.initial_target()))
         pass
 
-    def new_block(self, recipient, sender, amount):
+    def new_block(self, transactions):
         """Creates a new Block
-        :param recipient: <str> Address of the Recipient
-        :param sender: <str> Address of the Sender
-        :param amount: <int> Amount of money transferred"""
+        :param transactions: <list> Transactions of the form {"recipient": <str>, "sender": <str>, "amount": <int>}"""
         index = len(self.chain) + 1
         previous_hash = self.chain[-1].own_hash
-        fresh_block = Blob(index, previous_hash, recipient, sender, amount)
+        fresh_block = Blob(index, previous_hash, transactions, miner=self.miner.job(), target=self.next_target())
         self.add_block(fresh_block)
         return fresh_block
 
+    async def new_block_async(self, transactions):
+        """Creates a new Block without blocking the event loop, since the Proof of Work is offloaded to the executor
+        The Block is added back on the event loop, so that the chain is only ever changed from one thread, and is
+        rejected by add_block if the tip moved while it was mined
+        :return: <class> Block, whose nonce is None if mining was cancelled"""
+        loop = asyncio.get_running_loop()
+        index = len(self.chain) + 1
+        previous_hash = self.chain[-1].own_hash
+        fresh_block = await loop.run_in_executor(self.executor, Blob, index, previous_hash, transactions, 0,
+                                                 self.miner.job(), self.next_target())
+        self.add_block(fresh_block)
+        return fresh_block
+
+    def mine_pending(self):
+        """Mines the next batch of transactions from the mempool into a new Block
+        Transactions of a cancelled Block are returned to the mempool
+        :return: <class> Block, or None if the mempool is empty or mining was cancelled"""
+        batch = self.mempool.take()
+        if not batch:
+            return None
+        fresh_block = self.new_block(batch)
+        return self.settle(fresh_block)
+
+    async def mine_pending_async(self):
+        """Counterpart of mine_pending which mines in the executor
+        The batch is taken on the event loop, so the mempool is only ever touched from one thread"""
+        batch = self.mempool.take()
+        if not batch:
+            return None
+        fresh_block = await self.new_block_async(batch)
+        return self.settle(fresh_block)
+
+    def settle(self, block):
+        # Returns the transactions of a cancelled or outdated Block to the mempool
+        if block.own_hash not in self.heights:
+            for transaction in block.transactions:
+                self.mempool.add(transaction)
+            return None
+        return block
+
     def add_block(self, block):
-        """Adds a new Block to the Blockchain given the Proof of Work"""
+        """Adds a new Block to the Blockchain given the Proof of Work
+        A Block mined on a tip which has since been replaced, e.g. by a sync, is rejected"""
+        if block.previous_hash != self.chain[-1].own_hash or block.target != self.next_target():
+            return
         if self.proof_of_work(block):
-            self.chain.append(block)
+            self.append(block)
+
+    def append(self, block):
+        self.heights[block.own_hash] = len(self.chain)
+        self.chain.append(block)
+        self.ledger.apply(block)
+        if self.work is not None:
+            self.work += mining.block_work(block.target)
+
+    def replace_from(self, position, blocks):
+        """Swaps every Block from position onwards for the given Blocks
+        Transactions of the new Blocks leave the mempool, and those only the replaced Blocks held go back into it
+        :param position: <int> Height of the first Block to replace"""
+        removed = self.chain[position:]
+        self.index.truncate(self.chain, position)
+        # The ledger is rolled back from the tip, in the reverse order the Blocks were applied
+        for block in reversed(removed):
+            self.ledger.revert(block)
+        for block in removed:
+            del self.heights[block.own_hash]
+            if self.work is not None:
+                self.work -= mining.block_work(block.target)
+        del self.chain[position:]
+        for block in blocks:
+            self.append(block)
+
+        if len(self.mempool):
+            self.mempool.remove(transaction for block in blocks for transaction in block.transactions)
+        dropped = [transaction for block in removed for transaction in block.transactions]
+        if dropped:
+            adopted = {transaction_hash(transaction) for block in blocks for transaction in block.transactions}
+            for transaction in dropped:
+                if transaction_hash(transaction) not in adopted:
+                    self.mempool.add(transaction)
+
+    def next_target(self):
+        """:return: <int> Target the next Block has to meet, see blobchain.mining.next_target"""
+        return mining.next_target(len(self.chain), self.timing)
+
+    def timing(self, height):
+        # Timestamp and target of the Block at height, which the retargeting rule looks back on
+        block = self.chain[height]
+        return block.timestamp, block.target
+
+    def chain_work(self):
+        """Total work of the chain, which decides between competing chains instead of their length
+        :return: <int> Expected number of hashes which went into every Block of the chain"""
+        if self.work is None:
+            if hasattr(self.chain, "work_before"):
+                # A StoredChain keeps the total work by height, see blobchain.store
+                self.work = self.chain.work_before(len(self.chain))
+            else:
+                self.work = sum(mining.block_work(block.target) for block in self.chain)
+        return self.work
+
+    def work_from(self, position):
+        """:return: <int> Work of the Blocks from position onwards, i.e. what a reorganisation at position gives up"""
+        if hasattr(self.chain, "work_before"):
+            return self.chain_work() - self.chain.work_before(position)
+        return sum(mining.block_work(block.target) for block in self.chain[position:])
+
+    def locator(self):
+        """Lists Block hashes from the tip backwards, the last ten densely and then at exponentially growing gaps
+        A peer finds the fork point as the first hash it knows, in O(log n) hashes sent
+        :return: <list> Block hashes, always ending with the genesis Block"""
+        hashes = []
+        position, step = len(self.chain) - 1, 1
+        while position > 0:
+            hashes.append(self.chain[position].own_hash)
+            if len(hashes) >= 10:
+                step *= 2
+            position -= step
+        hashes.append(self.chain[0].own_hash)
+        return hashes
+
+    def headers_after(self, locator, limit):
+        """Finds the fork point from a peer's locator and lists the headers which follow it
+        :return: <tuple> (height of the first header, list of headers)"""
+        start = 0
+        for own_hash in locator:
+            if own_hash in self.heights:
+                start = self.heights[own_hash] + 1
+                break
+        return start, [block.header() for block in self.chain[start:start + limit]]
+
+    def bodies(self, hashes):
+        """:return: <list> Transactions of each requested Block, or None for Blocks not in the chain"""
+        return [self.chain[self.heights[own_hash]].transactions if own_hash in self.heights else None
+                for own_hash in hashes]
+
+    def balance(self, address):
+        return self.ledger.balance(address)
+
+    def history(self, address, limit=None):
+        """:param limit: <int> Most transactions returned, or None for all of them
+        :return: <list> Transactions sent or received by an address, most recent first, with the height of their Block"""
+        return [{"height": height, "transaction": self.chain[height].transactions[position]}
+                for height, position in self.ledger.entries(address, limit)]
+
+    def valid_header(self, header, previous, target):
+        """Checks a header received from a peer, without its transactions
+        :param previous: <dict> Header of the preceding Block, or None for a genesis Block
+        :param target: <int> Target the header has to carry, see blobchain.mining.next_target
+        :return: <bool>"""
+        own_hash = header_hash(header["index"], header["timestamp"], header["previous_hash"], header["merkle_root"],
+                               header["target"])
+        if own_hash != header["own_hash"] or header["target"] != target:
+            return False
+        if previous is not None and header["previous_hash"] != previous["own_hash"]:
+            return False
+        return solves(own_hash, header["nonce"], target)
+
+    def valid_body(self, header, transactions):
+        # Checks that the transactions received for a header are the ones its Merkle root commits to, without repeats
+        return unique_root([transaction_hash(t) for t in transactions]) == header["merkle_root"]
+
+    def merkle_tree(self, block):
+        if block.own_hash not in self.trees:
+            self.trees[block.own_hash] = MerkleTree([transaction_hash(t) for t in block.transactions])
+        return self.trees[block.own_hash]
+
+    def inclusion_proof(self, tx_hash):
+        """Finds the Block holding a transaction through the index of transactions
+        :param tx_hash: <str> Hash of the transaction, see blobchain.mempool.transaction_hash
+        :return: <dict> Header of the Block and the Merkle proof of the transaction, or None if not found"""
+        location = self.locate(tx_hash)
+        if location is None:
+            return None
+        height, position = location
+        block = self.chain[height]
+        return {"header": block.header(), "proof": self.merkle_tree(block).proof(position)}
+
+    def locate(self, tx_hash):
+        """:return: <tuple> (height, position) of a transaction in the chain, or None if not found"""
+        self.index.catch_up(self.chain)
+        location = self.index.locate(tx_hash)
+        if location is None:
+            return None
+        height, position = location
+        transactions = self.chain[height].transactions
+        if position >= len(transactions) or transaction_hash(transactions[position]) != tx_hash:
+            return None
+        return location
+
+    def block(self, key):
+        """:param key: <int> Height of the Block, or <str> its hash
+        :return: <dict> Block in the form of Blob.to_dict with its height, or None if not in the chain"""
+        height = key if isinstance(key, int) and not isinstance(key, bool) else self.heights.get(key)
+        if height is None or not 0 <= height < len(self.chain):
+            return None
+        return dict(self.chain[height].to_dict(), height=height)
+
+    def blocks(self, start, limit):
+        """:param start: <int> Height of the first Block, counted back from the tip if negative as for a list
+        :return: <list> Up to limit consecutive Blocks in the form of Blobchain.block, oldest first"""
+        start = max(start + len(self.chain), 0) if start < 0 else start
+        return [self.block(height) for height in range(start, min(start + max(limit, 0), len(self.chain)))]
+
+    def transaction(self, tx_hash):
+        """:return: <dict> Transaction with the height and hash of its Block, or None if not in the chain"""
+        location = self.locate(tx_hash)
+        if location is None:
+            return None
+        height, position = location
+        block = self.chain[height]
+        return {"hash": tx_hash, "transaction": block.transactions[position], "height": height,
+                "position": position, "block": block.own_hash, "confirmations": len(self.chain) - height}
+
+    def stats(self, window=20):
+        """:param window: <int> Number of recent Blocks the mean Block interval is taken over
+        :return: <dict> Height, tip, work and target of the chain, with counts of mined and pending transactions"""
+        recent = self.chain[-window:]
+        interval = (recent[-1].timestamp - recent[0].timestamp) / (len(recent) - 1) if len(recent) > 1 else None
+        return {"height": len(self.chain), "tip": recent[-1].own_hash, "timestamp": recent[-1].timestamp,
+                "work": self.chain_work(), "target": self.next_target(), "block_interval": interval,
+                "transactions": self.ledger.transactions, "pending": len(self.mempool)}
 
     def proof_of_work(self, block):
-        """Verifies whether the Nonce generates a hash with 3 leading zeroes
+        """Verifies whether the Nonce generates a hash which meets the target of the Block
         :param block: <class> Block
         :return: <bool>"""
-        guess_hash = sha256(f"{block.index - 1}{block.nonce}{block.previous_hash}".encode()).hexdigest()
-        return guess_hash[:3] == "000"
+        if block.nonce is None or block.create_hash() != block.own_hash:
+            return False
+        return solves(block.own_hash, block.nonce, block.target)
 
 
 class Blob:
-    def __init__(self, index, previous_hash, recipient, sender, amount, nonce=0):
+    # Slots instead of a per-instance __dict__, since a node holds one Blob per Block
+    __slots__ = ("index", "timestamp", "previous_hash", "transactions", "merkle_root", "target", "nonce", "own_hash")
+
+    def __init__(self, index, previous_hash, transactions, nonce=0, miner=None, target=None):
         """Initialises a Block
         :param index: <int> Index of a Block in the Blockchain
         :param previous_hash: <str> SHA256 hash of the preceding Block in the Blockchain
+        :param transactions: <list> Transactions mined into the Block
         :param nonce: <int> Guess number for Proof of Work
+        :param miner: <class> Proof of Work engine, see blobchain.mining
+        :param target: <int> Proof of Work target, see Blobchain.next_target, defaults to the initial target
         """
         self.index = index
         self.timestamp = time()
         self.previous_hash = previous_hash
-        self.nonce = self.work(nonce)
+        self.transactions = transactions
+        self.merkle_root = MerkleTree([transaction_hash(t) for t in transactions]).root
+        self.target = mining.initial_target() if target is None else target
+        # The header is hashed before mining, since the Proof of Work is done over the header hash
         self.own_hash = self.create_hash()
-        self.transaction = self.transaction(recipient, sender, amount)
+        self.nonce = self.work(nonce, miner or mining.SerialMiner())
+
+    @classmethod
+    def from_header(cls, header, transactions):
+        """Rebuilds a Block received from a peer, without mining it again
+        :param header: <dict> Output of Blob.header
+        :param transactions: <list> Transactions of the Block"""
+        block = cls.__new__(cls)
+        block.index = header["index"]
+        block.timestamp = header["timestamp"]
+        block.previous_hash = header["previous_hash"]
+        block.transactions = transactions
+        block.merkle_root = header["merkle_root"]
+        block.target = header["target"]
+        block.nonce = header["nonce"]
+        block.own_hash = header["own_hash"]
+        return block
 
     def create_hash(self):
-        """Generates a SHA256 hash for the new Block
+        """Generates a SHA256 hash for the new Block, which commits to the transactions through the Merkle root
         :return: <str>"""
-        data = f"{self.index}{self.timestamp}{self.previous_hash}{self.transaction}"
-        new_hash = sha256(data.encode()).hexdigest()
-        return new_hash
+        return header_hash(self.index, self.timestamp, self.previous_hash, self.merkle_root, self.target)
 
-    def work(self, nonce):
+    def header(self):
+        """:return: <dict> Every field of the Block except its transactions"""
+        return {"index": self.index, "timestamp": self.timestamp, "previous_hash": self.previous_hash,
+                "merkle_root": self.merkle_root, "target": self.target, "nonce": self.nonce,
+                "own_hash": self.own_hash}
+
+    def to_dict(self):
+        """:return: <dict> Every field of the Block, as sent to peers and written to disk"""
+        return dict(self.header(), transactions=self.transactions)
+
+    def work(self, nonce, miner):
         """Solves for Nonce
-        :return: <int> nonce"""
-        while sha256(f"{self.index - 1}{nonce}{self.previous_hash}".encode()).hexdigest()[:3] != "000":
-            nonce += 1
-        return nonce
-
-    def transaction(self, recipient, sender, amount):
-        """Adds the new transaction to the Block waiting to be mined"""
-        transaction = {
-            "recipient": recipient,
-            "sender": sender,
-            "amount": amount
-        }
-        return transaction
+        :return: <int> nonce, or None if the miner was cancelled"""
+        return miner.mine(self.own_hash, self.target.to_bytes(32, 'big'), nonce)
+
+
+def work_hash(own_hash, nonce):
+    # Digest which the Proof of Work has to bring under the target, over the header hash so that it commits to every
+    # field of the header, and a nonce cannot be reused for other transactions
+    return sha256(f"{own_hash}{nonce}".encode()).digest()
+
+
+def solves(own_hash, nonce, target):
+    """:param own_hash: <str> Hash of the header, see header_hash
+    :param target: <int> Largest work hash, read as a number, which solves the Block
+    :return: <bool>"""
+    return int.from_bytes(work_hash(own_hash, nonce), 'big') <= target
+
+
+def header_hash(index, timestamp, previous_hash, merkle_root, target):
+    data = f"{index}{timestamp}{previous_hash}{merkle_root}{target}"
+    return sha256(data.encode()).hexdigest()
+
+
+def verify_inclusion(transaction, header, proof, max_target=None):
+    """Lets a light client check a transaction against a Block header, without the rest of the Block
+    :param transaction: <dict> Transaction to check
+    :param header: <dict> Output of Blob.header
+    :param proof: <list> Merkle proof, see blobchain.merkle
+    :param max_target: <int> Easiest target the header may carry, defaults to the initial target
+    :return: <bool>"""
+    own_hash = header_hash(header["index"], header["timestamp"], header["previous_hash"], header["merkle_root"],
+                           header["target"])
+    if own_hash != header["own_hash"]:
+        return False
+    # Without a bound on the target, a forged header could carry one which any nonce solves
+    if header["target"] > (mining.initial_target() if max_target is None else max_target):
+        return False
+    if not solves(own_hash, header["nonce"], header["target"]):
+        return False
+    return verify_proof(transaction_hash(transaction), proof, header["merkle_root"])
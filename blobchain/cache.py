@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from time import monotonic
+
+"""Bounded caches shared by the node"""
+
+
+class SeenCache:
+    def __init__(self, maxsize=100000, ttl=600):
+        """Remembers recently seen message IDs, so that gossip is processed and relayed only once
+        :param maxsize: <int> Maximum number of IDs remembered, the least recently seen are forgotten first
+        :param ttl: <float> Seconds after which an ID is forgotten"""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Message ID -> expiry time, in order of expiry
+        self.entries = OrderedDict()
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        expiry = self.entries.get(key)
+        return expiry is not None and expiry > monotonic()
+
+    def add(self, key):
+        """:return: <bool> True if the ID had not been seen yet"""
+        now = monotonic()
+        while self.entries:
+            oldest, expiry = next(iter(self.entries.items()))
+            if expiry > now:
+                break
+            del self.entries[oldest]
+
+        fresh = key not in self.entries
+        if not fresh:
+            self.hits += 1
+        self.entries[key] = now + self.ttl
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return fresh
+
+
+class LRUCache:
+    def __init__(self, maxsize=100000):
+        """Remembers the results of recent computations, so that repeated inputs are answered without redoing them
+        :param maxsize: <int> Maximum number of results remembered, the least recently used are forgotten first"""
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        if key not in self.entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
@@ -1,25 +1,30 @@
 from flask import Flask, request
-import blobchain.peer as peer
-import asyncio
+from blobchain.gateway import GatewayError, ThreadedGateway
+import logging
 
+logger = logging.getLogger(__name__)
 app = Flask(__name__)
 defaulthost = '127.0.0.1'
 sisters = [8888, 8877, 8866, 8855]
 port = 5000
+# One gateway for every request, which keeps its connections to the sisters open and batches transactions
+gateway = ThreadedGateway([(defaulthost, peerport) for peerport in sisters])
 
 
 @app.route('/transaction', methods=['POST'])
 def make_transaction():
     if request.method == 'POST':
         transaction = request.get_json(force=True)
-        print(f'Data received: {transaction}')
-        client = peer.BlobNode(port)
+        logger.info('Data received: %r', transaction)
         try:
-            for peerport in sisters:
-                asyncio.run(client.send_echo(defaulthost, peerport, 'CASH', transaction))
-            print(f'Your transaction has been broadcast')
-        except OSError:
-            pass
+            ack = gateway.submit(transaction, timeout=10)
+        except GatewayError as error:
+            return {"error": str(error)}, 503
+        if ack is None:
+            return {"error": "The transaction was declined by every node"}, 400
+        logger.info('Your transaction has been broadcast')
+        return {"ack": ack}, 202
 
 
-app.run()
+logging.basicConfig(level=logging.INFO)
+app.run(port=port)
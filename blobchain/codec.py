@@ -0,0 +1,133 @@
+from struct import Struct, error as StructError
+
+"""Compact binary encoding of the values exchanged between peers
+Every value is a one byte tag followed by its payload, in the style of msgpack
+Supports None, bool, int of any size, float, str, bytes, list, tuple and dict
+SHA256 hex digests, which make up most of a Block, are sent as their 32 raw bytes"""
+
+INT = Struct('!q')
+FLOAT = Struct('!d')
+SIZE = Struct('!I')
+INT_MIN, INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+class CodecError(ValueError):
+    pass
+
+
+def encode(value):
+    """:param value: Any combination of the supported types
+    :return: <bytes>"""
+    out = []
+    _encode(value, out)
+    return b''.join(out)
+
+
+def _encode(value, out):
+    kind = type(value)
+    if value is None:
+        out.append(b'N')
+    elif kind is bool:
+        out.append(b'T' if value else b'F')
+    elif kind is int:
+        if INT_MIN <= value <= INT_MAX:
+            out.append(b'i' + INT.pack(value))
+        else:
+            # Large integers, e.g. DSA keys and signatures, are stored as signed big-endian bytes
+            data = value.to_bytes((value.bit_length() + 8) // 8, 'big', signed=True)
+            out.append(b'I' + SIZE.pack(len(data)) + data)
+    elif kind is float:
+        out.append(b'd' + FLOAT.pack(value))
+    elif kind is str:
+        if len(value) == 64:
+            try:
+                digest = bytes.fromhex(value)
+                if digest.hex() == value:
+                    out.append(b'h' + digest)
+                    return
+            except ValueError:
+                pass
+        data = value.encode('utf-8')
+        out.append(b's' + SIZE.pack(len(data)) + data)
+    elif kind is bytes:
+        out.append(b'b' + SIZE.pack(len(value)) + value)
+    elif kind is list or kind is tuple:
+        out.append((b'l' if kind is list else b't') + SIZE.pack(len(value)))
+        for item in value:
+            _encode(item, out)
+    elif kind is dict:
+        out.append(b'm' + SIZE.pack(len(value)))
+        for key, item in value.items():
+            _encode(key, out)
+            _encode(item, out)
+    else:
+        raise CodecError(f'{kind.__name__} cannot be encoded')
+
+
+def decode(data):
+    """:param data: <bytes> Output of encode
+    :return: The decoded value"""
+    data = memoryview(data)
+    value, offset = _decode(data, 0)
+    if offset != len(data):
+        raise CodecError(f'{len(data) - offset} trailing bytes')
+    return value
+
+
+def _decode(data, offset):
+    try:
+        tag = data[offset]
+        offset += 1
+        if tag == 0x73:  # s
+            size = SIZE.unpack_from(data, offset)[0]
+            offset += 4 + size
+            _check(data, offset)
+            return str(data[offset - size:offset], 'utf-8'), offset
+        if tag == 0x68:  # h
+            _check(data, offset + 32)
+            return data[offset:offset + 32].hex(), offset + 32
+        if tag == 0x69:  # i
+            return INT.unpack_from(data, offset)[0], offset + 8
+        if tag == 0x6d:  # m
+            size = SIZE.unpack_from(data, offset)[0]
+            offset += 4
+            value = {}
+            for _ in range(size):
+                key, offset = _decode(data, offset)
+                value[key], offset = _decode(data, offset)
+            return value, offset
+        if tag == 0x6c or tag == 0x74:  # l, t
+            size = SIZE.unpack_from(data, offset)[0]
+            offset += 4
+            value = []
+            for _ in range(size):
+                item, offset = _decode(data, offset)
+                value.append(item)
+            return (value if tag == 0x6c else tuple(value)), offset
+        if tag == 0x64:  # d
+            return FLOAT.unpack_from(data, offset)[0], offset + 8
+        if tag == 0x4e:  # N
+            return None, offset
+        if tag == 0x54:  # T
+            return True, offset
+        if tag == 0x46:  # F
+            return False, offset
+        if tag == 0x49:  # I
+            size = SIZE.unpack_from(data, offset)[0]
+            offset += 4 + size
+            _check(data, offset)
+            return int.from_bytes(data[offset - size:offset], 'big', signed=True), offset
+        if tag == 0x62:  # b
+            size = SIZE.unpack_from(data, offset)[0]
+            offset += 4 + size
+            _check(data, offset)
+            return bytes(data[offset - size:offset]), offset
+    except (IndexError, ValueError, TypeError, StructError, RecursionError) as error:
+        raise CodecError(f'Truncated or malformed data at byte {offset}') from error
+    raise CodecError(f'Unknown tag {tag!r} at byte {offset - 1}')
+
+
+def _check(data, offset):
+    # Slicing past the end of a memoryview does not fail, so truncated payloads are caught here
+    if offset > len(data):
+        raise CodecError(f'Payload runs {offset - len(data)} bytes past the end of the data')
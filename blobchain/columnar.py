@@ -0,0 +1,159 @@
+from array import array
+from collections.abc import Sequence
+
+"""Columnar storage of the chain in memory
+Each field of the Blocks is kept in its own array, with hashes as raw 32 byte digests instead of hex strings,
+so a Block costs a few dozen bytes plus its transactions, and scans over the whole chain run as NumPy operations
+NumPy is imported by the scans which use it, so that nodes keeping their chain in a list never load it"""
+
+HASH_SIZE = 32
+
+
+def pack_digest(value):
+    """:param value: <str> Hex SHA256 digest
+    :return: <bytes> Raw digest, or None if the value is not a digest, e.g. the previous hash of the genesis Block"""
+    if isinstance(value, str) and len(value) == 2 * HASH_SIZE:
+        try:
+            digest = bytes.fromhex(value)
+            if digest.hex() == value:
+                return digest
+        except ValueError:
+            pass
+    return None
+
+
+class ColumnarChain(Sequence):
+    def __init__(self):
+        """A chain of Blocks stored column by column
+        Supports what Blobchain does with a list: len, indexing, slicing, iteration, append and deleting a tail
+        Blobs are rebuilt from the columns whenever a Block is read"""
+        self.indexes = array('q')
+        self.timestamps = array('d')
+        self.nonces = array('q')
+        self.own_hashes = bytearray()
+        self.previous_hashes = bytearray()
+        self.merkle_roots = bytearray()
+        # Proof of Work targets, as 32 byte big endian numbers
+        self.targets = bytearray()
+        self.transactions = []
+        # (height, field) -> value, for the rare fields which do not fit their column, e.g. the genesis previous hash
+        self.irregular = {}
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[height] for height in range(*item.indices(len(self)))]
+        height = item + len(self) if item < 0 else item
+        if not 0 <= height < len(self):
+            raise IndexError('chain index out of range')
+        return self.load(self.header(height), self.transactions[height])
+
+    def __delitem__(self, item):
+        if not isinstance(item, slice) or item.step is not None or item.stop is not None:
+            raise TypeError('only the tail of a columnar chain can be deleted')
+        start = item.indices(len(self))[0]
+        for column in (self.indexes, self.timestamps, self.nonces, self.transactions):
+            del column[start:]
+        for column in (self.own_hashes, self.previous_hashes, self.merkle_roots, self.targets):
+            del column[start * HASH_SIZE:]
+        for key in [key for key in self.irregular if key[0] >= start]:
+            del self.irregular[key]
+
+    def append(self, block):
+        height = len(self)
+        self.indexes.append(block.index)
+        self.timestamps.append(block.timestamp)
+        self.transactions.append(block.transactions)
+        if isinstance(block.nonce, int) and -2 ** 63 <= block.nonce < 2 ** 63:
+            self.nonces.append(block.nonce)
+        else:
+            self.nonces.append(0)
+            self.irregular[(height, "nonce")] = block.nonce
+        if isinstance(block.target, int) and 0 <= block.target < 2 ** (8 * HASH_SIZE):
+            self.targets += block.target.to_bytes(HASH_SIZE, 'big')
+        else:
+            self.targets += bytes(HASH_SIZE)
+            self.irregular[(height, "target")] = block.target
+        for field, column in (("own_hash", self.own_hashes), ("previous_hash", self.previous_hashes),
+                              ("merkle_root", self.merkle_roots)):
+            value = getattr(block, field)
+            digest = pack_digest(value)
+            if digest is None:
+                digest = bytes(HASH_SIZE)
+                self.irregular[(height, field)] = value
+            column += digest
+
+    def digest(self, column, field, height):
+        if (height, field) in self.irregular:
+            return self.irregular[(height, field)]
+        return column[height * HASH_SIZE:(height + 1) * HASH_SIZE].hex()
+
+    def header(self, height):
+        """:return: <dict> Output of Blob.header for the Block at height, read straight from the columns"""
+        nonce = self.irregular.get((height, "nonce"), self.nonces[height])
+        return {"index": self.indexes[height], "timestamp": self.timestamps[height],
+                "previous_hash": self.digest(self.previous_hashes, "previous_hash", height),
+                "merkle_root": self.digest(self.merkle_roots, "merkle_root", height),
+                "target": self.target(height), "nonce": nonce,
+                "own_hash": self.digest(self.own_hashes, "own_hash", height)}
+
+    def target(self, height):
+        if (height, "target") in self.irregular:
+            return self.irregular[(height, "target")]
+        return int.from_bytes(self.targets[height * HASH_SIZE:(height + 1) * HASH_SIZE], 'big')
+
+    def records(self, start=0):
+        """Flattens the Blocks from height start onwards without building a Blob for each, see blobchain.validation
+        :return: <list> Tuples of (index, timestamp, previous hash, merkle root, target, nonce, own hash,
+        transactions)"""
+        records = []
+        for height in range(start, len(self)):
+            header = self.header(height)
+            records.append((header["index"], header["timestamp"], header["previous_hash"], header["merkle_root"],
+                            header["target"], header["nonce"], header["own_hash"], self.transactions[height]))
+        return records
+
+    def column(self, data):
+        # Views a column of raw digests as a (blocks, 32) matrix, without copying it
+        import numpy
+        return numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, HASH_SIZE)
+
+    def broken_link(self, start=0):
+        """Checks that every Block from height start onwards points to the hash of the Block before it
+        :return: <int> Height of the first Block which does not, or None"""
+        start = max(start, 1)
+        if start >= len(self):
+            return None
+        own_hashes, previous_hashes = self.column(self.own_hashes), self.column(self.previous_hashes)
+        broken = (previous_hashes[start:] != own_hashes[start - 1:-1]).any(axis=1)
+        # A hash held in irregular cannot be a valid link, as every Block hash is a digest
+        for height, field in self.irregular:
+            # An irregular own hash breaks the link of the Block after it
+            link = height + 1 if field == "own_hash" else height
+            if field in ("own_hash", "previous_hash") and start <= link < len(self):
+                broken[link - start] = True
+        return start + int(broken.argmax()) if broken.any() else None
+
+    def intervals(self):
+        """:return: <ndarray> Seconds between each Block and the one before it"""
+        import numpy
+        return numpy.diff(numpy.frombuffer(self.timestamps, dtype=numpy.float64))
+
+    def stats(self):
+        """:return: <dict> Summary of the chain, computed over the columns"""
+        import numpy
+        intervals = self.intervals()
+        counts = numpy.fromiter((len(transactions) for transactions in self.transactions), dtype=numpy.int64,
+                                count=len(self))
+        return {"blocks": len(self), "transactions": int(counts.sum()),
+                "mean_interval": float(intervals.mean()) if len(intervals) else 0.0,
+                "max_interval": float(intervals.max()) if len(intervals) else 0.0,
+                "mean_block_size": float(counts.mean()) if len(counts) else 0.0}
+
+    @staticmethod
+    def load(header, transactions):
+        # Imported here, since blobchain.blockchain builds on this module
+        from blobchain.blockchain import Blob
+        return Blob.from_header(header, transactions)
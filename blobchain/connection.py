@@ -0,0 +1,201 @@
+from collections import Counter
+from itertools import count
+from struct import Struct
+from time import monotonic
+from blobchain.codec import encode, decode, CodecError
+import asyncio
+
+"""Framing of packets and long-lived, multiplexed connections between peers
+Every packet is framed as (protocol version, request ID, payload length) followed by the payload, see blobchain.codec
+The request ID lets many requests share one connection, since each reply carries the ID of its request"""
+
+VERSION = 4
+FRAME = Struct('!BQQ')
+# Largest reply accepted, room for a whole chain in a BLOB reply while a peer still cannot make a node allocate at will
+MAX_REPLY = 256 * 2 ** 20
+# Raised when a peer is unreachable, hangs up mid-frame or sends a malformed packet
+NETWORK_ERRORS = (OSError, EOFError, CodecError, asyncio.TimeoutError)
+
+
+class PeerBusy(ConnectionError):
+    """Raised when a peer sheds a request under load with a BUSY reply, see blobchain.admission
+    A NETWORK_ERROR, so that a busy peer is handled like an unreachable one"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Peer is busy, retry after {retry_after} seconds')
+        self.retry_after = retry_after
+
+
+def extract_data(data):
+    # Processes the payload received into a tuple of the form (message type, message)
+    msgtype, message = decode(data)
+    return msgtype, message
+
+
+def check_busy(replytype, reply):
+    # Passes a reply through, unless the peer shed the request
+    if replytype == 'BUSY':
+        raise PeerBusy(reply)
+    return replytype, reply
+
+
+def process_message(msgtype, message):
+    # Converts the tuple (message type, message) into a payload which can be framed and sent
+    return encode((msgtype, message))
+
+
+async def read_packet(reader, limit=None):
+    """Reads exactly one framed packet, however large unless a limit is given
+    :param limit: <int> Largest payload in bytes, a larger packet being refused before it is read
+    :return: <tuple> (request ID, payload)"""
+    version, request_id, length = FRAME.unpack(await reader.readexactly(FRAME.size))
+    if version != VERSION:
+        raise CodecError(f'Protocol version {version} is not supported')
+    if limit is not None and length > limit:
+        raise CodecError(f'Packet of {length} bytes is over the limit of {limit}')
+    return request_id, await reader.readexactly(length)
+
+
+def write_packet(writer, request_id, payload):
+    """:return: <int> Number of bytes written"""
+    writer.write(FRAME.pack(VERSION, request_id, len(payload)) + payload)
+    return FRAME.size + len(payload)
+
+
+class Connection:
+    def __init__(self, reader, writer, traffic=None, max_reply=MAX_REPLY):
+        """A connection to a peer which can carry many requests at once
+        Replies are matched to their requests by a listener task which reads every incoming packet
+        :param traffic: <Counter> Tally of bytes "sent" and "received", shared by the connections of a pool
+        :param max_reply: <int> Largest reply in bytes, the connection being dropped on a larger one"""
+        self.reader = reader
+        self.writer = writer
+        self.traffic = Counter() if traffic is None else traffic
+        self.max_reply = max_reply
+        self.ids = count(1)
+        # Request ID -> Future waiting for the reply
+        self.pending = {}
+        self.last_used = monotonic()
+        self.closed = False
+        self.listener = asyncio.create_task(self.listen())
+
+    async def request(self, msgtype, message, timeout):
+        """:return: <tuple> (reply type, reply)"""
+        if self.closed:
+            raise ConnectionResetError('Connection is closed')
+        request_id = next(self.ids)
+        reply = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = reply
+        try:
+            self.traffic["sent"] += write_packet(self.writer, request_id, process_message(msgtype, message))
+            await self.writer.drain()
+            return check_busy(*extract_data(await asyncio.wait_for(reply, timeout)))
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def listen(self):
+        try:
+            while True:
+                request_id, data = await read_packet(self.reader, self.max_reply)
+                self.traffic["received"] += FRAME.size + len(data)
+                reply = self.pending.get(request_id)
+                if reply is not None and not reply.done():
+                    reply.set_result(data)
+        except NETWORK_ERRORS as error:
+            self.fail(ConnectionResetError(f'Connection lost: {error!r}'))
+
+    def fail(self, error):
+        # Wakes every request still waiting on this connection
+        self.closed = True
+        for reply in self.pending.values():
+            if not reply.done():
+                reply.set_exception(error)
+        self.pending.clear()
+        self.writer.close()
+
+    def close(self):
+        self.listener.cancel()
+        self.fail(ConnectionResetError('Connection was closed'))
+
+
+class ConnectionPool:
+    def __init__(self, timeout=10, idle_timeout=60, keepalive=15, backoff=0.5, max_backoff=30, source=None,
+                 max_reply=MAX_REPLY):
+        """Keeps one long-lived connection per peer, so that gossip and sync do not pay a TCP handshake per message
+        :param timeout: <float> Seconds to wait for a connection or a reply
+        :param idle_timeout: <float> Seconds after which an unused connection is closed
+        :param keepalive: <float> Seconds between two BEAT messages on every open connection
+        :param backoff: <float> Seconds before the first reconnection attempt, doubled after every failure
+        :param max_backoff: <float> Longest wait between two reconnection attempts
+        :param source: <str> Local address connections are made from, or None to leave it to the system
+        :param max_reply: <int> Largest reply in bytes accepted on any connection of the pool"""
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.source = source
+        self.max_reply = max_reply
+        # (host, port) -> Connection
+        self.connections = {}
+        # (host, port) -> (consecutive failures, earliest time of the next attempt)
+        self.failures = {}
+        # (host, port) -> Lock, so that concurrent requests to a new peer open a single connection
+        self.dialing = {}
+        self.traffic = Counter()
+
+    async def request(self, host, port, msgtype, message):
+        connection = await self.connection((host, port))
+        # Keepalive beats go around this method, so only real traffic keeps a connection from being evicted
+        connection.last_used = monotonic()
+        return await connection.request(msgtype, message, self.timeout)
+
+    async def connection(self, peer):
+        connection = self.connections.get(peer)
+        if connection is not None and not connection.closed:
+            return connection
+
+        lock = self.dialing.setdefault(peer, asyncio.Lock())
+        async with lock:
+            connection = self.connections.get(peer)
+            if connection is not None and not connection.closed:
+                return connection
+
+            failures, retry_at = self.failures.get(peer, (0, 0))
+            if monotonic() < retry_at:
+                raise ConnectionRefusedError(f'Backing off from {peer!r} after {failures} failed attempts')
+            local_addr = None if self.source is None else (self.source, 0)
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(*peer, local_addr=local_addr),
+                                                        self.timeout)
+            except NETWORK_ERRORS:
+                delay = min(self.backoff * 2 ** failures, self.max_backoff)
+                self.failures[peer] = (failures + 1, monotonic() + delay)
+                raise
+            self.failures.pop(peer, None)
+            connection = Connection(reader, writer, self.traffic, self.max_reply)
+            self.connections[peer] = connection
+            return connection
+
+    async def maintain(self):
+        """Closes idle connections and keeps the others alive, forever"""
+        while True:
+            await asyncio.sleep(self.keepalive)
+            now = monotonic()
+            for peer, connection in list(self.connections.items()):
+                if connection.closed or now - connection.last_used > self.idle_timeout:
+                    connection.close()
+                    del self.connections[peer]
+            await asyncio.gather(*(self.beat(peer, connection) for peer, connection in self.connections.items()))
+
+    async def beat(self, peer, connection):
+        try:
+            await connection.request('BEAT', None, self.timeout)
+        except NETWORK_ERRORS:
+            connection.close()
+            self.connections.pop(peer, None)
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.close()
+        self.connections.clear()
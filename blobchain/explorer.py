@@ -0,0 +1,126 @@
+from hashlib import sha256
+from blobchain.cache import LRUCache
+from blobchain.gateway import GatewayError
+import asyncio
+import json
+import logging
+
+"""Read-only queries of the chain for the block explorer of the web front-ends
+Every reply of the node is rendered to JSON once and kept in an LRU cache by query, with an ETag of its body, so that
+repeated queries skip the node and browsers can revalidate their copy with a conditional GET
+The cache is cleared whenever the tip of the chain changes, which is polled from the node every interval seconds,
+so that a reply is never more than that out of date"""
+
+logger = logging.getLogger(__name__)
+
+CACHE_SIZE = 1024
+POLL_INTERVAL = 0.5
+# Blocks per page of the recent blocks, and most blocks per BLKS request, see blobchain.peer.PAGE_LIMIT
+PAGE = 20
+PAGE_LIMIT = 100
+
+
+def etag(body):
+    return '"' + sha256(body).hexdigest()[:32] + '"'
+
+
+class Explorer:
+    def __init__(self, gateway, cache_size=CACHE_SIZE, interval=POLL_INTERVAL):
+        """:param gateway: <class> Gateway to the nodes queried, see blobchain.gateway
+        :param cache_size: <int> Most replies cached, or 0 to query the node every time
+        :param interval: <float> Seconds between two checks of the tip of the chain"""
+        self.gateway = gateway
+        self.cache = LRUCache(cache_size)
+        self.interval = interval
+        self.tip = None
+        # Bumped whenever the cache is cleared, so that a reply fetched across a new block is not cached
+        self.generation = 0
+        self.watcher = None
+
+    async def query(self, msgtype, message, render=None):
+        """:param render: <function> Applied to the reply of the node before it is rendered to JSON
+        :return: <tuple> (ETag, JSON body), or (None, None) if the node has nothing for the query
+        :raises GatewayError: if no node could be reached"""
+        self.watch()
+        key = (msgtype, message)
+        entry = self.cache.get(key)
+        if entry is None:
+            generation = self.generation
+            replytype, reply = await self.gateway.request(msgtype, message)
+            if replytype == 'ERRO' or reply is None:
+                entry = (None, None)
+            else:
+                body = json.dumps(render(reply) if render else reply).encode()
+                entry = (etag(body), body)
+            if generation == self.generation:
+                self.cache.put(key, entry)
+        return entry
+
+    async def block(self, key):
+        """:param key: <int> Height of the Block, or <str> its hash"""
+        return await self.query('BLCK', key)
+
+    async def blocks(self, before=None, limit=PAGE):
+        """Pages through the chain from the tip backwards
+        :param before: <int> Height below which Blocks are listed, or None to start from the tip
+        :return: <tuple> (ETag, JSON body) of the Blocks, most recent first, and the height the next page is before"""
+        limit = max(1, min(limit, PAGE_LIMIT))
+        if before is None:
+            message = (-limit, limit)
+        else:
+            start = max(before - limit, 0)
+            message = (start, max(before - start, 0))
+        return await self.query('BLKS', message, lambda blocks: {
+            "blocks": blocks[::-1], "next": blocks[0]["height"] if blocks and blocks[0]["height"] > 0 else None})
+
+    async def transaction(self, tx_hash):
+        return await self.query('TXID', tx_hash)
+
+    async def stats(self):
+        return await self.query('STAT', None)
+
+    async def download(self):
+        """Streams the whole chain as a JSON array, a page of Blocks at a time, so that it is never held in full
+        A reorganisation while streaming ends the array at the last Block before the fork
+        :return: <generator> Chunks of the JSON array
+        :raises GatewayError: if no node could be reached"""
+        yield b'['
+        start, last = 0, None
+        while True:
+            _, blocks = await self.gateway.request('BLKS', (start, PAGE_LIMIT))
+            if blocks and last is not None and blocks[0]["previous_hash"] != last:
+                logger.warning('The chain was reorganised during a download, stopping at height %d', start)
+                break
+            if blocks:
+                yield (b',' if start else b'') + b','.join(json.dumps(block).encode() for block in blocks)
+                last = blocks[-1]["own_hash"]
+                start += len(blocks)
+            if len(blocks) < PAGE_LIMIT:
+                break
+        yield b']'
+
+    def watch(self):
+        # Polls the tip from the event loop the explorer is first used on
+        if self.watcher is None:
+            self.watcher = asyncio.ensure_future(self.poll())
+
+    async def poll(self):
+        while True:
+            try:
+                _, (_, tip, _) = await self.gateway.request('TIPS', None)
+            except GatewayError:
+                pass
+            else:
+                if tip != self.tip:
+                    self.tip = tip
+                    self.invalidate()
+            await asyncio.sleep(self.interval)
+
+    def invalidate(self):
+        self.cache.clear()
+        self.generation += 1
+
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.cancel()
+            self.watcher = None
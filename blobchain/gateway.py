@@ -0,0 +1,144 @@
+from blobchain.connection import ConnectionPool, NETWORK_ERRORS
+from blobchain.mempool import transaction_hash
+import asyncio
+import logging
+import threading
+
+"""Long-lived entry point for the web front-ends to submit transactions and query nodes
+The gateway keeps warm pooled connections to its nodes, and coalesces the transactions submitted within a few
+milliseconds of each other into a single TXNS message per node, which each node acknowledges with their hashes
+Gateway is used from an event loop, e.g. the Tornado server, and ThreadedGateway from threads, e.g. the Flask client"""
+
+logger = logging.getLogger(__name__)
+
+BATCH = 64
+MAX_WAIT = 0.002
+
+
+class GatewayError(Exception):
+    """Raised when no node of the gateway could be reached"""
+
+
+class Gateway:
+    def __init__(self, nodes, batch_size=BATCH, max_wait=MAX_WAIT, timeout=5):
+        """:param nodes: <list> (host, port) of the nodes every transaction is sent to
+        :param batch_size: <int> Number of pending transactions which triggers a batch straight away
+        :param max_wait: <float> Seconds a transaction waits for others before its batch is sent anyway
+        :param timeout: <float> Seconds to wait for a node"""
+        self.nodes = list(nodes)
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.pool = ConnectionPool(timeout=timeout)
+        # Transaction hash -> (transaction, Future), waiting for the next batch
+        self.pending = {}
+        self.flusher = None
+        self.batches = set()
+        self.maintenance = None
+
+    async def submit(self, transaction):
+        """Queues a transaction on every node, in a batch with the transactions submitted around the same time
+        :return: <str> Acknowledgement ID, the hash of the transaction, or None if every node declined it
+        :raises GatewayError: if no node could be reached"""
+        self.maintain()
+        ack = transaction_hash(transaction)
+        if ack in self.pending:
+            future = self.pending[ack][1]
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self.pending[ack] = (transaction, future)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+            elif self.flusher is None:
+                self.flusher = asyncio.get_running_loop().call_later(self.max_wait, self.flush)
+        # Shielded, since the same transaction may be submitted twice before its batch is sent
+        return await asyncio.shield(future)
+
+    def flush(self):
+        # Hands every pending transaction over to a batch
+        if self.flusher is not None:
+            self.flusher.cancel()
+            self.flusher = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        task = asyncio.ensure_future(self.run(batch))
+        self.batches.add(task)
+        task.add_done_callback(self.batches.discard)
+
+    async def run(self, batch):
+        transactions = [transaction for transaction, _ in batch.values()]
+        replies = await asyncio.gather(*(self.send(host, port, transactions) for host, port in self.nodes))
+        reached = [reply for reply in replies if reply is not None]
+        accepted = set().union(*reached)
+        for ack, (_, future) in batch.items():
+            if future.done():
+                continue
+            if not reached:
+                future.set_exception(GatewayError(f'None of the nodes {self.nodes!r} could be reached'))
+            else:
+                future.set_result(ack if ack in accepted else None)
+
+    async def send(self, host, port, transactions):
+        """:return: <list> Hashes of the transactions the node accepted, or None if it could not be reached"""
+        try:
+            replytype, reply = await self.pool.request(host, port, 'TXNS', transactions)
+        except NETWORK_ERRORS as error:
+            logger.warning('Could not send %d transactions to %r:%r: %r', len(transactions), host, port, error)
+            return None
+        return reply if replytype == 'REPL-TXNS' else []
+
+    async def request(self, msgtype, message):
+        """Sends a request to the first node which answers it, over the warm connections
+        :return: <tuple> (reply type, reply)
+        :raises GatewayError: if no node could be reached"""
+        self.maintain()
+        for host, port in self.nodes:
+            try:
+                return await self.pool.request(host, port, msgtype, message)
+            except NETWORK_ERRORS as error:
+                logger.warning('Could not send %s to %r:%r: %r', msgtype, host, port, error)
+        raise GatewayError(f'None of the nodes {self.nodes!r} could be reached')
+
+    def maintain(self):
+        # Keeps the connections to the nodes alive between bursts, from the event loop the gateway is first used on
+        if self.maintenance is None:
+            self.maintenance = asyncio.ensure_future(self.pool.maintain())
+
+    def close(self):
+        if self.maintenance is not None:
+            self.maintenance.cancel()
+            self.maintenance = None
+        self.pool.close()
+
+
+class ThreadedGateway:
+    def __init__(self, nodes, **kwargs):
+        """Gateway running on an event loop of its own in a background thread, for callers without an event loop
+        Every thread of e.g. a WSGI server shares its connections and batches
+        :param kwargs: Options of Gateway"""
+        self.loop = asyncio.new_event_loop()
+        self.gateway = Gateway(nodes, **kwargs)
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def call(self, coroutine, timeout):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def submit(self, transaction, timeout=None):
+        """Blocks until the transaction is acknowledged, see Gateway.submit"""
+        return self.call(self.gateway.submit(transaction), timeout)
+
+    def request(self, msgtype, message, timeout=None):
+        """Blocks until the reply arrives, see Gateway.request"""
+        return self.call(self.gateway.request(msgtype, message), timeout)
+
+    async def shutdown(self):
+        self.gateway.close()
+        # Lets the cancelled connection tasks finish before the loop stops
+        await asyncio.sleep(0.01)
+
+    def close(self):
+        self.call(self.shutdown(), None)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
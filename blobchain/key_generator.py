@@ -1,18 +1,27 @@
-from random import randint
 from hashlib import sha256
+from blobchain.codec import encode, decode, CodecError
 import blobchain.primes as primes
+import logging
+import os
+import secrets
 
 """Adapted the Digital Signature Algorithm as documented by the U.S. Department of Commerce
 Section B.1.1: Key Pair Generation Using Extra Random Bits
 Create public and private keys"""
 
+logger = logging.getLogger(__name__)
+
+# Folder in which generated domain parameters are saved, so that they are reused across processes
+DOMAIN_DIR = os.path.join(os.path.expanduser("~"), ".blobchain")
+# (L, N) -> Domain, generated or loaded once per process
+DOMAINS = {}
+
 
 def bits_to_integer(bits, N):
-    integer = 0
-    for n in range(N):
-        two_power = 2 ** (N - n)
-        integer += two_power * int(bits[n])
-    return integer
+    # Weighs the first N bits of a bit string from 2 ** N down to 2 ** 1, parsed in one go rather than bit by bit
+    if N == 0:
+        return 0
+    return int(bits[:N], 2) << 1
 
 
 def concatenate_binary(variables):
@@ -23,62 +32,110 @@ def concatenate_binary(variables):
     return f_string
 
 
-def find_inverse(z, a):
-    if 0 < z < a:
-        i, j = a, z
-        y2, y1 = 0, 1
-        while j > 0:
-            quotient = i // j
-            remainder = i - j * quotient
-            y = y2 - y1 * quotient
-            i, j = j, remainder
-            y2, y1 = y1, y
-        if i != 1:
-            print("ERROR")
-        else:
-            return y2 % a
-    else:
-        print(f"{z}, {a} are INVALID")
-
-
-class PairKey:
+def message_integer(M, N):
+    # Leftmost bits of the SHA256 hash of M, as used by both signing and verification
+    M = int(sha256(M.encode()).hexdigest(), 16)
+    z = bin(M)[2:min(N, 256)]
+    return bits_to_integer(z, len(z))
+
+
+class FixedBase:
+    def __init__(self, base, modulus, bits, window=6):
+        """Precomputes powers of a base which is reused for many exponentiations, e.g. g or a public key y
+        table[i][d] holds base ** (d * 2 ** (i * window)) mod modulus, so an exponentiation costs a single
+        multiplication per window of the exponent and no squaring
+        :param bits: <int> Largest bit length of the exponents, i.e. N
+        :param window: <int> Bits of the exponent consumed per multiplication"""
+        self.modulus = modulus
+        self.window = window
+        self.mask = (1 << window) - 1
+        self.table = []
+        for _ in range((bits + window - 1) // window):
+            row = [1]
+            for _ in range(self.mask):
+                row.append(row[-1] * base % modulus)
+            self.table.append(row)
+            base = row[-1] * base % modulus
+
+    def pow(self, exponent, result=1):
+        """:param result: <int> Value the powers are multiplied into, so that products of powers share reductions
+        :return: <int> result * base ** exponent mod modulus"""
+        for row in self.table:
+            if not exponent:
+                break
+            digit = exponent & self.mask
+            if digit:
+                result = result * row[digit] % self.modulus
+            exponent >>= self.window
+        if exponent:
+            raise ValueError("exponent is longer than the table")
+        return result
+
+
+def check_signature(tables, q, N, M, r, s):
+    """Verifies a signature against the FixedBase tables of g and y, which a verifier keeps per public key
+    :param tables: <tuple> (FixedBase of g, FixedBase of y)
+    :return: <bool>"""
+    if not (0 < r < q and 0 < s < q):
+        return False
+    g_table, y_table = tables
+    w = pow(s, -1, q)
+    z = message_integer(M, N)
+
+    u1 = (z * w) % q
+    u2 = (r * w) % q
+    v = y_table.pow(u2, g_table.pow(u1)) % q
+    return v == r
+
+
+def find_nonce(p, q, g):
+    """Draws the per-message secret k of a signature, and computes everything about it which does not depend on M
+    :return: <tuple> (k, mod q inverse of k, r = (g ** k mod p) mod q)"""
+    while True:
+        k = secrets.randbits(q.bit_length() + 64) % (q - 1) + 1
+        r = pow(g, k, p) % q
+        if r != 0:
+            return k, pow(k, -1, q), r
+
+
+class Domain:
     def __init__(self, L, N, seedlen):
-        """:param L: <int> Bit length of p
+        """Generates the domain parameters (p, q, g), which are shared by every key of the same (L, N)
+        This is the slow part of creating keys, so a Domain is generated once and saved, see domain_parameters
+        :param L: <int> Bit length of p
         :param N: <int> Bit length of q
-        :param input_seed: <int> Any random number"""
+        :param seedlen: <int> Bit length of the first seed, at least N"""
         self.seedlen = seedlen
-        first_seed = self.find_seed(N)
-
-        find_q = primes.ST_random_prime(N, first_seed)
-        (q_status, self.q, q_seed, q_counter) = find_q.find_prime()
+        while True:
+            first_seed = self.find_seed(N)
 
-        p_0 = primes.ST_random_prime(L // 2 + 1, q_seed)
-        (p0_status, p0, seed, gen_counter) = p_0.find_prime()
-        (p_status, self.p, p_seed, pgen_counter) = p_0.find_p(self.q, p0, L, seed, gen_counter)
+            find_q = primes.ST_random_prime(N, first_seed)
+            (q_status, self.q, q_seed, q_counter) = find_q.find_prime()
 
-        dp_seed = concatenate_binary([first_seed, p_seed, q_seed])
+            p_0 = primes.ST_random_prime(L // 2 + 1, q_seed)
+            (p0_status, p0, seed, gen_counter) = p_0.find_prime()
+            (p_status, self.p, p_seed, pgen_counter) = p_0.find_p(self.q, p0, L, seed, gen_counter)
 
-        self.domain_parameter_seed = bits_to_integer(dp_seed, len(dp_seed))
+            dp_seed = concatenate_binary([first_seed, p_seed, q_seed])
 
-        validate = Validate()
-        (self.L, self.N) = validate.pq(self.p, self.q, L, N)
+            self.domain_parameter_seed = bits_to_integer(dp_seed, len(dp_seed))
 
-        validate.LN(self.L, self.N)
+            validate = Validate()
+            (self.L, self.N) = validate.pq(self.p, self.q, L, N)
 
-        self.g = self.find_g(self.p, self.q, 1)
-        self.c = self.find_c()
+            validate.LN(self.L, self.N)
 
-        self.x = (self.c % (self.q - 1)) + 1
-        self.y = pow(self.g, self.x, self.p)
-        validate.xy(self.x, self.y, self.p, self.q)
+            self.g = self.find_g(self.p, self.q, 1)
+            # The search is started again from a new seed in the rare case it failed
+            if self.valid():
+                break
 
     def find_seed(self, N):
         first_seed = 0
         if self.seedlen < N:
-            print("seedlen is INVALID")
+            logger.warning('seedlen %d is shorter than N = %d', self.seedlen, N)
         while first_seed < 2 ** (N - 1):
-            first_seed = [randint(0, 1) for _ in range(self.seedlen)]
-            first_seed = bits_to_integer(first_seed, self.seedlen)
+            first_seed = secrets.randbits(self.seedlen)
         return first_seed
 
     def find_g(self, p, q, index):
@@ -97,54 +154,101 @@ class PairKey:
             g = pow(W, e, p)
         return g
 
+    def valid(self):
+        """Checks that q divides p - 1 and that g generates a subgroup of order q, without proving p and q prime again
+        :return: <bool>"""
+        if self.p < 3 or self.q < 2 or self.p.bit_length() != self.L or self.q.bit_length() != self.N:
+            return False
+        return (self.p - 1) % self.q == 0 and 1 < self.g < self.p and pow(self.g, self.q, self.p) == 1
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(encode({"L": self.L, "N": self.N, "seedlen": self.seedlen, "p": self.p, "q": self.q,
+                               "g": self.g, "domain_parameter_seed": self.domain_parameter_seed}))
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        """:return: <class> Domain saved at path, or None if there is none or it does not check out"""
+        try:
+            with open(path, 'rb') as file:
+                fields = decode(file.read())
+            domain = cls.__new__(cls)
+            for field in ("L", "N", "seedlen", "p", "q", "g", "domain_parameter_seed"):
+                setattr(domain, field, fields[field])
+        except (OSError, CodecError, KeyError, TypeError):
+            return None
+        return domain if domain.valid() else None
+
+
+def domain_parameters(L, N, seedlen, directory=DOMAIN_DIR):
+    """Finds the Domain of (L, N) in memory, then on disk, and only generates it if neither has it
+    :param directory: <str> Folder in which domains are saved, or None to keep them in memory only
+    :return: <class> Domain"""
+    if (L, N) in DOMAINS:
+        return DOMAINS[(L, N)]
+    path = os.path.join(directory, f'domain-{L}-{N}.dat') if directory else None
+    domain = Domain.load(path) if path else None
+    if domain is None or (domain.L, domain.N) != (L, N):
+        domain = Domain(L, N, seedlen)
+        if path:
+            domain.save(path)
+    DOMAINS[(L, N)] = domain
+    return domain
+
+
+class PairKey:
+    def __init__(self, L, N, seedlen, domain=None):
+        """:param L: <int> Bit length of p
+        :param N: <int> Bit length of q
+        :param seedlen: <int> Bit length of the first seed, used if the domain parameters have to be generated
+        :param domain: <class> Domain to create the key in, defaults to the saved one of (L, N)"""
+        self.seedlen = seedlen
+        if domain is None:
+            domain = domain_parameters(L, N, seedlen)
+        self.p, self.q, self.g = domain.p, domain.q, domain.g
+        self.domain_parameter_seed = domain.domain_parameter_seed
+        (self.L, self.N) = (domain.L, domain.N)
+        self.c = self.find_c()
+
+        self.x = (self.c % (self.q - 1)) + 1
+        self.y = pow(self.g, self.x, self.p)
+        if not Validate().xy(self.x, self.y, self.p, self.q):
+            logger.error('Generated an invalid key pair for (L, N) = (%d, %d)', self.L, self.N)
+        # FixedBase tables of g and y, built the first time a signature is verified
+        self.tables = None
+
     def find_c(self):
-        c = [randint(0, 1) for _ in range(self.N + 64)]
-        c = bits_to_integer(c, self.N + 64)
-        return c
-
-    def find_k(self):
-        c = [randint(0, 1) for _ in range(self.N + 64)]
-        c = bits_to_integer(c, self.N + 64)
-        k = c % (self.q - 1) + 1
-        k_inv = find_inverse(k, self.q)
-        return k, k_inv
-
-    def gen_signature(self, M):
+        return secrets.randbits(self.N + 64)
+
+    def gen_signature(self, M, nonce=None):
         """:param M: <str> Transaction details
-        :param k: <int> Secret number unique to each message
-        :param k_inv: <int> Mod q inverse of k"""
-        (k, k_inv) = self.find_k()
-        M = int(sha256(M.encode()).hexdigest(), 16)
-        z = bin(M)[2:min(self.N, 256)]
-        z = bits_to_integer(z, len(z))
-
-        r = pow(self.g, k, self.p) % self.q
-        s = (k_inv * (z + self.x * r)) % self.q
-        if r == 0 or s == 0:
-            self.find_k()
-        return r, s
-
-    # !-!-! verify.signature() takes too damn long to run
+        :param nonce: <tuple> Precomputed (k, k_inv, r) which is never used again, see blobchain.signer
+        k is a secret number unique to each message, k_inv its mod q inverse and r = (g ** k mod p) mod q
+        :return: <tuple> (r, s)"""
+        z = message_integer(M, self.N)
+        while True:
+            if nonce is None:
+                nonce = find_nonce(self.p, self.q, self.g)
+            (k, k_inv, r) = nonce
+            s = (k_inv * (z + self.x * r)) % self.q
+            if s != 0:
+                return r, s
+            nonce = None
+
     def verify_signature(self, M, r, s):
         """Prior to verifying the signature, the domain parameters and public key should be available to the verifier
+        g ** u1 * y ** u2 mod p is evaluated in one pass over the FixedBase tables of g and y
         :param M: <str> Received version of M (M')
         :param r: <int> Received version of r (r')
         :param s: <int> Received version of s (s')
-        """
+        :return: <bool>"""
         if not (0 < r < self.q and 0 < s < self.q):
             return False
-        w = find_inverse(s, self.q) % self.q
-        M = int(sha256(M.encode()).hexdigest(), 16)
-        z = bin(M)[2:min(self.N, 256)]
-        z = bits_to_integer(z, len(z))
-
-        u1 = (z * w) % self.q
-        u2 = (r * w) % self.q
-        print(u1)
-        print(u2)
-        v = (((self.g ** u1) * (self.y ** u2)) % self.p) % self.q
-        if v == r:
-            return True
+        if self.tables is None:
+            self.tables = (FixedBase(self.g, self.p, self.N), FixedBase(self.y, self.p, self.N))
+        return check_signature(self.tables, self.q, self.N, M, r, s)
 
 
 class Validate:
@@ -158,22 +262,17 @@ class Validate:
 
     def pq(self, p, q, L, N):
         if 2 ** L <= p or 2 ** N <= q:
-            print("FAILURE")
+            logger.warning('p or q is longer than (L, N) = (%d, %d)', L, N)
         if (p - 1) % q != 0:
-            print("q is INVALID")
+            logger.warning('q does not divide p - 1')
         return L, N
 
     def xy(self, x, y, p, q):
-        if not 1 <= x <= (q - 1):
-            print("x is INVALID")
-        if not 1 <= y <= (p - 1):
-            print("y is INVALID")
-        else:
-            print("SUCCESS")
-
-
-pair = PairKey(1024, 160, 927)
-(r, s) = pair.gen_signature("hello")
-print(pair.verify_signature("hello", r, s))
+        """:return: <bool> Whether x and y are in range for a private and public key"""
+        return 1 <= x <= (q - 1) and 1 <= y <= (p - 1)
 
 
+if __name__ == "__main__":
+    pair = PairKey(1024, 160, 927)
+    (r, s) = pair.gen_signature("hello")
+    print(pair.verify_signature("hello", r, s))
@@ -0,0 +1,153 @@
+from array import array
+from blobchain.codec import encode, decode, CodecError
+from blobchain.mempool import transaction_hash, value
+import os
+
+"""Index of balances and transaction history by address, kept up to date as Blocks are added and removed
+Balances are read in O(1) and the history of an address in O(k) for its k transactions, instead of scanning the chain
+The index can be snapshotted to disk, so that a restarted node only replays the Blocks after the snapshot
+Transactions are indexed by hash separately, and only once something looks them up, see TransactionIndex"""
+
+# Bits of a location which hold the position of a transaction in its Block, the rest holding the height of the Block
+POSITION_BITS = 20
+
+
+def transaction_key(tx_hash):
+    # The first 64 bits of the hash, enough to tell apart the transactions of a chain in a single machine word
+    return int(tx_hash[:16], 16)
+
+
+class Ledger:
+    def __init__(self, path=None, snapshot_every=1000):
+        """:param path: <str> File holding the snapshot, or None to keep the index in memory only
+        :param snapshot_every: <int> Number of Blocks between two snapshots"""
+        self.path = path
+        self.snapshot_every = snapshot_every
+        # Address -> balance
+        self.balances = {}
+        # Address -> flat array of height, position of the transaction in its Block, height, ... oldest first
+        # Arrays keep millions of entries compact, and are written to snapshots as raw bytes
+        self.history = {}
+        # Number of transactions applied
+        self.transactions = 0
+        # Number of Blocks applied, and hash of the last one
+        self.height = 0
+        self.tip = None
+
+    def balance(self, address):
+        return self.balances.get(address, 0)
+
+    def entries(self, address, limit=None):
+        """:return: <list> (height, position) of the transactions of an address, most recent first"""
+        history = self.history.get(address, ())
+        start = 0 if limit is None else max(len(history) - 2 * limit, 0)
+        return [(history[i], history[i + 1]) for i in range(len(history) - 2, start - 1, -2)]
+
+    def apply(self, block):
+        # Adds the transactions of the Block at height self.height
+        for position, transaction in enumerate(block.transactions):
+            sender, recipient = transaction.get("sender"), transaction.get("recipient")
+            amount = value(transaction.get("amount"))
+            self.balances[sender] = self.balances.get(sender, 0) - amount
+            self.balances[recipient] = self.balances.get(recipient, 0) + amount
+            for address in {sender, recipient}:
+                history = self.history.get(address)
+                if history is None:
+                    history = self.history[address] = array('q')
+                history.append(self.height)
+                history.append(position)
+        self.transactions += len(block.transactions)
+        self.height += 1
+        self.tip = block.own_hash
+        if self.path is not None and self.height % self.snapshot_every == 0:
+            self.snapshot()
+
+    def revert(self, block):
+        # Removes the transactions of the last Block applied, when the chain is reorganised
+        for transaction in reversed(block.transactions):
+            sender, recipient = transaction.get("sender"), transaction.get("recipient")
+            amount = value(transaction.get("amount"))
+            self.balances[sender] += amount
+            self.balances[recipient] -= amount
+            for address in {sender, recipient}:
+                history = self.history[address]
+                del history[-2:]
+                if not history:
+                    del self.history[address]
+                    del self.balances[address]
+        self.transactions -= len(block.transactions)
+        self.height -= 1
+        self.tip = block.previous_hash
+
+    def catch_up(self, chain):
+        """Rebuilds the index for a chain loaded from disk, from the snapshot if it still matches the chain"""
+        if not self.load() or self.height > len(chain) or (self.height and chain[self.height - 1].own_hash != self.tip):
+            self.balances, self.history, self.transactions, self.height, self.tip = {}, {}, 0, 0, None
+        for block in chain[self.height:]:
+            self.apply(block)
+
+    def snapshot(self):
+        # Written to a temporary file first, so that a crash never leaves a half-written snapshot behind
+        history = {address: entries.tobytes() for address, entries in self.history.items()}
+        payload = encode({"height": self.height, "tip": self.tip, "balances": self.balances, "history": history,
+                          "transactions": self.transactions})
+        with open(self.path + '.tmp', 'wb') as file:
+            file.write(payload)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(self.path + '.tmp', self.path)
+
+    def load(self):
+        """:return: <bool> Whether a snapshot was read"""
+        if self.path is None or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as file:
+                state = decode(file.read())
+            self.height, self.tip, self.transactions = state["height"], state["tip"], state["transactions"]
+            self.balances, self.history = state["balances"], {}
+            for address, entries in state["history"].items():
+                self.history[address] = array('q')
+                self.history[address].frombytes(entries)
+        except (OSError, CodecError, KeyError, TypeError, ValueError):
+            return False
+        return True
+
+
+class TransactionIndex:
+    def __init__(self):
+        """Locations of mined transactions by hash, for inclusion proofs and the block explorer
+        Hashing every transaction would triple the cost of adding a Block, so the index only catches up with the chain
+        when a transaction is looked up, and a node nobody queries never pays for it"""
+        # transaction_key -> height << POSITION_BITS | position of the transaction in its Block
+        # Packed ints rather than hash strings and tuples keep millions of entries compact
+        self.locations = {}
+        # Number of Blocks indexed
+        self.height = 0
+
+    def __len__(self):
+        return len(self.locations)
+
+    def catch_up(self, chain):
+        for height in range(self.height, len(chain)):
+            for position, transaction in enumerate(chain[height].transactions):
+                self.locations[transaction_key(transaction_hash(transaction))] = height << POSITION_BITS | position
+        self.height = len(chain)
+
+    def truncate(self, chain, position):
+        # Forgets the Blocks from position onwards, before they are removed from the chain by a reorganisation
+        for height in range(position, self.height):
+            for transaction in chain[height].transactions:
+                self.locations.pop(transaction_key(transaction_hash(transaction)), None)
+        self.height = min(self.height, position)
+
+    def locate(self, tx_hash):
+        """Keys only hold part of the hash, so the caller checks the transaction found against the full hash
+        :return: <tuple> (height, position) of a transaction, or None if it is not indexed"""
+        try:
+            location = self.locations.get(transaction_key(tx_hash))
+        except (TypeError, ValueError):
+            return None
+        if location is None:
+            return None
+        return location >> POSITION_BITS, location & ((1 << POSITION_BITS) - 1)
@@ -0,0 +1,87 @@
+from hashlib import sha256
+from heapq import heappush, heappop
+from itertools import count
+from time import monotonic
+
+"""Pool of transactions waiting to be mined
+Transactions are deduplicated by hash and taken highest fee first, then in order of arrival
+A block is ready to be mined once it can be filled, or once the oldest transaction has waited long enough"""
+
+MAX_BATCH = 100
+TIMEOUT = 2.0
+
+
+def value(amount):
+    # Amounts and fees come from the web forms as strings, and are only counted if they are numbers
+    if isinstance(amount, (int, float)) and not isinstance(amount, bool):
+        return amount
+    if isinstance(amount, str):
+        for kind in (int, float):
+            try:
+                return kind(amount)
+            except ValueError:
+                pass
+    return 0
+
+
+def transaction_hash(transaction):
+    # Hashes a transaction independently of the order of its fields
+    data = repr(sorted(transaction.items()))
+    return sha256(data.encode()).hexdigest()
+
+
+class Mempool:
+    def __init__(self, max_batch=MAX_BATCH, timeout=TIMEOUT):
+        """:param max_batch: <int> Maximum number of transactions mined into a single Block
+        :param timeout: <float> Seconds the oldest transaction may wait before a partly filled Block is mined"""
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.heap = []
+        # Transaction hash -> (arrival time, transaction), kept in order of arrival
+        self.entries = {}
+        self.counter = count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, tx_hash):
+        return tx_hash in self.entries
+
+    def add(self, transaction):
+        """:param transaction: <dict> Transaction with an optional "fee" field
+        :return: <bool> False if the transaction is already pending"""
+        tx_hash = transaction_hash(transaction)
+        if tx_hash in self.entries:
+            return False
+        fee = value(transaction.get("fee"))
+        self.entries[tx_hash] = (monotonic(), transaction)
+        heappush(self.heap, (-fee, next(self.counter), tx_hash))
+        return True
+
+    def remove(self, transactions):
+        # Drops transactions which were mined elsewhere; their heap entries are skipped lazily by take()
+        for transaction in transactions:
+            self.entries.pop(transaction_hash(transaction), None)
+
+    def wait_time(self):
+        """:return: <float> Seconds until a Block should be mined, or None if the pool is empty"""
+        if len(self.entries) >= self.max_batch:
+            return 0
+        if not self.entries:
+            return None
+        arrival, _ = next(iter(self.entries.values()))
+        return max(0, arrival + self.timeout - monotonic())
+
+    def ready(self):
+        return self.wait_time() == 0
+
+    def take(self):
+        """Removes the next batch of transactions from the pool
+        :return: <list> Up to max_batch transactions by priority"""
+        batch = []
+        while self.heap and len(batch) < self.max_batch:
+            _, _, tx_hash = heappop(self.heap)
+            entry = self.entries.pop(tx_hash, None)
+            if entry is not None:
+                batch.append(entry[1])
+        return batch
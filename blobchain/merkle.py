@@ -0,0 +1,65 @@
+from hashlib import sha256
+
+"""Merkle tree over the transactions of a Block
+The root is committed to in the Block header, so a single transaction can be verified against the header
+with an inclusion proof of O(log n) hashes, without downloading the rest of the Block"""
+
+EMPTY_ROOT = sha256(b"").hexdigest()
+
+
+def hash_pair(left, right):
+    # Hashes two child nodes into their parent
+    return sha256(bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+class MerkleTree:
+    def __init__(self, leaves):
+        """Builds every level of the tree once, so that proofs are read off the cached internal nodes
+        :param leaves: <list> Hex SHA256 hashes of the transactions, in Block order"""
+        self.levels = [list(leaves)]
+        level = self.levels[0]
+        while len(level) > 1:
+            if len(level) % 2:
+                # An odd node is paired with itself, as in Bitcoin
+                level = level + [level[-1]]
+            level = [hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+            self.levels.append(level)
+
+    @property
+    def root(self):
+        """:return: <str> Hex hash committed to in the Block header"""
+        if not self.levels[0]:
+            return EMPTY_ROOT
+        return self.levels[-1][0]
+
+    def proof(self, position):
+        """:param position: <int> Position of the transaction in the Block
+        :return: <list> Pairs of (sibling hash, "L" or "R" for the side of the sibling), from leaf to root"""
+        path = []
+        for level in self.levels[:-1]:
+            sibling = position ^ 1
+            if sibling == len(level):
+                sibling = position
+            path.append((level[sibling], "L" if sibling < position else "R"))
+            position //= 2
+        return path
+
+
+def unique_root(leaves):
+    """Root of the tree over leaves which must all differ, since an odd node is paired with itself, so that
+    [a, b, c, c] would have the same root as [a, b, c] and a repeated transaction would be counted twice
+    :return: <str> Hex root, or None if a leaf is repeated"""
+    if len(set(leaves)) != len(leaves):
+        return None
+    return MerkleTree(leaves).root
+
+
+def verify_proof(leaf, proof, root):
+    """:param leaf: <str> Hex hash of the transaction
+    :param proof: <list> Output of MerkleTree.proof
+    :param root: <str> Merkle root taken from the Block header
+    :return: <bool>"""
+    node = leaf
+    for sibling, side in proof:
+        node = hash_pair(sibling, node) if side == "L" else hash_pair(node, sibling)
+    return node == root
@@ -0,0 +1,234 @@
+from bisect import bisect_left
+from collections import Counter
+from io import StringIO
+from time import perf_counter
+import asyncio
+import json
+import logging
+import sys
+import threading
+
+"""Counters, gauges and latency histograms of a node, and an opt-in profiler which can be toggled while it runs
+Both are served as JSON over a small HTTP endpoint, see MetricsServer:
+GET /metrics         every metric
+GET /profile/start   starts profiling, with ?mode=sampling for the sampling profiler instead of cProfile
+GET /profile/stop    stops profiling and returns the functions which took the most time"""
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets in seconds, doubling from 10 microseconds to about 3 minutes
+BUCKETS = tuple(0.00001 * 2 ** n for n in range(25))
+
+
+class Histogram:
+    def __init__(self, bounds=BUCKETS):
+        """Distribution of observed values, in fixed buckets so that observing costs the same however many there are
+        :param bounds: <tuple> Upper bound of each bucket, in increasing order, and one more bucket holds the rest"""
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """:return: <float> Upper bound of the bucket holding the q-th quantile, or the largest value seen"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {"count": self.count, "sum": self.total, "mean": self.total / self.count if self.count else 0.0,
+                "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99), "max": self.max}
+
+
+class Metrics:
+    def __init__(self):
+        """Registry of the metrics of a node
+        Counters only go up, gauges are read from a function whenever a snapshot is taken, so that values such as the
+        chain height cost nothing until they are asked for, and histograms hold latencies in seconds"""
+        self.counters = Counter()
+        self.gauges = {}
+        self.histograms = {}
+
+    def increment(self, name, amount=1):
+        self.counters[name] += amount
+
+    def gauge(self, name, function):
+        """:param function: <function> Returns the current value of the gauge"""
+        self.gauges[name] = function
+
+    def observe(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    def timer(self, name):
+        """:return: <class> Context manager which observes the time spent in its block, including when it raises"""
+        return Timer(self, name)
+
+    def snapshot(self):
+        """:return: <dict> Every metric, in a form which can be serialised to JSON"""
+        gauges = {}
+        for name, function in self.gauges.items():
+            try:
+                gauges[name] = function()
+            except Exception as error:
+                gauges[name] = None
+                logger.warning('Gauge %s failed: %r', name, error)
+        return {"counters": dict(self.counters), "gauges": gauges,
+                "histograms": {name: histogram.snapshot() for name, histogram in self.histograms.items()}}
+
+
+class Timer:
+    # A class rather than contextlib.contextmanager, whose generator costs more on every request
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, perf_counter() - self.start)
+
+
+class Profiler:
+    def __init__(self, interval=0.005, limit=30):
+        """Profiles the thread which starts it, either with cProfile or by sampling its stack from another thread
+        cProfile counts every call exactly and slows the node down, sampling only looks every interval and does not
+        :param interval: <float> Seconds between two samples
+        :param limit: <int> Number of functions reported"""
+        self.interval = interval
+        self.limit = limit
+        self.mode = None
+        self.profile = None
+        # "file:line(function)" -> number of samples in which it was running, or anywhere on the stack
+        self.own = Counter()
+        self.cumulative = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.sampler = None
+
+    def start(self, mode='cprofile'):
+        """:param mode: <str> 'cprofile' or 'sampling'
+        :return: <bool> False if the profiler was already running"""
+        if self.mode is not None:
+            return False
+        if mode == 'sampling':
+            self.own.clear()
+            self.cumulative.clear()
+            self.samples = 0
+            self.stopped.clear()
+            self.sampler = threading.Thread(target=self.sample, args=(threading.get_ident(),), daemon=True)
+            self.sampler.start()
+        elif mode == 'cprofile':
+            # Imported here, so that a node which never profiles does not load it
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            raise ValueError(f'Unknown profiler mode {mode!r}')
+        self.mode = mode
+        return True
+
+    def sample(self, thread_id):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                return
+            self.samples += 1
+            self.own[self.location(frame)] += 1
+            # A recursive function counts once per sample
+            stack = set()
+            while frame is not None:
+                stack.add(self.location(frame))
+                frame = frame.f_back
+            self.cumulative.update(stack)
+
+    @staticmethod
+    def location(frame):
+        code = frame.f_code
+        return f'{code.co_filename}:{code.co_firstlineno}({code.co_name})'
+
+    def stop(self):
+        """:return: <dict> Report of the functions which took the most time, or None if the profiler was not running"""
+        if self.mode is None:
+            return None
+        if self.mode == 'sampling':
+            self.stopped.set()
+            self.sampler.join()
+            self.sampler = None
+            report = {"mode": "sampling", "samples": self.samples, "interval": self.interval,
+                      "own": self.own.most_common(self.limit), "cumulative": self.cumulative.most_common(self.limit)}
+        else:
+            import pstats
+            self.profile.disable()
+            output = StringIO()
+            pstats.Stats(self.profile, stream=output).sort_stats('cumulative').print_stats(self.limit)
+            self.profile = None
+            report = {"mode": "cprofile", "stats": output.getvalue()}
+        self.mode = None
+        return report
+
+
+class MetricsServer:
+    def __init__(self, metrics, profiler=None):
+        """Serves the metrics, and the profiler if there is one, as JSON over HTTP
+        Only meant to be reached locally, e.g. from curl or a dashboard scraper, as nothing is authenticated"""
+        self.metrics = metrics
+        self.profiler = profiler
+
+    async def start(self, host='127.0.0.1', port=9100):
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info('Serving metrics on %s', server.sockets[0].getsockname())
+        return server
+
+    async def handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 5)
+            method, target = request.split(b'\r\n', 1)[0].decode('latin-1').split(' ')[:2]
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError):
+            writer.close()
+            return
+        path, _, query = target.partition('?')
+        status, body = self.route(method, path, dict(pair.partition('=')[::2] for pair in query.split('&') if pair))
+        payload = json.dumps(body).encode()
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode() + payload)
+        try:
+            await writer.drain()
+        except OSError:
+            pass
+        writer.close()
+
+    def route(self, method, path, query):
+        """:return: <tuple> (HTTP status line, body to be serialised as JSON)"""
+        if method != 'GET':
+            return '405 Method Not Allowed', {"error": f'{method} is not supported'}
+        if path == '/metrics':
+            return '200 OK', self.metrics.snapshot()
+        if self.profiler is not None and path == '/profile/start':
+            try:
+                started = self.profiler.start(query.get('mode', 'cprofile'))
+            except ValueError as error:
+                return '400 Bad Request', {"error": str(error)}
+            return ('200 OK', {"profiling": self.profiler.mode}) if started else \
+                ('409 Conflict', {"error": f'Already profiling with {self.profiler.mode}'})
+        if self.profiler is not None and path == '/profile/stop':
+            report = self.profiler.stop()
+            return ('200 OK', report) if report is not None else ('409 Conflict', {"error": 'Not profiling'})
+        return '404 Not Found', {"error": f'No such path {path}'}
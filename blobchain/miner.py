@@ -1,5 +1,7 @@
 from blobchain.peer import BlobNode
 import asyncio
+import logging
+import os
 import sys
 
 port = int(sys.argv[1])
@@ -7,5 +9,12 @@ if len(sys.argv) == 2:
     host = None
 else:
     host = str(sys.argv[2])
+# An optional third argument names the folder in which the chain is kept between runs
+datadir = sys.argv[3] if len(sys.argv) > 3 else None
+# An optional fourth argument is the local port serving metrics and the profiler, see blobchain.metrics
+metrics_port = int(sys.argv[4]) if len(sys.argv) > 4 else None
 
-asyncio.run(BlobNode(port, host).main())
+# BLOBCHAIN_LOG=DEBUG shows every message, WARNING keeps only problems
+logging.basicConfig(level=os.environ.get('BLOBCHAIN_LOG', 'INFO').upper(),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+asyncio.run(BlobNode(port, host, datadir=datadir, metrics_port=metrics_port).main())
@@ -0,0 +1,157 @@
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from hashlib import sha256
+import os
+
+"""Proof of Work engines which solve for the Nonce of a Block, and the targets they solve against
+A Nonce is valid when sha256(f"{own_hash}{nonce}"), read as a number, does not exceed the target, where own_hash is
+the hash of the header, so that the Proof of Work commits to the index, timestamp, previous hash, Merkle root and target
+Every Block carries its own target, which is retargeted every RETARGET_INTERVAL Blocks to keep them BLOCK_INTERVAL apart
+The nonce space is searched in chunks so that mining can be cancelled as soon as a competing block arrives"""
+
+# Leading hex zeroes required of the genesis Block, and of every Block until the first retarget
+DIFFICULTY = 3
+CHUNK = 20000
+# Blocks between two retargets, 0 keeps every Block at the initial target
+RETARGET_INTERVAL = 20
+# Seconds the network aims to spend on each Block
+BLOCK_INTERVAL = 2.0
+# Largest factor by which a single retarget can raise or lower the target
+MAX_ADJUSTMENT = 4
+MAX_TARGET = 2 ** 256 - 1
+
+
+def difficulty_target(difficulty):
+    # Converts a number of leading hex zeroes into the largest 32-byte digest which still solves the block
+    return (2 ** (256 - 4 * difficulty) - 1).to_bytes(32, 'big')
+
+
+def initial_target():
+    """:return: <int> Target of the genesis Block, from DIFFICULTY"""
+    return int.from_bytes(difficulty_target(DIFFICULTY), 'big')
+
+
+def block_work(target):
+    """:return: <int> Expected number of hashes needed to meet the target"""
+    return 2 ** 256 // (target + 1)
+
+
+def retarget(target, elapsed, blocks):
+    """Scales the target by how much faster or slower than BLOCK_INTERVAL the last blocks were found
+    :param elapsed: <float> Seconds between the first and the last of those blocks
+    :param blocks: <int> Number of block intervals elapsed covers
+    :return: <int> New target"""
+    expected = BLOCK_INTERVAL * blocks
+    # Bounded in both directions, so that skewed timestamps cannot swing the difficulty
+    elapsed = min(max(elapsed, expected / MAX_ADJUSTMENT), expected * MAX_ADJUSTMENT)
+    # Fixed-point arithmetic, since targets are far larger than a float can hold exactly
+    return max(min(target * round(elapsed * 1000) // round(expected * 1000), MAX_TARGET), 1)
+
+
+def next_target(height, lookup):
+    """Works out the target which the Block at height has to carry
+    :param lookup: <function> height -> (timestamp, target) of an earlier Block
+    :return: <int>"""
+    if height == 0:
+        return initial_target()
+    timestamp, target = lookup(height - 1)
+    if not RETARGET_INTERVAL or height % RETARGET_INTERVAL != 0:
+        return target
+    first = max(height - 1 - RETARGET_INTERVAL, 0)
+    if first == height - 1:
+        return target
+    return retarget(target, timestamp - lookup(first)[0], height - 1 - first)
+
+
+def search(own_hash, target, start, stop):
+    """Tries every Nonce in [start, stop) against the target
+    The hash state of the header hash is computed once and copied, and raw digests are compared instead of hex strings
+    :return: <int> nonce, or None if the range holds no solution"""
+    prefix = sha256(own_hash.encode())
+    for nonce in range(start, stop):
+        guess = prefix.copy()
+        guess.update(b"%d" % nonce)
+        if guess.digest() <= target:
+            return nonce
+    return None
+
+
+class SerialMiner:
+    def __init__(self, chunk=CHUNK):
+        """Solves for the Nonce in the current process
+        :param chunk: <int> Number of nonces tried between two checks for cancellation"""
+        self.chunk = chunk
+        # Raised by every cancel, and a job is abandoned as soon as it differs from the one the job was given
+        self.generation = 0
+
+    def cancel(self):
+        # Abandons the blocks being mined or waiting to be mined, e.g. when a competing block has been received
+        self.generation += 1
+
+    def job(self):
+        """:return: <class> Job which mines with this miner until the next cancel, even one issued before it starts"""
+        return Job(self, self.generation)
+
+    def mine(self, own_hash, target, nonce=0, generation=None):
+        """:param own_hash: <str> Hash of the header of the Block, see blobchain.blockchain.header_hash
+        :param target: <bytes> Digest which the hash must not exceed
+        :param generation: <int> Generation of the miner when the job was scheduled, defaults to the current one
+        :return: <int> nonce, or None if mining was cancelled"""
+        generation = self.generation if generation is None else generation
+        while self.generation == generation:
+            found = search(own_hash, target, nonce, nonce + self.chunk)
+            if found is not None:
+                return found
+            nonce += self.chunk
+        return None
+
+    def shutdown(self):
+        pass
+
+
+class PoolMiner(SerialMiner):
+    def __init__(self, workers=None, chunk=CHUNK):
+        """Splits the nonce space into chunks which are searched in parallel by a pool of worker processes
+        :param workers: <int> Number of processes, defaults to the number of cores"""
+        super().__init__(chunk)
+        self.workers = workers or os.cpu_count()
+        self.pool = None
+
+    def mine(self, own_hash, target, nonce=0, generation=None):
+        generation = self.generation if generation is None else generation
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers)
+
+        pending = set()
+        while True:
+            # Keeps two chunks queued per worker so that no process sits idle between chunks
+            while len(pending) < 2 * self.workers and self.generation == generation:
+                pending.add(self.pool.submit(search, own_hash, target, nonce, nonce + self.chunk))
+                nonce += self.chunk
+            if self.generation != generation:
+                for future in pending:
+                    future.cancel()
+                return None
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            found = [future.result() for future in done if future.result() is not None]
+            if found:
+                for future in pending:
+                    future.cancel()
+                return min(found)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+
+
+class Job:
+    def __init__(self, miner, generation):
+        """Proof of Work scheduled with a miner, which a Block mines with in place of the miner itself
+        Only cancels issued after it was scheduled abandon it, so none is lost while it waits for the executor"""
+        self.miner = miner
+        self.generation = generation
+
+    def mine(self, own_hash, target, nonce=0):
+        return self.miner.mine(own_hash, target, nonce, self.generation)
@@ -1,34 +1,111 @@
+from blobchain.connection import ConnectionPool, FRAME, MAX_REPLY, NETWORK_ERRORS, PeerBusy, check_busy, \
+    extract_data, process_message, read_packet, write_packet
+from collections import Counter
+from time import perf_counter
+from blobchain.admission import Admission, BUSY_RETRY, MAX_BACKOFF, TRANSACTION_FIELDS
+from blobchain.cache import SeenCache
+from blobchain.codec import CodecError
+from blobchain.ledger import Ledger
+from blobchain.mempool import transaction_hash
+from blobchain.merkle import MerkleTree
+from blobchain.metrics import Metrics, MetricsServer, Profiler
+from blobchain.peertable import PeerTable
+from blobchain.store import BlockStore
+from blobchain.validation import ChainValidator
+from blobchain.verifier import BatchVerifier
 import blobchain.blockchain as blockchain
+import blobchain.mining as mining
 import asyncio
+import logging
+import os
 import socket
-import ast
 
-# Hard-coded nodes in the network provides a contact point for finding other peers
+logger = logging.getLogger(__name__)
+
+# Hard-coded nodes in the network provides a contact point for finding other peers, unless a node is given seeds
 defaulthost = '127.0.0.1'
 sisters = [8888, 8877, 8866, 8855]
-peerlist = []
+# Most hops from the seeds crawled when joining the network, and most nodes queried at once
+CRAWL_DEPTH = 4
+CRAWL_FANOUT = 32
+# Most headers or bodies sent in reply to a single HEAD or BODY request
+SYNC_BATCH = 500
+# Most attempts at a HEAD or BODY request which the peer sheds as busy, before a sync gives up
+SYNC_RETRIES = 10
+# Fields every header of a HEAD reply must have, see Blob.header
+HEADER_FIELDS = ("index", "timestamp", "previous_hash", "merkle_root", "target", "nonce", "own_hash")
+# Most transactions of an address sent in reply to a single BALN request
+HISTORY_LIMIT = 100
+# Most blocks sent in reply to a single BLKS request of the block explorer
+PAGE_LIMIT = 100
+
+
+def preferred(work, tip, other_work, other_tip):
+    """Chooses between two chains by their work, and between chains of equal work by the lower tip hash, so that
+    nodes holding competing tips of the same work all settle on the same one
+    :return: <bool> Whether the chain of work and tip is preferred over the other"""
+    return work > other_work or (work == other_work and tip < other_tip)
+
+
+def address_shape(address):
+    return isinstance(address, (list, tuple)) and len(address) == 2 and isinstance(address[0], str) and \
+        type(address[1]) is int and 0 < address[1] < 65536
+
+
+def header_shape(header):
+    return isinstance(header, dict) and all(field in header for field in HEADER_FIELDS) and \
+        type(header["target"]) is int and type(header["timestamp"]) in (int, float)
+
+
+def body_shape(transactions):
+    return transactions is None or (isinstance(transactions, list) and
+                                    all(isinstance(transaction, dict) for transaction in transactions))
 
 
-def extract_data(data):
-    # Processes the raw data received into a tuple of the form (message type, message)
-    decoded = data.decode('utf-8')
-    msgtype, message = ast.literal_eval(decoded)
-    return msgtype, message
+# Reply type -> whether a reply which a sync or a crawl relies on is well-formed, since a peer may answer anything
+REPLY_SHAPES = {'REPL-LIST': lambda reply: isinstance(reply, list) and all(address_shape(a) for a in reply),
+                'REPL-TIPS': lambda reply: isinstance(reply, (list, tuple)) and len(reply) == 3 and
+                type(reply[0]) is int and isinstance(reply[1], str) and type(reply[2]) is int,
+                'REPL-HEAD': lambda reply: isinstance(reply, (list, tuple)) and len(reply) == 2 and
+                type(reply[0]) is int and isinstance(reply[1], list) and all(header_shape(h) for h in reply[1]),
+                'REPL-BODY': lambda reply: isinstance(reply, list) and all(body_shape(t) for t in reply)}
 
 
-def process_message(msgtype, message):
-    # Converts the tuple (message type, message) into a string which can be encoded and sent
-    packet = str((msgtype, message))
-    encoded = packet.encode('utf-8')
-    return encoded
+def message_id(transactions):
+    # Identifies a CASH or BLOC announcement by the Merkle root of its transactions
+    return MerkleTree([transaction_hash(transaction) for transaction in transactions]).root
 
 
 class BlobNode:
-    def __init__(self, PORT, HOST=None):
-        """Initialises a fully functioning peer node which can handle and send requests"""
-        self.blo = blockchain.Blobchain()
+    def __init__(self, PORT, HOST=None, pooled=True, fanout=16, peer_timeout=5, datadir=None,
+                 verify_signatures=False, metrics_port=None, peers=None, seeds=None, admission=True, sync_interval=30):
+        """Initialises a fully functioning peer node which can handle and send requests
+        :param pooled: <bool> Whether to keep long-lived connections to peers, or to open one per message
+        :param fanout: <int> Maximum number of peers a broadcast talks to at once
+        :param peer_timeout: <float> Seconds a broadcast waits for a single peer before giving up on it
+        :param datadir: <str> Folder in which the chain is stored, so that it survives a restart
+        :param verify_signatures: <bool> Whether only signed transactions are accepted, see blobchain.verifier
+        :param metrics_port: <int> Local port on which metrics and the profiler are served, see blobchain.metrics
+        :param peers: <class> PeerTable of this node, see blobchain.peertable
+        :param seeds: <list> (host, port) of the nodes contacted when joining the network, defaults to the sisters
+        :param admission: <bool> Whether requests are queued, rate limited and shed per peer, see blobchain.admission
+        :param sync_interval: <float> Seconds between two rounds of syncing with every peer, see sync_forever"""
+        if datadir:
+            self.blo = blockchain.Blobchain(store=BlockStore(datadir),
+                                            ledger=Ledger(os.path.join(datadir, 'ledger.snap')))
+        else:
+            self.blo = blockchain.Blobchain()
+        self.validator = ChainValidator()
+        self.verifier = BatchVerifier() if verify_signatures else None
+        self.pool = ConnectionPool() if pooled else None
+        self.admission = Admission() if admission else None
+        self.fanout = asyncio.Semaphore(fanout)
+        self.peer_timeout = peer_timeout
+        self.sync_interval = sync_interval
 
         self.maxpeers = 100
+        self.peers = PeerTable(self.maxpeers) if peers is None else peers
+        self.seeds = [(defaulthost, peerport) for peerport in sisters] if seeds is None else seeds
         self.port = PORT
         if not HOST:
             name = socket.gethostname()
@@ -36,20 +113,109 @@ class BlobNode:
         else:
             self.host = HOST
         self.address = None
+        # Pending transactions wait in self.blo.mempool, and mine_forever is woken whenever one arrives
+        self.arrival = asyncio.Event()
+        # Hashes of transactions which were sent to this node directly and have to be announced once mined
+        self.announce = set()
+        # Announcements and transactions already handled, so that each is processed and relayed only once
+        self.seen = SeenCache()
+        # Message type -> number of duplicate announcements dropped
+        self.duplicates = Counter()
+        self.relays = set()
+
+        self.metrics = Metrics()
+        self.profiler = Profiler()
+        self.metrics_port = metrics_port
+        self.metrics.gauge('chain.height', lambda: len(self.blo.chain))
+        self.metrics.gauge('chain.work', lambda: self.blo.chain_work())
+        self.metrics.gauge('peers', lambda: len(self.peers))
+        self.metrics.gauge('mempool.size', lambda: len(self.blo.mempool))
+        self.metrics.gauge('mining.hashrate', self.hashrate)
+        self.metrics.gauge('duplicates', lambda: dict(self.duplicates))
+        if self.pool:
+            self.metrics.gauge('pool.connections', lambda: len(self.pool.connections))
+            self.metrics.gauge('pool.bytes_sent', lambda: self.pool.traffic["sent"])
+            self.metrics.gauge('pool.bytes_received', lambda: self.pool.traffic["received"])
+        if self.admission:
+            self.metrics.gauge('admission.inflight', lambda: self.admission.inflight)
+
+    def hashrate(self):
+        # Expected hashes behind the blocks mined so far, over the time spent mining them
+        seconds = self.metrics.counters["mining.seconds"]
+        return self.metrics.counters["mining.work"] / seconds if seconds else 0.0
 
     async def main(self):
         server = await asyncio.start_server(self.handle_echo, self.host, self.port)
         self.address = server.sockets[0].getsockname()
-        print(f'Serving on {self.address}')
+        logger.info('Serving on %s', self.address)
+        if self.metrics_port is not None:
+            self.metrics_server = await MetricsServer(self.metrics, self.profiler).start(port=self.metrics_port)
+        self.mining = asyncio.create_task(self.mine_forever())
+        if self.pool:
+            self.maintenance = asyncio.create_task(self.pool.maintain())
 
-        try:
-            await asyncio.gather(*(self.build_peers(defaulthost, peerport) for peerport in sisters))
-        except OSError:
-            pass
+        await self.discover(self.seeds)
+        self.syncing = asyncio.create_task(self.sync_forever())
 
         async with server:
             await server.serve_forever()
 
+    def gossip(self, msgtype, anunctype, transactions):
+        """Handles a CASH or BLOC announcement the first time it arrives, and drops it every time after
+        A new BLOC is relayed to every peer, so that it floods the network once per edge"""
+        if not self.seen.add((msgtype, message_id(transactions))):
+            self.duplicates[msgtype] += 1
+            logger.debug('Dropped duplicate %s, %d so far', msgtype, self.duplicates[msgtype])
+            return
+        if msgtype == 'BLOC':
+            # Only transactions arrive with a BLOC, so the tip is unchanged and the block being mined is kept, while
+            # sync and update_blockchain cancel it whenever the tip does change
+            relay = asyncio.create_task(self.broadcast('BLOC', transactions))
+            self.relays.add(relay)
+            relay.add_done_callback(self.relays.discard)
+        self.submit(anunctype, transactions)
+
+    def submit(self, anunctype, transactions):
+        """Adds transactions which have not been seen before to the mempool
+        :param anunctype: <str> Message type used to announce the transactions once mined, or None"""
+        for transaction in transactions:
+            tx_hash = transaction_hash(transaction)
+            if self.seen.add(('TX', tx_hash)) and self.blo.mempool.add(transaction) and anunctype:
+                self.announce.add(tx_hash)
+        self.arrival.set()
+
+    async def mine_forever(self):
+        """Mines batches from the mempool off the event loop, so that peers are still served while a block is mined
+        A batch is mined once it is full or its oldest transaction has timed out, see blobchain.mempool
+        Cancelled batches return to the mempool and are tried again on the new tip"""
+        while True:
+            self.arrival.clear()
+            wait_time = self.blo.mempool.wait_time()
+            if wait_time != 0:
+                try:
+                    await asyncio.wait_for(self.arrival.wait(), wait_time)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            start = perf_counter()
+            fresh_block = await self.blo.mine_pending_async()
+            elapsed = perf_counter() - start
+            self.metrics.increment('mining.seconds', elapsed)
+            if fresh_block is None:
+                self.metrics.increment('mining.abandoned')
+            else:
+                self.metrics.observe('mining.block', elapsed)
+                self.metrics.increment('mining.blocks')
+                self.metrics.increment('mining.work', mining.block_work(fresh_block.target))
+                announcement = [transaction for transaction in fresh_block.transactions
+                                if transaction_hash(transaction) in self.announce]
+                self.announce.difference_update(transaction_hash(transaction) for transaction in announcement)
+                if announcement:
+                    # Marks the announcement as seen, so that it is dropped when peers relay it back
+                    self.seen.add(('BLOC', message_id(announcement)))
+                    await self.broadcast('BLOC', announcement)
+
     async def routine(self, PEERHOST, PEERPORT, msgtype, message):
         """Creates the routine of sending messages, receiving replies, and correctly using the information"""
         newpeer = (PEERHOST, PEERPORT)
@@ -57,26 +223,48 @@ class BlobNode:
             replytype, reply = await self.send_echo(PEERHOST, PEERPORT, msgtype, message)
             await self.handle_reply(newpeer, replytype, reply)
             return True
-        except OSError:
+        except NETWORK_ERRORS:
             return False
 
     async def broadcast(self, msgtype, message):
-        for peer in peerlist:
-            peerhost, peerport = peer
-            await self.routine(peerhost, peerport, msgtype, message)
+        """Sends a message to every peer concurrently, so that propagation is bounded by the slowest healthy peer
+        :return: <list> Peers which failed or timed out"""
+        peers = list(self.peers)
+        reached = await asyncio.gather(*(self.reach(peerhost, peerport, msgtype, message)
+                                         for peerhost, peerport in peers))
+        failed = [peer for peer, success in zip(peers, reached) if not success]
+        if failed:
+            self.metrics.increment('broadcast.failures', len(failed))
+            logger.warning('Broadcast of %s failed for %d of %d peers: %r', msgtype, len(failed), len(peers), failed)
+        return failed
+
+    async def reach(self, PEERHOST, PEERPORT, msgtype, message):
+        # Runs one routine of a broadcast, waiting for a free slot and giving up on the peer after peer_timeout
+        async with self.fanout:
+            try:
+                reached = await asyncio.wait_for(self.routine(PEERHOST, PEERPORT, msgtype, message),
+                                                 self.peer_timeout)
+            except asyncio.TimeoutError:
+                reached = False
+        self.peers.record((PEERHOST, PEERPORT), reached)
+        return reached
 
     async def send_echo(self, PEERHOST, PEERPORT, msgtype, message):
-        """Sends and receives messages"""
-        reader, writer = await asyncio.open_connection(PEERHOST, PEERPORT)
+        """Sends and receives messages, over the connection pool if there is one"""
         newpeer = (PEERHOST, PEERPORT)
-        print(f'Sending message {msgtype}: {message!r} to {newpeer!r}...')
-        packet = process_message(msgtype, message)
-        writer.write(packet)
-
-        data = await reader.read(1024)
-        replytype, reply = extract_data(data)
-        await writer.drain()
-        writer.close()
+        logger.debug('Sending message %s: %r to %r', msgtype, message, newpeer)
+        self.metrics.increment(f'messages.sent.{msgtype}')
+        with self.metrics.timer(f'request.{msgtype}'):
+            if self.pool:
+                return await self.pool.request(PEERHOST, PEERPORT, msgtype, message)
+
+            reader, writer = await asyncio.open_connection(PEERHOST, PEERPORT)
+            self.metrics.increment('bytes.sent', write_packet(writer, 1, process_message(msgtype, message)))
+            await writer.drain()
+            _, data = await read_packet(reader, MAX_REPLY)
+            self.metrics.increment('bytes.received', FRAME.size + len(data))
+            writer.close()
+            replytype, reply = check_busy(*extract_data(data))
 
         return replytype, reply
 
@@ -85,153 +273,462 @@ class BlobNode:
         :param newpeer: Name of the client node
         :param replytype: In the format REPL-{original request} so that the purpose of the reply is known
         :param reply: Information satisfying the original request"""
-        print(f'Received reply {replytype}: {reply!r} from {newpeer!r}')
-        response = ReplyHandler()
-        condition, element = await response.reply_data(replytype, reply, self.blo.chain)
+        logger.debug('Received reply %s: %r from %r', replytype, reply, newpeer)
+        response = ReplyHandler(self.peers)
+        condition, element = await response.reply_data(replytype, reply, self.blo)
         if condition == 'UPDATE':
             await self.update_blockchain(element)
-            print(self.blo.chain)
 
     async def handle_echo(self, reader, writer):
-        """Receives incoming messages and returns an appropriate reply"""
-        data = await reader.read(1024)
-        msgtype, message = extract_data(data)
-        print(f'Received message {msgtype}: {message!r}')
-        response = Handler(self.maxpeers)
-        anunctype, announcement = await response.handle_data(data, self.blo)
-        if anunctype:
-            await self.broadcast(anunctype, announcement)
-            writer.write(response.packet)
-            print(f'Sending reply...')
+        """Receives incoming messages until the peer hangs up, and returns an appropriate reply to each
+        Requests on the same connection are handled concurrently, and replies carry the ID of their request
+        With admission control, the connection is only read from while it has a free slot for another request"""
+        tasks = set()
+        slots = asyncio.Semaphore(self.admission.peer_queue) if self.admission else None
+        limit = self.admission.max_request if self.admission else None
+        # Token buckets are kept per remote host, see Admission.check
+        peername = writer.get_extra_info('peername')
+        host = peername[0] if peername else None
+        try:
+            while True:
+                if slots:
+                    await slots.acquire()
+                request_id, data = await read_packet(reader, limit)
+                self.metrics.increment('bytes.received', FRAME.size + len(data))
+                task = asyncio.create_task(self.handle_request(writer, request_id, data, host))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if slots:
+                    task.add_done_callback(lambda _: slots.release())
+        except NETWORK_ERRORS:
+            pass
+        if tasks:
+            await asyncio.wait(tasks)
+        writer.close()
+
+    async def handle_request(self, writer, request_id, data, host):
+        if self.admission and self.admission.busy():
+            # Shed before decoding, the cheapest way out when every slot of the node is taken
+            self.metrics.increment('admission.busy')
+            await self.reply(writer, request_id, process_message('BUSY', BUSY_RETRY))
+            return
+        try:
+            msgtype, message = extract_data(data)
+        except (TypeError, ValueError, *NETWORK_ERRORS):
+            self.metrics.increment('messages.malformed')
+            await self.reply(writer, request_id, process_message('ERRO', 'Malformed request'))
+            return
+        if self.admission:
+            refused = self.admission.check(host, msgtype, message)
+            if refused is not None:
+                reason, retry_after = refused
+                self.metrics.increment(f'admission.{reason}')
+                logger.debug('Refused %r request: %s', msgtype, reason)
+                await self.reply(writer, request_id, process_message('BUSY', retry_after) if reason == 'limited'
+                                 else process_message('ERRO', f'Malformed {msgtype!r} request'))
+                if retry_after:
+                    # Holds the slot of the connection for as long as the peer was asked to back off, so that a peer
+                    # which ignores BUSY ends up not being read from rather than costing a reply for every request
+                    await asyncio.sleep(min(retry_after, MAX_BACKOFF))
+                return
+            self.admission.inflight += 1
+        logger.debug('Received message %s: %r', msgtype, message)
+        self.metrics.increment(f'messages.received.{msgtype}')
+        try:
+            with self.metrics.timer(f'handle.{msgtype}'):
+                response = Handler(self.maxpeers, verifier=self.verifier, peers=self.peers)
+                anunctype, announcement = await response.handle_data(msgtype, message, self.blo)
+                if announcement is not None:
+                    self.gossip(msgtype, anunctype, announcement)
+            if response.packet:
+                logger.debug('Sending reply to %s', msgtype)
+                await self.reply(writer, request_id, response.packet)
+        finally:
+            if self.admission:
+                self.admission.inflight -= 1
+
+    async def reply(self, writer, request_id, packet):
+        self.metrics.increment('bytes.sent', write_packet(writer, request_id, packet))
+        try:
             await writer.drain()
-            writer.close()
+        except NETWORK_ERRORS:
+            pass
+
+    async def check_transaction(self, host, port, transaction):
+        """Verifies that a peer has mined a transaction, without downloading the block holding it
+        :return: <bool>"""
+        _, reply = await self.send_echo(host, port, 'PROF', transaction_hash(transaction))
+        if reply is None:
+            return False
+        return blockchain.verify_inclusion(transaction, reply["header"], reply["proof"])
 
     async def update_blockchain(self, other_chain):
-        self.blo.chain = other_chain
-        print('The blobchain has been updated with the longest chain')
+        """Replaces the chain with one of more work received in full through BLOB, provided every block checks out
+        :param other_chain: <list> Blocks in the form of Blob.to_dict"""
+        # Validated in a thread, since a long chain keeps the validator busy, waiting on its worker processes
+        loop = asyncio.get_running_loop()
+        invalid = await loop.run_in_executor(None, self.validator.validate_blocks, other_chain)
+        if invalid is not None:
+            logger.warning('Rejected chain from peer, block at height %d is invalid', invalid)
+            return
+        # The chain may have grown while the blocks were validated
+        if self.blo.chain_work() >= sum(mining.block_work(block["target"]) for block in other_chain):
+            return
+        blocks = [blockchain.Blob.from_header(block, block["transactions"]) for block in other_chain]
+        self.blo.miner.cancel()
+        self.blo.replace_from(0, blocks)
+        self.arrival.set()
+        logger.info('The blobchain has been updated with the chain of most work, now %d blocks', len(self.blo.chain))
+
+    async def sync(self, host, port):
+        """Catches up with a peer headers-first, transferring only the blocks after the fork point
+        Headers are fetched and validated in batches, then the bodies are fetched and checked against them
+        :return: <bool> Whether the chain was extended or replaced
+        :raises: one of NETWORK_ERRORS if the peer cannot be reached, stays busy or sends a malformed reply"""
+        height, tip, work = await self.fetch(host, port, 'TIPS', None)
+        if tip in self.blo.heights or not preferred(work, tip, self.blo.chain_work(), self.blo.chain[-1].own_hash):
+            return False
 
-    async def build_peers(self, host, port):
-        try:
-            newpeer = (host, port)
-            if (host != self.host or port != self.port) and (newpeer not in peerlist):
-                if len(peerlist) < self.maxpeers and await self.routine(host, port, 'PING', self.address):
-                    peerlist.append(newpeer)
-                    print(f'{host!r}:{port!r} added to peer list')
-
-                    print(f'Building peers...')
-                    _, reply = await self.send_echo(host, port, 'LIST', None)
-                    reply = ast.literal_eval(str(reply))
-                    for peeraddr in reply:
-                        peerhost, peerport = peeraddr
-                        if peerhost != self.host or peerport != self.port:
-                            try:
-                                await self.build_peers(peerhost, peerport)
-                            except OSError:
-                                pass
-        except OSError:
-            pass
+        began = perf_counter()
+        locator = self.blo.locator()
+        fork, headers = None, []
+
+        def lookup(h):
+            # Timestamps and targets of earlier Blocks, which the retargeting rule looks back on
+            block = headers[h - fork] if h >= fork else self.blo.chain[h].header()
+            return block["timestamp"], block["target"]
+
+        while True:
+            start, batch = await self.fetch(host, port, 'HEAD', (locator, SYNC_BATCH))
+            if fork is None:
+                if not 0 <= start <= len(self.blo.chain):
+                    logger.warning('Stopped syncing with %r:%r, fork point %r is out of range', host, port, start)
+                    return False
+                fork = start
+            for header in batch:
+                if headers:
+                    previous = headers[-1]
+                elif fork > 0:
+                    previous = self.blo.chain[fork - 1].header()
+                else:
+                    previous = None
+                expected = mining.next_target(fork + len(headers), lookup)
+                if not self.blo.valid_header(header, previous, expected):
+                    logger.warning('Stopped syncing with %r:%r, header %r is invalid', host, port, header["index"])
+                    return False
+                headers.append(header)
+            if len(batch) < SYNC_BATCH:
+                break
+            locator = [headers[-1]["own_hash"]]
+
+        # The peer's branch has to be preferred over the Blocks it would replace
+        work = sum(mining.block_work(header["target"]) for header in headers)
+        if not headers or not preferred(work, headers[-1]["own_hash"], self.blo.work_from(fork),
+                                        self.blo.chain[-1].own_hash):
+            return False
+
+        blocks = []
+        for i in range(0, len(headers), SYNC_BATCH):
+            batch = headers[i:i + SYNC_BATCH]
+            bodies = await self.fetch(host, port, 'BODY', [header["own_hash"] for header in batch])
+            if len(bodies) != len(batch):
+                logger.warning('Stopped syncing with %r:%r, %d bodies for %d blocks', host, port, len(bodies),
+                               len(batch))
+                return False
+            for header, transactions in zip(batch, bodies):
+                if transactions is None or not self.blo.valid_body(header, transactions):
+                    logger.warning('Stopped syncing with %r:%r, block %r is invalid', host, port, header["index"])
+                    return False
+                blocks.append(blockchain.Blob.from_header(header, transactions))
+
+        self.blo.miner.cancel()
+        self.blo.replace_from(fork, blocks)
+        # Transactions of replaced Blocks may be back in the mempool
+        self.arrival.set()
+        self.metrics.observe('sync', perf_counter() - began)
+        self.metrics.increment('sync.blocks', len(blocks))
+        logger.info('Synced %d blocks from %r:%r, from height %d', len(blocks), host, port, fork)
+        return True
+
+    async def sync_forever(self):
+        """Syncs with every peer once on joining the network and then every sync_interval seconds
+        A BLOC only carries transactions, so a peer which mined a competing chain is only caught up with here"""
+        while True:
+            for peerhost, peerport in list(self.peers):
+                try:
+                    await self.sync(peerhost, peerport)
+                    self.peers.record((peerhost, peerport), True)
+                except NETWORK_ERRORS as error:
+                    self.peers.record((peerhost, peerport), False)
+                    logger.info('Could not sync with %r:%r: %r', peerhost, peerport, error)
+            await asyncio.sleep(self.sync_interval)
+
+    async def fetch(self, host, port, msgtype, message):
+        """Sends a request of a sync, HEAD and BODY coming back to back and possibly outrunning the rate a peer
+        allows, backing off for as long as the peer asks whenever it sheds the request
+        :return: Reply of the peer, checked against REPLY_SHAPES
+        :raises PeerBusy: if the peer is still busy after SYNC_RETRIES attempts
+        :raises CodecError: if the peer replies with an error or a malformed reply"""
+        for attempt in range(SYNC_RETRIES):
+            try:
+                replytype, reply = await self.send_echo(host, port, msgtype, message)
+                if replytype != f'REPL-{msgtype}' or not REPLY_SHAPES[replytype](reply):
+                    raise CodecError(f'Malformed reply to {msgtype}: {replytype!r}')
+                return reply
+            except PeerBusy as busy:
+                if attempt == SYNC_RETRIES - 1:
+                    raise
+                retry_after = busy.retry_after if isinstance(busy.retry_after, (int, float)) else BUSY_RETRY
+                self.metrics.increment('sync.busy')
+                await asyncio.sleep(min(max(retry_after, BUSY_RETRY), MAX_BACKOFF))
+
+    async def discover(self, seeds, depth=CRAWL_DEPTH, fanout=CRAWL_FANOUT):
+        """Fills the peer table by crawling the network breadth-first from the seeds
+        Every node of a level is queried concurrently, at most fanout at a time, and the peers they list make up
+        the next level, until the table is full or depth levels past the seeds have been crawled
+        :return: <int> Number of nodes queried"""
+        slots = asyncio.Semaphore(fanout)
+        visited = {(self.host, self.port)}
+        level = [tuple(seed) for seed in seeds if address_shape(seed)]
+        queried = 0
+        for _ in range(depth + 1):
+            level = [address for address in dict.fromkeys(level) if address not in visited]
+            visited.update(level)
+            if not level or self.peers.full():
+                break
+            # A node failing in an unexpected way is skipped, rather than ending the crawl of every other node
+            replies = await asyncio.gather(*(self.crawl(address, slots) for address in level), return_exceptions=True)
+            for address, reply in zip(level, replies):
+                if isinstance(reply, Exception):
+                    logger.warning('Could not crawl %r: %r', address, reply)
+            replies = [reply for reply in replies if not isinstance(reply, BaseException)]
+            queried += sum(reply is not None for reply in replies)
+            level = [tuple(address) for reply in replies if reply for address in reply]
+        logger.info('Discovered %d peers after querying %d nodes', len(self.peers), queried)
+        return queried
+
+    async def crawl(self, address, slots):
+        """Asks a node to add this one as a peer, adds it in turn and asks for the peers it knows
+        A node which does not answer LIST with a list of (host, port) counts as failed
+        :return: <list> Addresses listed by the node, or None if it was not queried"""
+        async with slots:
+            if self.peers.full():
+                return None
+            host, port = address
+            try:
+                await asyncio.wait_for(self.send_echo(host, port, 'PING', self.address), self.peer_timeout)
+                self.peers.add(address)
+                replytype, reply = await asyncio.wait_for(self.send_echo(host, port, 'LIST', None),
+                                                          self.peer_timeout)
+                if replytype != 'REPL-LIST' or not REPLY_SHAPES[replytype](reply):
+                    raise CodecError(f'Malformed reply to LIST: {replytype!r}')
+            except NETWORK_ERRORS:
+                self.peers.record(address, False)
+                return []
+            self.peers.record(address, True)
+            return reply
 
 
 class Handler:
-    def __init__(self, maxpeers, PEERHOST=None, PEERPORT=None):
+    def __init__(self, maxpeers, PEERHOST=None, PEERPORT=None, verifier=None, peers=None):
         """The object Handler takes incoming requests and decides how to reply
         PING: adds the sender to the peer list if the maximum has not been reached
         LIST: shares a copy of the full peer list to the sender
-        CASH: puts in proof of work to verify the sent transaction
-        BLOB: shares a copy of the full blockchain to the sender"""
+        CASH: queues the sent transaction in the mempool to be mined into a block
+        BLOB: shares a copy of the full blockchain to the sender
+        PROF: shares the header of the block holding a transaction and its Merkle inclusion proof
+        BEAT: keeps a pooled connection alive
+        TIPS: shares the height, hash of the tip and total work of the blockchain
+        HEAD: shares the headers which follow the fork point found from the sender's block locator
+        BODY: shares the transactions of the requested blocks
+        BALN: shares the balance of an address and its most recent transactions
+        TXNS: queues a batch of transactions from a gateway, like as many CASH, see blobchain.gateway
+        BLCK: shares a block by height or hash, for the block explorer, see blobchain.explorer
+        BLKS: shares a page of consecutive blocks from a height, counted back from the tip if negative
+        TXID: shares a mined transaction by hash, with the block holding it
+        STAT: shares statistics of the blockchain and the mempool
+        With a verifier, transactions of CASH, TXNS and BLOC are only accepted if their signatures are valid
+        :param peers: <class> PeerTable of the node, see blobchain.peertable"""
         self.maxpeers = maxpeers
+        self.peers = PeerTable(maxpeers) if peers is None else peers
         self.peerhost = PEERHOST
         self.peerport = PEERPORT
+        self.verifier = verifier
         self.handlers = {'PING': self.ping_check,
                          'LIST': self.list_peers,
                          'BLOB': self.request_blobchain,
-                         'BLOC': self.fresh_block}
-        # value_handlers have to return values to the BlobNode for further handling
-        self.value_handlers = {'CASH': self.transaction}
+                         'PROF': self.prove_transaction,
+                         'BEAT': self.heartbeat,
+                         'TIPS': self.chain_tip,
+                         'HEAD': self.chain_headers,
+                         'BODY': self.chain_bodies,
+                         'BALN': self.address_balance,
+                         'BLCK': self.chain_block,
+                         'BLKS': self.chain_blocks,
+                         'TXID': self.chain_transaction,
+                         'STAT': self.chain_stats}
+        # value_handlers return (announcement type, transactions) for the BlobNode to mine and then announce
+        self.value_handlers = {'CASH': self.transaction,
+                               'TXNS': self.transactions,
+                               'BLOC': self.fresh_block}
         self.packet = None
 
-    async def handle_data(self, data, blo):
-        msgtype, message = extract_data(data)
-        message = str(message)
-        if msgtype in self.handlers:
-            await self.handlers[msgtype](message, blo)
-            return None, None
-        elif msgtype in self.value_handlers:
-            anunctype, announcement = await self.value_handlers[msgtype](message, blo)
-            return anunctype, announcement
-        else:
+    async def handle_data(self, msgtype, message, blo):
+        try:
+            if msgtype in self.handlers:
+                await self.handlers[msgtype](message, blo)
+                return None, None
+            elif msgtype in self.value_handlers:
+                anunctype, announcement = await self.value_handlers[msgtype](message, blo)
+                return anunctype, announcement
+            else:
+                return None, None
+        except Exception as error:
+            # A request the handler chokes on still gets a reply, rather than leaving the peer waiting for one
+            logger.warning('Could not handle %s request: %r', msgtype, error)
+            self.packet = process_message('ERRO', f'{msgtype} request could not be handled')
             return None, None
 
     async def ping_check(self, message, *args):
         """PING is sent to a peer contact which was not initially in the peer list
         PING includes its message type 'PING' and the sender's contact details, i.e. host and port
-        In response, the receiver checks whether the sender is in the peer list, and if not, adds them"""
-        self.peerhost, self.peerport = ast.literal_eval(message)
+        In response, the receiver checks whether the sender is in the peer list, and if not, adds them
+        A full peer list makes room by evicting a peer which has been failing, see PeerTable.add"""
+        self.peerhost, self.peerport = message
         newpeer = (self.peerhost, self.peerport)
 
-        if newpeer not in peerlist and len(peerlist) < self.maxpeers:
-            peerlist.append(newpeer)
-            print(f'{self.peerhost!r}:{self.peerport!r} added to peer list')
-            replytype, reply = 'REPL-PING', None
+        if newpeer in self.peers:
+            logger.debug('%r:%r is already a peer', self.peerhost, self.peerport)
+            replytype, reply = 'ERRO', 'Request to add was declined, because you are already listed'
             self.packet = process_message(replytype, reply)
 
-        elif newpeer in peerlist:
-            print(f'ALERT: {self.peerhost!r}:{self.peerport!r} is already a peer')
-            replytype, reply = 'ERRO', 'Request to add was declined, because you are already listed'
+        elif self.peers.add(newpeer):
+            logger.info('%r:%r added to peer list', self.peerhost, self.peerport)
+            replytype, reply = 'REPL-PING', None
             self.packet = process_message(replytype, reply)
 
-        elif len(peerlist) < self.maxpeers:
-            print(f'ALERT: peer list has reached its maximum capacity of {self.maxpeers!r}')
+        else:
+            logger.warning('Peer list has reached its maximum capacity of %r', self.maxpeers)
             replytype, reply = 'ERRO', 'Request to add was declined, because maximum number of peers has been reached'
             self.packet = process_message(replytype, reply)
 
     async def list_peers(self, _, *args):
-        """Upon receiving LIST, shares the full peer list to the node which made the request"""
-        replytype, reply = 'REPL-LIST', peerlist
+        """Upon receiving LIST, shares the full peer list to the node which made the request, most live peers first"""
+        replytype, reply = 'REPL-LIST', self.peers.addresses()
         self.packet = process_message(replytype, reply)
 
     async def request_blobchain(self, _, blo):
         blobchain = []
         for blob in blo.chain:
-            blobchain.append(vars(blob))
+            blobchain.append(blob.to_dict())
         replytype, reply = 'REPL-BLOB', blobchain
         self.packet = process_message(replytype, reply)
 
+    async def chain_tip(self, _, blo):
+        replytype, reply = 'REPL-TIPS', (len(blo.chain), blo.chain[-1].own_hash, blo.chain_work())
+        self.packet = process_message(replytype, reply)
+
+    async def chain_headers(self, message, blo):
+        locator, limit = message
+        replytype, reply = 'REPL-HEAD', blo.headers_after(locator, min(limit, SYNC_BATCH))
+        self.packet = process_message(replytype, reply)
+
+    async def chain_bodies(self, message, blo):
+        replytype, reply = 'REPL-BODY', blo.bodies(message[:SYNC_BATCH])
+        self.packet = process_message(replytype, reply)
+
+    async def address_balance(self, message, blo):
+        """Upon receiving BALN with an address, replies from the ledger without scanning the chain"""
+        replytype, reply = 'REPL-BALN', {"balance": blo.balance(message),
+                                         "history": blo.history(message, HISTORY_LIMIT)}
+        self.packet = process_message(replytype, reply)
+
+    async def chain_block(self, message, blo):
+        replytype, reply = 'REPL-BLCK', blo.block(message) if isinstance(message, (int, str)) else None
+        self.packet = process_message(replytype, reply)
+
+    async def chain_blocks(self, message, blo):
+        """Upon receiving BLKS with (start, limit), replies with at most PAGE_LIMIT blocks"""
+        if not (isinstance(message, (list, tuple)) and len(message) == 2 and all(type(n) is int for n in message)):
+            replytype, reply = 'ERRO', 'BLKS expects (start, limit)'
+        else:
+            start, limit = message
+            replytype, reply = 'REPL-BLKS', blo.blocks(start, min(limit, PAGE_LIMIT))
+        self.packet = process_message(replytype, reply)
+
+    async def chain_transaction(self, message, blo):
+        replytype, reply = 'REPL-TXID', blo.transaction(message) if isinstance(message, str) else None
+        self.packet = process_message(replytype, reply)
+
+    async def chain_stats(self, _, blo):
+        replytype, reply = 'REPL-STAT', blo.stats()
+        self.packet = process_message(replytype, reply)
+
+    async def heartbeat(self, *args):
+        replytype, reply = 'REPL-BEAT', None
+        self.packet = process_message(replytype, reply)
+
+    async def prove_transaction(self, message, blo):
+        """Upon receiving PROF with a transaction hash, replies with what a light client needs to verify it"""
+        replytype, reply = 'REPL-PROF', blo.inclusion_proof(message)
+        self.packet = process_message(replytype, reply)
+
     async def fresh_block(self, message, blo):
         """On receiving BLOC, the node updates its own chain and broadcasts the new block to its own peers
         This should result in a network of broadcasts, in order to announce the existence of the new transaction"""
-        transaction = ast.literal_eval(message)
-        recipient = transaction["recipient"]
-        sender = transaction["sender"]
-        amount = transaction["amount"]
-        blo.new_block(recipient, sender, amount)
+        transactions = message
+        replytype, reply = 'REPL-BLOC', None
+        self.packet = process_message(replytype, reply)
+        if self.verifier is not None:
+            transactions = await self.verifier.verify_all(transactions)
+            if not transactions:
+                return None, None
+        return None, transactions
 
     async def transaction(self, message, blo):
-        """The receiver verifies the transaction and mines a new block"""
-        transaction = ast.literal_eval(message)
+        """The receiver verifies the transaction and queues it to be mined into a new block"""
+        transaction = message
         recipient = transaction["recipient"]
         sender = transaction["sender"]
         amount = transaction["amount"]
 
-        blo.new_block(recipient, sender, amount)
-        print(f'{sender} successfully transferred {amount} blobcoin to {recipient}')
+        if self.verifier is not None and not await self.verifier.verify(transaction):
+            logger.warning('Transaction from %s has an invalid signature', sender)
+            replytype, reply = 'ERRO', 'Transaction was declined, because its signature is INVALID'
+            self.packet = process_message(replytype, reply)
+            return None, None
+
+        logger.debug('%s is transferring %s blobcoin to %s', sender, amount, recipient)
         replytype, reply = 'REPL-CASH', None
         self.packet = process_message(replytype, reply)
-        return 'BLOC', transaction
+        return 'BLOC', [transaction]
+
+    async def transactions(self, message, blo):
+        """Upon receiving TXNS, queues every well-formed transaction of the batch and replies with their hashes,
+        which the gateway hands back to its clients as acknowledgements"""
+        transactions = [transaction for transaction in message
+                        if isinstance(transaction, dict) and TRANSACTION_FIELDS.issubset(transaction)]
+        if self.verifier is not None:
+            transactions = await self.verifier.verify_all(transactions)
+        replytype, reply = 'REPL-TXNS', [transaction_hash(transaction) for transaction in transactions]
+        self.packet = process_message(replytype, reply)
+        if not transactions:
+            return None, None
+        return 'BLOC', transactions
 
 
 class ReplyHandler:
     """The object ReplyHandler receives replies from its previous requests and decides how to use the information
     REPL-LIST: adds new peers to the peer list
     REPL-CASH: reports the first instance of a verification of the transaction
-    REPLY-BLOB: compares the highest index in the chain received with its own blobchain"""
-    def __init__(self):
+    REPLY-BLOB: compares the total work of the chain received with that of its own blobchain"""
+    def __init__(self, peers=None):
+        self.peers = PeerTable() if peers is None else peers
         self.handlers = {'REPL-LIST': self.reply_list,
                          'REPL-CASH': self.reply_cash,
                          'REPL-BLOB': self.reply_blob}
 
     async def reply_data(self, command, reply, blockchain):
-        reply = ast.literal_eval(str(reply))
         if command == 'REPL-BLOB':
             return await self.reply_blob(reply, blockchain)
         elif command in self.handlers and not 'REPL-BLOB':
@@ -240,12 +737,13 @@ class ReplyHandler:
             return False, None
 
     async def reply_list(self, reply):
-        newpeers = []
-        for peeraddr in reply:
-            newpeers.append(peeraddr) if peeraddr not in peerlist else newpeers
-        peerlist.extend(newpeers)
-        counter = len(newpeers)
-        print(f'{counter} new peers added to peer list')
+        counter = 0
+        for peeraddr in reply if isinstance(reply, list) else []:
+            if not address_shape(peeraddr):
+                continue
+            if peeraddr not in self.peers and self.peers.add(peeraddr):
+                counter += 1
+        logger.info('%d new peers added to peer list', counter)
         return True, None
 
     async def reply_cash(self, reply):
@@ -253,5 +751,5 @@ class ReplyHandler:
 
     async def reply_blob(self, reply, blockchain):
         other_chain = reply
-        block_num = len(other_chain)
-        return ('UPDATE', other_chain) if len(blockchain) < block_num else (False, None)
+        work = sum(mining.block_work(block["target"]) for block in other_chain)
+        return ('UPDATE', other_chain) if blockchain.chain_work() < work else (False, None)
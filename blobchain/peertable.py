@@ -0,0 +1,90 @@
+from time import monotonic
+
+"""Peers of a node, indexed by address, with how reliably each has answered
+Every peer has a liveness score, a moving average of whether its recent messages got through, which decides
+which peers are shared first in LIST replies and which are evicted when the table is full"""
+
+# Score of a peer which has not been heard from yet
+INITIAL_SCORE = 0.5
+# Weight of the latest outcome in the moving average
+ALPHA = 0.25
+# Score below which a peer is dropped, i.e. after a few failures in a row
+DEAD_SCORE = 0.1
+
+
+class Peer:
+    __slots__ = ("score", "last_seen", "failures")
+
+    def __init__(self):
+        self.score = INITIAL_SCORE
+        self.last_seen = None
+        # Failures in a row, reset whenever the peer answers
+        self.failures = 0
+
+
+class PeerTable:
+    def __init__(self, maxpeers=100):
+        """:param maxpeers: <int> Maximum number of peers"""
+        self.maxpeers = maxpeers
+        # (host, port) -> Peer
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, address):
+        return tuple(address) in self.entries
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
+    def full(self):
+        return len(self.entries) >= self.maxpeers
+
+    def add(self, address):
+        """Adds a peer, evicting the least live peer if the table is full and that peer has been failing
+        :param address: <tuple> (host, port)
+        :return: <bool> Whether the peer is in the table afterwards"""
+        address = tuple(address)
+        if address in self.entries:
+            return True
+        if self.full():
+            worst = min(self.entries, key=self.rank)
+            # A peer which answers as often as not is kept rather than swapped for one nobody has heard from
+            if self.entries[worst].score >= INITIAL_SCORE:
+                return False
+            del self.entries[worst]
+        self.entries[address] = Peer()
+        return True
+
+    def extend(self, addresses):
+        for address in addresses:
+            self.add(address)
+
+    def discard(self, address):
+        self.entries.pop(tuple(address), None)
+
+    def record(self, address, alive):
+        """Updates the liveness of a peer after a message to it got through or not
+        A peer whose score falls below DEAD_SCORE is dropped"""
+        peer = self.entries.get(tuple(address))
+        if peer is None:
+            return
+        peer.score += ALPHA * ((1.0 if alive else 0.0) - peer.score)
+        if alive:
+            peer.last_seen = monotonic()
+            peer.failures = 0
+        else:
+            peer.failures += 1
+            if peer.score < DEAD_SCORE:
+                del self.entries[tuple(address)]
+
+    def rank(self, address):
+        # Orders peers from the least to the most live, those never heard from before those seen long ago
+        peer = self.entries[address]
+        return peer.score, peer.last_seen if peer.last_seen is not None else float('-inf')
+
+    def addresses(self, limit=None):
+        """:return: <list> Addresses of the most live peers first"""
+        ranked = sorted(self.entries, key=self.rank, reverse=True)
+        return ranked if limit is None else ranked[:limit]
@@ -1,16 +1,39 @@
 from hashlib import sha1
 from math import gcd
-from sympy import isprime
 
 """Generation of probable primes p and q using the Shawe-Taylor method
 Implement as parameters for securely generating keys and signatures"""
 
 
+def isprime(n):
+    # sympy takes a good half second to import, so it is only loaded once a domain is actually generated
+    import sympy
+    return sympy.isprime(n)
+
+
+def odd_primes_product(limit):
+    product = 1
+    for n in range(3, limit, 2):
+        if all(n % d for d in range(3, int(n ** 0.5) + 1, 2)):
+            product *= n
+    return product
+
+
+# Product of the odd primes below 2000, so that most composite candidates are ruled out by a single gcd
+SMALL_PRIMES = odd_primes_product(2000)
+
+
 def hash_int(digit):
-    # Converts SHA1 hash to integer
-    digit = str(digit)
-    new_hash = sha1(digit.encode("utf-8")).hexdigest()
-    return int(new_hash, 16)
+    # Converts SHA1 hash to integer, straight from the digest instead of through its hex string
+    return int.from_bytes(sha1(str(digit).encode("utf-8")).digest(), "big")
+
+
+def hash_sum(seed, iterations, outlen):
+    # Concatenates the hashes of seed, seed + 1, ... into one integer, the first hash in the lowest bits
+    x = 0
+    for i in range(iterations):
+        x |= hash_int(seed + i) << (i * outlen)
+    return x
 
 
 class ST_random_prime:
@@ -55,24 +78,26 @@ class ST_random_prime:
 
         iterations = (self.length // self.outlen) - 1
         old_counter = self.prime_gen_counter
+        low, high = 1 << (self.length - 1), 1 << self.length
 
-        x = 0
-        for i in range(iterations):
-            x = x + hash_int(self.prime_seed + i) * (2 ** (i * self.outlen))
+        x = hash_sum(self.prime_seed, iterations, self.outlen)
         self.prime_seed = self.prime_seed + iterations + 1
-        x = 2 ** (self.length - 1) + x % 2 ** (self.length - 1)
+        x = low + x % low
 
         # Generates a candidate prime c in the interval [2 ** (self.length - 1), 2 ** (self.length)]
         t = x // (2 * c0)
         while self.prime_gen_counter <= (4 * self.length + old_counter):
-            if 2 * t * c0 + 1 > 2 ** self.length:
-                t = 2 ** (self.length - 1) // (2 * c0)
+            if 2 * t * c0 + 1 > high:
+                t = low // (2 * c0)
             c = 2 * t * c0 + 1
             self.prime_gen_counter = self.prime_gen_counter + 1
 
-            a = 0
-            for j in range(iterations):
-                a = a + (hash_int(self.prime_seed + j) * 2 ** (j * self.outlen))
+            if gcd(c, SMALL_PRIMES) != 1:
+                # A candidate with a small factor fails the test below anyway, so only the seed is moved on
+                self.prime_seed = self.prime_seed + iterations + 1
+                t += 1
+                continue
+            a = hash_sum(self.prime_seed, iterations, self.outlen)
             self.prime_seed = self.prime_seed + iterations + 1
             a = 2 + a % (c - 3)
             z = pow(a, (2 * t), c)
@@ -88,24 +113,25 @@ class ST_random_prime:
     def find_p(self, q, p0, L, p_seed, pgen_counter):
         iterations = L // self.outlen - 1
         old_counter = pgen_counter
+        low, high = 1 << (L - 1), 1 << L
 
-        x = 0
-        for i in range(iterations):
-            x = x + hash_int(p_seed + i) * (2 ** (i * self.outlen))
+        x = hash_sum(p_seed, iterations, self.outlen)
         p_seed = p_seed + iterations + 1
-        x = 2 ** (L - 1) + x % 2 ** (L - 1)
+        x = low + x % low
 
         c0 = q * p0
         t = x // (2 * c0)
         while pgen_counter <= (4 * L + old_counter):
-            if 2 * t * c0 + 1 > 2 ** L:
-                t = 2 ** (L - 1) // (2 * c0)
+            if 2 * t * c0 + 1 > high:
+                t = low // (2 * c0)
             p = 2 * t * c0 + 1
             pgen_counter = pgen_counter + 1
 
-            a = 0
-            for j in range(iterations):
-                a = a + (hash_int(p_seed + j) * 2 ** (j * self.outlen))
+            if gcd(p, SMALL_PRIMES) != 1:
+                p_seed = p_seed + iterations + 1
+                t += 1
+                continue
+            a = hash_sum(p_seed, iterations, self.outlen)
             p_seed = p_seed + iterations + 1
             a = 2 + a % (p - 3)
             z = pow(a, (2 * t * q), p)
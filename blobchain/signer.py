@@ -0,0 +1,70 @@
+from concurrent.futures import ProcessPoolExecutor
+from blobchain.key_generator import find_nonce
+import queue
+import threading
+
+"""Signing at a high rate with nonces computed ahead of time
+Most of the cost of a DSA signature is r = (g ** k mod p) mod q and the inverse of k, neither of which depends on
+the message, so a background thread keeps a bounded pool of (k, k_inv, r) filled and signing only has to take one"""
+
+POOL_SIZE = 1024
+BATCH = 64
+
+
+def find_nonces(p, q, g, count):
+    # Runs in a worker process
+    return [find_nonce(p, q, g) for _ in range(count)]
+
+
+class Signer:
+    def __init__(self, pair, size=POOL_SIZE, workers=0, batch=BATCH):
+        """:param pair: <class> PairKey whose signatures are produced, see blobchain.key_generator
+        :param size: <int> Most nonces kept ready
+        :param workers: <int> Number of processes computing nonces, 0 computes them in the background thread itself
+        :param batch: <int> Number of nonces computed by a worker at a time"""
+        self.pair = pair
+        self.batch = batch
+        self.nonces = queue.Queue(maxsize=size)
+        self.pool = ProcessPoolExecutor(workers) if workers else None
+        # Number of signatures which found the pool empty and computed their own nonce
+        self.misses = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.refill, daemon=True)
+        self.thread.start()
+
+    def refill(self):
+        p, q, g = self.pair.p, self.pair.q, self.pair.g
+        while not self.stopped.is_set():
+            if self.pool is not None:
+                nonces = self.pool.submit(find_nonces, p, q, g, self.batch).result()
+            else:
+                nonces = [find_nonce(p, q, g)]
+            for nonce in nonces:
+                # Each nonce is only ever handed out once, so one which cannot be queued is simply dropped
+                while not self.stopped.is_set():
+                    try:
+                        self.nonces.put(nonce, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+
+    def sign(self, M):
+        """:param M: <str> Transaction details
+        :return: <tuple> (r, s), as PairKey.gen_signature"""
+        try:
+            nonce = self.nonces.get_nowait()
+        except queue.Empty:
+            self.misses += 1
+            nonce = None
+        return self.pair.gen_signature(M, nonce)
+
+    def ready(self):
+        """:return: <int> Number of nonces waiting in the pool"""
+        return self.nonces.qsize()
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
@@ -0,0 +1,240 @@
+from statistics import median, quantiles
+from time import perf_counter
+from blobchain.connection import NETWORK_ERRORS
+from blobchain.mempool import Mempool, transaction_hash
+import blobchain.blockchain as blockchain
+import blobchain.peer as peer
+import asyncio
+import random
+
+"""Network of BlobNodes on localhost in a single process, for benchmarking changes to the peer and blockchain code
+Nodes are wired up in a chosen topology instead of discovering each other through the sisters, every message between
+two nodes is delayed by the latency of their link and lost with some probability, and a synthetic workload of
+transactions is submitted to random nodes
+See benchmarks.network for the command line"""
+
+TOPOLOGIES = ('full', 'ring', 'star', 'random')
+
+
+def topology(kind, nodes, degree=4, rng=None):
+    """:param kind: <str> One of TOPOLOGIES
+    :param degree: <int> Smallest number of neighbours of a node in a random topology
+    :return: <list> Set of the indexes of the neighbours of each node, every link going both ways"""
+    links = [set() for _ in range(nodes)]
+
+    def link(a, b):
+        if a != b:
+            links[a].add(b)
+            links[b].add(a)
+
+    if kind == 'full':
+        for a in range(nodes):
+            for b in range(a + 1, nodes):
+                link(a, b)
+    elif kind == 'star':
+        for b in range(1, nodes):
+            link(0, b)
+    elif kind in ('ring', 'random'):
+        for a in range(nodes):
+            link(a, (a + 1) % nodes)
+        if kind == 'random':
+            # A ring with random chords, so that the network is always connected
+            rng = rng or random.Random(0)
+            degree = min(degree, nodes - 1)
+            for a in range(nodes):
+                while len(links[a]) < degree:
+                    link(a, rng.randrange(nodes))
+    else:
+        raise ValueError(f'Unknown topology {kind!r}, expected one of {TOPOLOGIES}')
+    return links
+
+
+class Recorder:
+    def __init__(self):
+        """Log of every Block shared by the nodes of a network"""
+        # Block hash -> node name -> time the Block first joined the chain of that node
+        self.arrivals = {}
+        # Block hash -> (node name, time) of the node which mined the Block
+        self.mined = {}
+
+    def appended(self, name, own_hash):
+        self.arrivals.setdefault(own_hash, {}).setdefault(name, perf_counter())
+
+    def found(self, name, own_hash):
+        self.mined.setdefault(own_hash, (name, perf_counter()))
+
+
+class SimChain(blockchain.Blobchain):
+    def __init__(self, name, recorder, **kwargs):
+        """Blobchain which logs every Block it mines or takes on to the recorder"""
+        self.name = name
+        self.recorder = recorder
+        super().__init__(**kwargs)
+
+    def add_block(self, block):
+        super().add_block(block)
+        if block.own_hash in self.heights:
+            self.recorder.found(self.name, block.own_hash)
+
+    def append(self, block):
+        super().append(block)
+        self.recorder.appended(self.name, block.own_hash)
+
+
+class SimNode(peer.BlobNode):
+    def __init__(self, port, network, **kwargs):
+        """BlobNode whose outgoing messages go through the simulated links of the network"""
+        super().__init__(port, network.host, seeds=[], **kwargs)
+        self.network = network
+
+    async def send_echo(self, PEERHOST, PEERPORT, msgtype, message):
+        latency = self.network.latencies.get((self.port, PEERPORT), 0)
+        # The request and the reply each cross the link once, and each may be lost on the way
+        await asyncio.sleep(latency)
+        self.network.lose()
+        reply = await super().send_echo(PEERHOST, PEERPORT, msgtype, message)
+        await asyncio.sleep(latency)
+        self.network.lose()
+        return reply
+
+
+class Network:
+    def __init__(self, nodes=8, kind='random', degree=4, latency=0.01, loss=0.0, sync_interval=0.5,
+                 base_port=10000, host='127.0.0.1', seed=0, mempool_timeout=0.2, max_batch=100):
+        """:param nodes: <int> Number of BlobNodes
+        :param kind: <str> Topology, one of TOPOLOGIES
+        :param degree: <int> Smallest number of neighbours of a node in a random topology
+        :param latency: <float> Mean one-way latency of a link in seconds, each link gets between half and 1.5 times it
+        :param loss: <float> Probability that a request or a reply is lost
+        :param sync_interval: <float> Seconds between two rounds of a node syncing with its neighbours, see BlobNode
+        :param mempool_timeout: <float> Seconds before a partly filled Block is mined, see blobchain.mempool"""
+        self.host = host
+        self.base_port = base_port
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.links = topology(kind, nodes, degree, self.rng)
+        self.recorder = Recorder()
+        # (port, port) -> one-way latency of the link, in both directions
+        self.latencies = {}
+        for a, neighbours in enumerate(self.links):
+            for b in neighbours:
+                if (base_port + b, base_port + a) not in self.latencies:
+                    self.latencies[(base_port + a, base_port + b)] = latency * self.rng.uniform(0.5, 1.5)
+                else:
+                    self.latencies[(base_port + a, base_port + b)] = self.latencies[(base_port + b, base_port + a)]
+
+        self.nodes = []
+        for index in range(nodes):
+            node = SimNode(base_port + index, self, sync_interval=sync_interval)
+            node.blo = SimChain(index, self.recorder, mempool=Mempool(max_batch, mempool_timeout))
+            self.nodes.append(node)
+        # Every node starts from the same genesis Block, as they would after their first sync
+        genesis = self.nodes[0].blo.chain[0]
+        for node in self.nodes[1:]:
+            node.blo.replace_from(0, [genesis])
+        for node, neighbours in zip(self.nodes, self.links):
+            node.peers.extend((host, base_port + index) for index in sorted(neighbours))
+
+        self.dropped = 0
+        # Transaction hash -> time it was submitted
+        self.submitted = {}
+        self.servers = []
+        self.tasks = []
+        self.client = None
+
+    def lose(self):
+        # Raises the way an unreachable peer would, for the given share of messages
+        if self.loss and self.rng.random() < self.loss:
+            self.dropped += 1
+            raise ConnectionResetError('Message lost by the simulated link')
+
+    async def start(self):
+        for node in self.nodes:
+            self.servers.append(await asyncio.start_server(node.handle_echo, self.host, node.port))
+            node.mining = asyncio.create_task(node.mine_forever())
+            node.syncing = asyncio.create_task(node.sync_forever())
+            self.tasks.extend((node.mining, node.syncing))
+        # The workload reaches nodes directly rather than through a simulated link, like a local wallet would
+        self.client = peer.BlobNode(self.base_port - 1, self.host, seeds=[])
+
+    async def workload(self, rate, duration):
+        """Submits transactions to random nodes at a steady rate
+        :param rate: <float> Transactions per second
+        :param duration: <float> Seconds over which they are submitted"""
+        start = perf_counter()
+        count = int(rate * duration)
+        for number in range(count):
+            # Paced against the start rather than by fixed sleeps, so that slow sends do not lower the rate
+            delay = start + number / rate - perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            transaction = {'recipient': f'address{self.rng.randrange(100)}',
+                           'sender': f'address{self.rng.randrange(100)}', 'amount': number}
+            node = self.rng.choice(self.nodes)
+            self.submitted[transaction_hash(transaction)] = perf_counter()
+            try:
+                await self.client.send_echo(self.host, node.port, 'CASH', transaction)
+            except NETWORK_ERRORS:
+                pass
+
+    def converged(self):
+        """:return: <bool> Whether every node holds the same tip and has nothing left to mine"""
+        tip = self.nodes[0].blo.chain[-1].own_hash
+        return all(node.blo.chain[-1].own_hash == tip and not len(node.blo.mempool) for node in self.nodes)
+
+    async def converge(self, timeout=60):
+        """:return: <float> Seconds until the network converged, or None if it did not within timeout"""
+        start = perf_counter()
+        while perf_counter() - start < timeout:
+            if self.converged():
+                return perf_counter() - start
+            await asyncio.sleep(0.01)
+        return None
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        for node in self.nodes:
+            node.blo.miner.cancel()
+            node.pool.close()
+        self.client.pool.close()
+        for server in self.servers:
+            server.close()
+        await asyncio.sleep(0.1)
+
+    def report(self, elapsed):
+        """:param elapsed: <float> Seconds from the start of the workload until the network converged
+        :return: <dict> Throughput, propagation, orphan rate and traffic of the run"""
+        chain = self.nodes[0].blo.chain
+        final = [block.own_hash for block in chain[1:]]
+        included = {transaction_hash(transaction) for block in chain[1:] for transaction in block.transactions}
+        included &= set(self.submitted)
+        # Time for a Block of the final chain to reach every node after it was mined
+        propagation = [max(self.recorder.arrivals[own_hash].values()) - self.recorder.mined[own_hash][1]
+                       for own_hash in final if own_hash in self.recorder.mined]
+        orphans = len(set(self.recorder.mined) - set(final))
+        messages = sum(count for node in self.nodes for name, count in node.metrics.counters.items()
+                       if name.startswith('messages.sent.'))
+        return {"transactions": len(self.submitted), "included": len(included),
+                "transactions_per_second": len(included) / elapsed if elapsed else 0.0,
+                "blocks": len(final), "mined": len(self.recorder.mined),
+                "orphan_rate": orphans / len(self.recorder.mined) if self.recorder.mined else 0.0,
+                "propagation_median": median(propagation) if propagation else None,
+                "propagation_p90": quantiles(propagation, n=10, method='inclusive')[8]
+                if len(propagation) > 1 else None,
+                "messages": messages, "lost": self.dropped,
+                "bytes": sum(node.pool.traffic["sent"] for node in self.nodes)}
+
+
+async def run(network, rate, duration, timeout=60):
+    """Starts the network, replays the workload, and waits for it to converge
+    :return: <dict> Network.report, with the convergence time after the workload"""
+    await network.start()
+    start = perf_counter()
+    await network.workload(rate, duration)
+    convergence = await network.converge(timeout)
+    elapsed = perf_counter() - start
+    await network.stop()
+    report = network.report(elapsed)
+    report["convergence"] = convergence
+    return report
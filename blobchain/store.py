@@ -0,0 +1,365 @@
+from collections import OrderedDict
+from collections.abc import Sequence
+from struct import Struct
+from blobchain.codec import encode, decode
+import blobchain.mining as mining
+import mmap
+import os
+
+"""Append-only storage of the chain on disk
+blocks.dat holds every Block as a length-prefixed record, see blobchain.codec
+heights.idx holds the offset of each record by height, and hashes.idx the raw SHA256 hash of each Block by height
+works.idx holds the total work of the chain up to and including each height, so that the work of a chain is known
+without decoding its Blocks
+lookup.idx is a hash table from the hash of each Block to its height, see HashIndex
+The indexes are fixed-width and memory-mapped, so any Block is found in O(1) and only read when it is used"""
+
+LENGTH = Struct('!I')
+OFFSET = Struct('!Q')
+HASH_SIZE = 32
+# Bytes of each total work, a Block of the hardest target counting for 2 ** 255 hashes
+WORK_SIZE = 48
+# Heights indexed and slots taken, ahead of the slots of a HashIndex
+HEADER = Struct('!QQ')
+SLOT = Struct('!Q')
+MIN_SLOTS = 1024
+
+
+class BlockStore:
+    def __init__(self, directory, sync_every=100):
+        """Opens the store, creating it if needed, and drops any record left incomplete by a crash
+        :param directory: <str> Folder holding the segment and index files
+        :param sync_every: <int> Number of appended Blocks between two fsyncs"""
+        os.makedirs(directory, exist_ok=True)
+        self.sync_every = sync_every
+        self.unsynced = 0
+        self.segment = open(os.path.join(directory, 'blocks.dat'), 'a+b')
+        self.offsets = open(os.path.join(directory, 'heights.idx'), 'a+b')
+        self.hashes = open(os.path.join(directory, 'hashes.idx'), 'a+b')
+        self.works = open(os.path.join(directory, 'works.idx'), 'a+b')
+        self.lookup_path = os.path.join(directory, 'lookup.idx')
+        self.offset_map = self.hash_map = None
+        self.length = 0
+        # Total work of every Block stored
+        self.total = 0
+        # HashIndex of the hashes, opened and caught up with the chain the first time a hash is looked up
+        self.lookup = None
+        self.recover()
+
+    def recover(self):
+        # Keeps the longest prefix of heights whose records were fully written
+        segment_size = os.fstat(self.segment.fileno()).st_size
+        length = min(os.fstat(self.offsets.fileno()).st_size // OFFSET.size,
+                     os.fstat(self.hashes.fileno()).st_size // HASH_SIZE)
+        self.length = length
+        self.remap()
+        while self.length > 0:
+            offset = self.offset(self.length - 1)
+            if offset + LENGTH.size <= segment_size:
+                size, = LENGTH.unpack(os.pread(self.segment.fileno(), LENGTH.size, offset))
+                if offset + LENGTH.size + size <= segment_size:
+                    break
+            self.length -= 1
+        self.truncate(self.length)
+
+        # A store written before works.idx existed, or whose last entries were lost in a crash, has the missing
+        # totals summed from its Blocks once
+        known = os.fstat(self.works.fileno()).st_size // WORK_SIZE
+        self.total = self.work(known)
+        for height in range(known, self.length):
+            self.total += mining.block_work(self.read(height)["target"])
+            self.works.write(self.total.to_bytes(WORK_SIZE, 'big'))
+        self.works.flush()
+
+    def remap(self):
+        for mapped in (self.offset_map, self.hash_map):
+            if mapped is not None:
+                mapped.close()
+        self.offset_map = self.hash_map = None
+        if self.length:
+            self.offset_map = mmap.mmap(self.offsets.fileno(), self.length * OFFSET.size, access=mmap.ACCESS_READ)
+            self.hash_map = mmap.mmap(self.hashes.fileno(), self.length * HASH_SIZE, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.length
+
+    def offset(self, height):
+        if self.offset_map is None or (height + 1) * OFFSET.size > len(self.offset_map):
+            # Heights appended since the last remap are read from the file directly
+            return OFFSET.unpack(os.pread(self.offsets.fileno(), OFFSET.size, height * OFFSET.size))[0]
+        return OFFSET.unpack_from(self.offset_map, height * OFFSET.size)[0]
+
+    def block_hash(self, height):
+        """:return: <str> Hex hash of the Block at height"""
+        return self.raw_hash(height).hex()
+
+    def raw_hash(self, height):
+        if self.hash_map is None or (height + 1) * HASH_SIZE > len(self.hash_map):
+            return os.pread(self.hashes.fileno(), HASH_SIZE, height * HASH_SIZE)
+        return self.hash_map[height * HASH_SIZE:(height + 1) * HASH_SIZE]
+
+    def height(self, own_hash):
+        """:return: <int> Height of the Block with the given hex hash, or None"""
+        try:
+            raw = bytes.fromhex(own_hash)
+        except (ValueError, TypeError):
+            return None
+        if len(raw) != HASH_SIZE:
+            return None
+        if self.lookup is None:
+            self.lookup = HashIndex(self.lookup_path, self.raw_hash)
+        if self.lookup.indexed < self.length:
+            self.lookup.catch_up(self.length)
+        return self.lookup.find(raw, self.length)
+
+    def work(self, length):
+        """:return: <int> Total work of the first length Blocks"""
+        if length == 0:
+            return 0
+        return int.from_bytes(os.pread(self.works.fileno(), WORK_SIZE, (length - 1) * WORK_SIZE), 'big')
+
+    def read(self, height):
+        """:return: <dict> Block stored at height"""
+        offset = self.offset(height)
+        size, = LENGTH.unpack(os.pread(self.segment.fileno(), LENGTH.size, offset))
+        return decode(os.pread(self.segment.fileno(), size, offset + LENGTH.size))
+
+    def append(self, block, own_hash):
+        """:param block: <dict> Block to store
+        :param own_hash: <str> Hex hash of the Block"""
+        payload = encode(block)
+        self.segment.seek(0, os.SEEK_END)
+        offset = self.segment.tell()
+        self.segment.write(LENGTH.pack(len(payload)) + payload)
+        # The record is written before the index entries which point to it
+        self.segment.flush()
+        self.offsets.write(OFFSET.pack(offset))
+        self.hashes.write(bytes.fromhex(own_hash))
+        self.total += mining.block_work(block["target"])
+        self.works.write(self.total.to_bytes(WORK_SIZE, 'big'))
+        self.offsets.flush()
+        self.hashes.flush()
+        self.works.flush()
+        if self.lookup is not None and self.lookup.indexed == self.length:
+            self.lookup.insert(bytes.fromhex(own_hash), self.length)
+        self.length += 1
+
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        # The segment reaches the disk before the indexes, so a synced index never points past the data
+        os.fsync(self.segment.fileno())
+        os.fsync(self.offsets.fileno())
+        os.fsync(self.hashes.fileno())
+        os.fsync(self.works.fileno())
+        if self.lookup is not None:
+            self.lookup.sync()
+        self.unsynced = 0
+        self.remap()
+
+    def truncate(self, length):
+        """Drops every Block from height length onwards, e.g. when the chain is reorganised"""
+        # The hash table is opened even if it is not in use yet, so that it never counts the dropped heights as indexed
+        if self.lookup is None and os.path.exists(self.lookup_path):
+            self.lookup = HashIndex(self.lookup_path, self.raw_hash)
+        if self.lookup is not None:
+            self.lookup.truncate(length)
+        end = 0
+        if length > 0:
+            # The segment is cut right after the last record kept, which also drops any half-written record
+            offset = self.offset(length - 1)
+            end = offset + LENGTH.size + LENGTH.unpack(os.pread(self.segment.fileno(), LENGTH.size, offset))[0]
+        self.length = length
+        self.remap()
+        self.segment.truncate(end)
+        self.offsets.truncate(length * OFFSET.size)
+        self.hashes.truncate(length * HASH_SIZE)
+        # Totals past the Blocks kept are cut, and missing ones are filled in by recover
+        known = min(os.fstat(self.works.fileno()).st_size // WORK_SIZE, length)
+        self.works.truncate(known * WORK_SIZE)
+        self.total = self.work(known)
+        self.sync()
+
+    def close(self):
+        self.sync()
+        self.offset_map = self.hash_map = None
+        if self.lookup is not None:
+            self.lookup.close()
+            self.lookup = None
+        for handle in (self.segment, self.offsets, self.hashes, self.works):
+            handle.close()
+
+
+class HashIndex:
+    def __init__(self, path, raw_hash):
+        """Hash -> height index of a BlockStore, kept in a memory-mapped file instead of a dict in memory
+        An open-addressing table with linear probing, whose slots hold the height + 1 of a Block, or 0 if empty, from
+        the position given by the first 8 bytes of its hash
+        Every match is confirmed against the hash stored at its height, so the entries a truncation leaves behind
+        never match and are reused by later Blocks, and the table only ever needs to catch up with the store
+        :param path: <str> File holding the table
+        :param raw_hash: <function> height -> raw hash of the Block at that height"""
+        self.raw_hash = raw_hash
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        self.map = None
+        size = os.fstat(self.fd).st_size
+        slots = (size - HEADER.size) // SLOT.size
+        # A file of any other size than a power of two of slots, e.g. a new one, starts as an empty table
+        if slots < MIN_SLOTS or slots & (slots - 1) or size != HEADER.size + slots * SLOT.size:
+            self.resize(MIN_SLOTS)
+        else:
+            self.slots = slots
+            self.map = mmap.mmap(self.fd, size)
+            # Number of heights from 0 which are in the table, and number of slots which are not empty
+            self.indexed, self.used = HEADER.unpack_from(self.map, 0)
+
+    def resize(self, slots):
+        # Empties the table into the given number of slots, so that it has to catch up again
+        if self.map is not None:
+            self.map.close()
+        os.ftruncate(self.fd, 0)
+        os.ftruncate(self.fd, HEADER.size + slots * SLOT.size)
+        self.slots = slots
+        self.map = mmap.mmap(self.fd, HEADER.size + slots * SLOT.size)
+        self.indexed = self.used = 0
+        self.save()
+
+    def save(self):
+        HEADER.pack_into(self.map, 0, self.indexed, self.used)
+
+    def catch_up(self, length):
+        """Adds the heights below length which are missing from the table, e.g. every height of an older store"""
+        self.indexed = min(self.indexed, length)
+        if 2 * (self.used + length - self.indexed) > self.slots:
+            # Sized for every height at once, rather than growing one doubling at a time
+            self.resize(max(MIN_SLOTS, 1 << (4 * length).bit_length()))
+        for height in range(self.indexed, length):
+            self.insert(self.raw_hash(height), height)
+        self.save()
+
+    def find(self, raw, length):
+        """:param length: <int> Number of Blocks in the store, entries at or above which are left over
+        :return: <int> Height of the Block with the given raw hash, or None"""
+        mask = self.slots - 1
+        slot = int.from_bytes(raw[:8], 'big') & mask
+        while True:
+            entry, = SLOT.unpack_from(self.map, HEADER.size + slot * SLOT.size)
+            if not entry:
+                return None
+            if entry <= length and self.raw_hash(entry - 1) == raw:
+                return entry - 1
+            slot = (slot + 1) & mask
+
+    def insert(self, raw, height):
+        """Adds the Block at height, the first height which is not indexed yet"""
+        if 2 * (self.used + 1) > self.slots:
+            # Rebuilt at a quarter full, so that rebuilding costs O(1) per Block over time
+            self.resize(max(MIN_SLOTS, 1 << (4 * (height + 1)).bit_length()))
+            self.catch_up(height)
+        mask = self.slots - 1
+        slot = int.from_bytes(raw[:8], 'big') & mask
+        while True:
+            entry, = SLOT.unpack_from(self.map, HEADER.size + slot * SLOT.size)
+            if not entry:
+                self.used += 1
+                break
+            if entry > height:
+                # Left over by a truncation
+                break
+            slot = (slot + 1) & mask
+        SLOT.pack_into(self.map, HEADER.size + slot * SLOT.size, height + 1)
+        self.indexed = height + 1
+        self.save()
+
+    def truncate(self, length):
+        self.indexed = min(self.indexed, length)
+        self.save()
+
+    def sync(self):
+        self.map.flush()
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+class StoredChain(Sequence):
+    def __init__(self, store, cache_size=1024):
+        """A chain which reads its Blocks from a BlockStore on demand, and keeps only the most recent ones in memory
+        Supports what Blobchain does with a list: len, indexing, slicing, iteration, append and deleting a tail
+        :param cache_size: <int> Number of decoded Blocks kept in memory"""
+        self.store = store
+        self.cache_size = cache_size
+        # Height -> Blob
+        self.cache = OrderedDict()
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[height] for height in range(*item.indices(len(self)))]
+        height = item + len(self) if item < 0 else item
+        if not 0 <= height < len(self):
+            raise IndexError('chain index out of range')
+        if height in self.cache:
+            self.cache.move_to_end(height)
+            return self.cache[height]
+        block = self.load(self.store.read(height))
+        self.remember(height, block)
+        return block
+
+    def __delitem__(self, item):
+        if not isinstance(item, slice) or item.step is not None or item.stop is not None:
+            raise TypeError('only the tail of a stored chain can be deleted')
+        start = item.indices(len(self))[0]
+        for height in [height for height in self.cache if height >= start]:
+            del self.cache[height]
+        self.store.truncate(start)
+
+    def work_before(self, height):
+        """:return: <int> Total work of the Blocks below height, from the store rather than by decoding them"""
+        return self.store.work(height)
+
+    def append(self, block):
+        self.store.append(block.to_dict(), block.own_hash)
+        self.remember(len(self) - 1, block)
+
+    def remember(self, height, block):
+        self.cache[height] = block
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    @staticmethod
+    def load(record):
+        # Imported here, since blobchain.blockchain builds on this module
+        from blobchain.blockchain import Blob
+        return Blob.from_header(record, record["transactions"])
+
+
+class StoredHeights:
+    def __init__(self, store):
+        """Hash -> height lookups for a StoredChain, answered from the store's hash index instead of a dict
+        Blobchain writes to it as it would to a dict, and the store already records every append and truncation"""
+        self.store = store
+
+    def __contains__(self, own_hash):
+        return self.store.height(own_hash) is not None
+
+    def __getitem__(self, own_hash):
+        height = self.store.height(own_hash)
+        if height is None:
+            raise KeyError(own_hash)
+        return height
+
+    def get(self, own_hash, default=None):
+        height = self.store.height(own_hash)
+        return default if height is None else height
+
+    def __setitem__(self, own_hash, height):
+        pass
+
+    def __delitem__(self, own_hash):
+        pass
@@ -0,0 +1,123 @@
+from concurrent.futures import ProcessPoolExecutor
+from blobchain.blockchain import header_hash, work_hash
+from blobchain.mempool import transaction_hash
+from blobchain.merkle import unique_root
+import blobchain.mining as mining
+import os
+
+"""Validation of whole chains
+Linkage between Blocks is checked in order, which is cheap, while the hash checks of each Block are independent
+and run in parallel over chunks of the chain in a pool of worker processes"""
+
+CHUNK = 5000
+
+
+def record(block):
+    # Flattens a Blob, or a Block received from a peer as a dict, into a tuple which is cheap to send to a worker
+    if not isinstance(block, dict):
+        return (block.index, block.timestamp, block.previous_hash, block.merkle_root, block.target, block.nonce,
+                block.own_hash, block.transactions)
+    return (block["index"], block["timestamp"], block["previous_hash"], block["merkle_root"], block["target"],
+            block["nonce"], block["own_hash"], block["transactions"])
+
+
+def check_records(records):
+    """Checks the header hash, Proof of Work and Merkle root of every Block, against the target each one carries
+    A Block repeating a transaction is invalid, see blobchain.merkle.unique_root
+    :return: <int> Offset of the first invalid Block in records, or None"""
+    for offset, (index, timestamp, previous_hash, merkle_root, target, nonce, own_hash, transactions) \
+            in enumerate(records):
+        if nonce is None or header_hash(index, timestamp, previous_hash, merkle_root, target) != own_hash:
+            return offset
+        if int.from_bytes(work_hash(own_hash, nonce), 'big') > target:
+            return offset
+        if unique_root([transaction_hash(t) for t in transactions]) != merkle_root:
+            return offset
+    return None
+
+
+def check_targets(blocks, records, start):
+    """Checks that every Block carries the target which the retargeting rule gives for its height
+    :param records: <list> Records of the Blocks from height start onwards
+    :return: <int> Height of the first Block with the wrong target, or None"""
+    def lookup(height):
+        # Blocks before start are trusted, and only read for the timestamps and targets a retarget looks back on
+        fields = records[height - start] if height >= start else record(blocks[height])
+        return fields[1], fields[4]
+
+    for offset, fields in enumerate(records):
+        if fields[4] != mining.next_target(start + offset, lookup):
+            return start + offset
+    return None
+
+
+class ChainValidator:
+    def __init__(self, workers=None, chunk=CHUNK):
+        """:param workers: <int> Number of processes, defaults to the number of cores, 0 validates in-process
+        :param chunk: <int> Number of Blocks checked by a worker at a time"""
+        self.workers = os.cpu_count() if workers is None else workers
+        self.chunk = chunk
+        self.pool = None
+        # (height, hash) of the last Block known to be valid
+        self.checkpoint = None
+
+    def validate(self, blo):
+        """Validates a Blobchain incrementally, from the last checkpoint onwards if it is still part of the chain
+        :return: <int> Height of the first invalid Block, or None if the chain is valid"""
+        start = 0
+        if self.checkpoint is not None:
+            height, own_hash = self.checkpoint
+            if height < len(blo.chain) and blo.chain[height].own_hash == own_hash:
+                start = height + 1
+        invalid = self.validate_blocks(blo.chain, start)
+        if invalid is None:
+            self.checkpoint = (len(blo.chain) - 1, blo.chain[-1].own_hash)
+        return invalid
+
+    def validate_blocks(self, blocks, start=0):
+        """:param blocks: <list> Blobs, or Blocks received from a peer as dicts
+        :param start: <int> Height of the first Block to check, the ones before it are trusted
+        :return: <int> Height of the first invalid Block, or None"""
+        if hasattr(blocks, "broken_link"):
+            # A ColumnarChain checks linkage over whole columns at once, see blobchain.columnar
+            broken = blocks.broken_link(start)
+            if broken is not None:
+                return broken
+            records = blocks.records(start)
+        else:
+            records = [record(block) for block in blocks[max(start - 1, 0):]]
+            offset = 1 if start > 0 else 0
+
+            # Linkage is checked first, as it costs a comparison per Block
+            for i in range(1, len(records)):
+                if records[i][2] != records[i - 1][6]:
+                    return start + i - offset
+            records = records[offset:]
+
+        invalid = check_targets(blocks, records, start)
+        if invalid is not None:
+            return invalid
+        if self.workers == 0 or len(records) <= self.chunk:
+            invalid = check_records(records)
+            return None if invalid is None else start + invalid
+        return self.check_parallel(records, start)
+
+    def check_parallel(self, records, start):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers)
+        futures = [(position, self.pool.submit(check_records, records[position:position + self.chunk]))
+                   for position in range(0, len(records), self.chunk)]
+
+        # Chunks are awaited in order, and every chunk after the first failure is cancelled
+        for i, (position, future) in enumerate(futures):
+            invalid = future.result()
+            if invalid is not None:
+                for _, later in futures[i + 1:]:
+                    later.cancel()
+                return start + position + invalid
+        return None
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
@@ -0,0 +1,171 @@
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from hashlib import sha256
+from blobchain.cache import LRUCache
+from blobchain.key_generator import FixedBase, check_signature
+import asyncio
+import os
+
+"""Verification of signed transactions in batches
+Signatures waiting to be verified are collected for a few milliseconds, grouped by public key and verified across
+a pool of worker processes, each keeping the FixedBase tables of the keys it has seen, see blobchain.key_generator
+The sender of a signed transaction is the address of its public key, so that a key can only spend from its own address
+Results are cached by (message hash, r, s), so a transaction relayed by many peers is verified once"""
+
+BATCH = 256
+MAX_WAIT = 0.005
+# Largest accepted bit lengths of p and q, so that a peer cannot make a worker build tables for huge keys
+MAX_L, MAX_N = 3072, 256
+# Public key -> FixedBase tables of g and y, kept by each worker process from one batch to the next
+TABLES = LRUCache(maxsize=64)
+
+
+def signing_message(transaction):
+    # Everything the signature commits to, i.e. the whole transaction except the signature itself
+    return repr(sorted((field, value) for field, value in transaction.items() if field != "signature"))
+
+
+def key_address(key):
+    """:param key: <list> Public key (p, q, g, y)
+    :return: <str> Address which only the holder of the key can send from"""
+    return sha256(repr([int(n) for n in key]).encode()).hexdigest()
+
+
+def sign_transaction(pair, transaction, signer=None):
+    """:param pair: <class> PairKey of the sender, see blobchain.key_generator
+    :param transaction: <dict> Transaction of the form {"recipient": <str>, "amount": <int>}
+    :param signer: <class> Signer of the same PairKey with precomputed nonces, see blobchain.signer
+    :return: <dict> Copy of the transaction sent from the address of the key, carrying the public key (p, q, g, y)
+    and the signature (r, s)"""
+    key = [pair.p, pair.q, pair.g, pair.y]
+    signed = dict(transaction, sender=key_address(key), key=key)
+    message = signing_message(signed)
+    signed["signature"] = list(pair.gen_signature(message) if signer is None else signer.sign(message))
+    return signed
+
+
+def unpack(transaction):
+    """:return: <tuple> (public key, message, r, s), or None if the transaction is not properly signed, or its
+    sender is not the address of its key"""
+    try:
+        p, q, g, y = transaction["key"]
+        r, s = transaction["signature"]
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not all(type(n) is int for n in (p, q, g, y, r, s)):
+        return None
+    if not (1 < q < p and 1 < g < p and 1 < y < p) or p.bit_length() > MAX_L or q.bit_length() > MAX_N:
+        return None
+    if transaction.get("sender") != key_address((p, q, g, y)):
+        return None
+    return (p, q, g, y), signing_message(transaction), r, s
+
+
+def verify_batch(batch):
+    """Runs in a worker process
+    :param batch: <list> (public key, message, r, s), grouped by public key
+    :return: <list> Whether each signature is valid"""
+    results = []
+    for key, M, r, s in batch:
+        p, q, g, y = key
+        tables = TABLES.get(key)
+        if tables is None:
+            tables = (FixedBase(g, p, q.bit_length()), FixedBase(y, p, q.bit_length()))
+            TABLES.put(key, tables)
+        try:
+            results.append(check_signature(tables, q, q.bit_length(), M, r, s))
+        except (ValueError, ArithmeticError):
+            # s has no inverse modulo q, which unpack cannot rule out when q is not prime
+            results.append(False)
+    return results
+
+
+class BatchVerifier:
+    def __init__(self, workers=None, batch_size=BATCH, max_wait=MAX_WAIT, cache_size=100000):
+        """:param workers: <int> Number of processes, defaults to the number of cores, 0 verifies in-process
+        :param batch_size: <int> Number of pending signatures which triggers a batch straight away
+        :param max_wait: <float> Seconds a signature waits for others before its batch is verified anyway
+        :param cache_size: <int> Number of results remembered"""
+        self.workers = os.cpu_count() if workers is None else workers
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.pool = None
+        self.results = LRUCache(cache_size)
+        # (message hash, r, s) -> ((public key, message, r, s), Future), waiting for the next batch
+        self.pending = {}
+        self.flusher = None
+        self.batches = set()
+
+    async def verify(self, transaction):
+        """:return: <bool> Whether the transaction carries a valid signature"""
+        item = unpack(transaction)
+        if item is None:
+            return False
+        _, M, r, s = item
+        cache_key = (sha256(M.encode()).hexdigest(), r, s)
+        valid = self.results.get(cache_key)
+        if valid is not None:
+            return valid
+
+        if cache_key in self.pending:
+            future = self.pending[cache_key][1]
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self.pending[cache_key] = (item, future)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+            elif self.flusher is None:
+                self.flusher = asyncio.get_running_loop().call_later(self.max_wait, self.flush)
+        # Shielded, since the same signature may be awaited by several messages
+        return await asyncio.shield(future)
+
+    async def verify_all(self, transactions):
+        """:return: <list> Transactions whose signatures are valid, in their original order"""
+        results = await asyncio.gather(*(self.verify(transaction) for transaction in transactions))
+        return [transaction for transaction, valid in zip(transactions, results) if valid]
+
+    def flush(self):
+        # Hands every pending signature over to a batch
+        if self.flusher is not None:
+            self.flusher.cancel()
+            self.flusher = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        task = asyncio.ensure_future(self.run(batch))
+        self.batches.add(task)
+        task.add_done_callback(self.batches.discard)
+
+    async def run(self, batch):
+        # Signatures of the same key are kept together, so that each worker builds the tables of few keys
+        cache_keys = sorted(batch, key=lambda cache_key: batch[cache_key][0][0])
+        items = [batch[cache_key][0] for cache_key in cache_keys]
+        try:
+            if self.workers == 0:
+                results = verify_batch(items)
+            else:
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(self.workers)
+                size = -(-len(items) // self.workers)
+                loop = asyncio.get_running_loop()
+                parts = await asyncio.gather(*(loop.run_in_executor(self.pool, verify_batch, items[i:i + size])
+                                               for i in range(0, len(items), size)))
+                results = [valid for part in parts for valid in part]
+        except Exception as error:
+            # Fails every signature of the batch, so that none of their messages waits forever
+            if isinstance(error, BrokenExecutor):
+                self.pool = None
+            for _, future in batch.values():
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        for cache_key, valid in zip(cache_keys, results):
+            self.results.put(cache_key, valid)
+            future = batch[cache_key][1]
+            if not future.done():
+                future.set_result(valid)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
@@ -0,0 +1,65 @@
+from blobchain.admission import MAX_ITEMS, SHAPES, Admission, TokenBucket
+import unittest
+
+"""Shapes and rate limits which requests are admitted against, before any handler runs"""
+
+TRANSACTION = {"sender": "alice", "recipient": "bob", "amount": 1}
+HASH = "ab" * 32
+
+
+class ShapeTest(unittest.TestCase):
+    def setUp(self):
+        self.admission = Admission()
+
+    def admitted(self, msgtype, message):
+        return self.admission.check('10.0.0.1', msgtype, message) is None
+
+    def test_well_formed(self):
+        for msgtype, message in (('PING', ['127.0.0.1', 5000]), ('LIST', None), ('TIPS', None),
+                                 ('HEAD', [[HASH], 500]), ('HEAD', ([], 1)), ('BODY', [HASH, HASH]), ('BODY', []),
+                                 ('CASH', TRANSACTION), ('BLOC', [TRANSACTION]), ('PROF', HASH), ('BALN', 'bob'),
+                                 ('BLCK', 3), ('BLCK', HASH), ('BLKS', [0, 10])):
+            self.assertTrue(self.admitted(msgtype, message), msg=(msgtype, message))
+
+    def test_malformed(self):
+        for msgtype, message in (('PING', ['127.0.0.1', '5000']), ('PING', '127.0.0.1'),
+                                 ('HEAD', [[{}], 5]), ('HEAD', [[1], 5]), ('HEAD', [HASH, 5]), ('HEAD', [[HASH], True]),
+                                 ('HEAD', [[HASH]]), ('BODY', [[1]]), ('BODY', [HASH, None]), ('BODY', HASH),
+                                 ('BODY', [HASH] * (MAX_ITEMS + 1)), ('CASH', {"sender": "alice"}),
+                                 ('BLOC', [TRANSACTION, 5]), ('PROF', 5), ('BLCK', 1.5), ('BLCK', [1]),
+                                 ('BLKS', [0, '10']), ('XXXX', None), (5, None)):
+            self.assertEqual(self.admission.check('10.0.0.1', msgtype, message), ('malformed', None),
+                             msg=(msgtype, message))
+
+    def test_every_message_type_has_a_shape(self):
+        self.assertTrue(set(self.admission.rates).issubset(SHAPES))
+
+
+class RateTest(unittest.TestCase):
+    def test_bucket_refills(self):
+        bucket = TokenBucket(rate=1000, burst=2)
+        self.assertTrue(bucket.take())
+        self.assertTrue(bucket.take())
+        bucket.tokens, bucket.updated = 0, bucket.updated - 0.01
+        self.assertTrue(bucket.take())
+
+    def test_burst_is_limited_per_host(self):
+        admission = Admission(rates={'TIPS': (0.001, 3)})
+        for _ in range(3):
+            self.assertIsNone(admission.check('10.0.0.1', 'TIPS', None))
+        reason, retry_after = admission.check('10.0.0.1', 'TIPS', None)
+        self.assertEqual(reason, 'limited')
+        self.assertGreater(retry_after, 0)
+        # Another host has a bucket of its own, and another message type too
+        self.assertIsNone(admission.check('10.0.0.2', 'TIPS', None))
+        self.assertIsNone(admission.check('10.0.0.1', 'LIST', None))
+
+    def test_forgotten_hosts(self):
+        admission = Admission(rates={'TIPS': (0.001, 1)}, max_hosts=2)
+        for host in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+            self.assertIsNone(admission.check(host, 'TIPS', None))
+        self.assertEqual(len(admission.buckets), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
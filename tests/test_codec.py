@@ -0,0 +1,58 @@
+from blobchain.codec import CodecError, SIZE, decode, encode
+import unittest
+
+"""Round trips of the codec, and the errors it raises for malformed input"""
+
+VALUE = {"index": 3, "timestamp": 1.25, "own_hash": "ab" * 32, "key": [2 ** 1000, -2 ** 70], "flags": (True, False),
+         "raw": b"\x00\xff", "text": "blobcoin é", "nothing": None, "transactions": [{"amount": -5}]}
+
+
+class CodecTest(unittest.TestCase):
+    def test_round_trip(self):
+        self.assertEqual(decode(encode(VALUE)), VALUE)
+
+    def test_unsupported_type(self):
+        with self.assertRaises(CodecError):
+            encode({1, 2})
+
+    def test_truncated(self):
+        data = encode(VALUE)
+        for end in range(len(data)):
+            with self.assertRaises(CodecError, msg=f'cut at byte {end}'):
+                decode(data[:end])
+
+    def test_trailing_bytes(self):
+        with self.assertRaises(CodecError):
+            decode(encode(VALUE) + b'N')
+
+    def test_unknown_tag(self):
+        with self.assertRaises(CodecError):
+            decode(b'z')
+        with self.assertRaises(CodecError):
+            decode(b'l' + SIZE.pack(1) + b'?')
+
+    def test_size_past_the_end(self):
+        for tag in (b's', b'b', b'I'):
+            with self.assertRaises(CodecError):
+                decode(tag + SIZE.pack(2 ** 32 - 1) + b'abc')
+
+    def test_count_past_the_end(self):
+        for tag in (b'l', b't', b'm'):
+            with self.assertRaises(CodecError):
+                decode(tag + SIZE.pack(2 ** 32 - 1) + b'N')
+
+    def test_invalid_utf8(self):
+        with self.assertRaises(CodecError):
+            decode(b's' + SIZE.pack(2) + b'\xff\xfe')
+
+    def test_unhashable_key(self):
+        with self.assertRaises(CodecError):
+            decode(b'm' + SIZE.pack(1) + b'l' + SIZE.pack(0) + b'N')
+
+    def test_deep_nesting(self):
+        with self.assertRaises(CodecError):
+            decode(b'l' + SIZE.pack(1) * 1 + (b'l' + SIZE.pack(1)) * 100000 + b'N')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+from blobchain.connection import FRAME, VERSION, ConnectionPool, process_message, read_packet, write_packet
+import asyncio
+import unittest
+
+"""Limits on the packets a connection reads from a peer"""
+
+
+class ReplyLimitTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = await asyncio.start_server(self.answer, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.pool = ConnectionPool(timeout=2, max_reply=1024)
+
+    async def asyncTearDown(self):
+        self.pool.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def answer(self, reader, writer):
+        # Replies to PING in full, and to anything else with the frame of a reply far over the limit and no payload
+        request_id, data = await read_packet(reader)
+        if data == process_message('PING', None):
+            write_packet(writer, request_id, process_message('REPL-PING', None))
+        else:
+            writer.write(FRAME.pack(VERSION, request_id, 2 ** 40))
+        await writer.drain()
+        await reader.read()
+        writer.close()
+
+    async def test_reply_within_limit(self):
+        self.assertEqual(await self.pool.request('127.0.0.1', self.port, 'PING', None), ('REPL-PING', None))
+
+    async def test_reply_over_limit_drops_connection(self):
+        with self.assertRaises(ConnectionResetError):
+            await self.pool.request('127.0.0.1', self.port, 'BLOB', None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+from blobchain.blockchain import Blobchain
+from blobchain.ledger import Ledger
+from tests.test_validation import EasyMining, transfer
+import os
+import tempfile
+import unittest
+
+"""Balances and history kept by the Ledger as Blocks are added, reorganised away and snapshotted"""
+
+
+class LedgerTest(EasyMining):
+    def setUp(self):
+        super().setUp()
+        self.blo = Blobchain()
+        self.blo.new_block([transfer(5), transfer(2, "bob", "carol")])
+        self.blo.new_block([transfer(1, "carol", "alice")])
+
+    def test_apply(self):
+        self.assertEqual([self.blo.balance(a) for a in ("alice", "bob", "carol")], [-4, 3, 1])
+        self.assertEqual(self.blo.balance("dave"), 0)
+        self.assertEqual(self.blo.ledger.entries("bob"), [(1, 1), (1, 0)])
+        self.assertEqual([entry["height"] for entry in self.blo.history("alice")], [2, 1])
+        self.assertEqual(self.blo.history("alice", 1)[0]["transaction"], transfer(1, "carol", "alice"))
+
+    def test_revert(self):
+        self.blo.replace_from(2, [])
+        self.assertEqual([self.blo.balance(a) for a in ("alice", "bob", "carol")], [-5, 3, 2])
+        self.blo.replace_from(1, [])
+        # Addresses without transactions left are forgotten altogether
+        self.assertEqual(self.blo.ledger.balances, {})
+        self.assertEqual(self.blo.ledger.history, {})
+        self.assertEqual((self.blo.ledger.height, self.blo.ledger.tip), (1, self.blo.chain[0].own_hash))
+
+    def test_reorganisation_matches_replay(self):
+        other = Blobchain()
+        other.replace_from(0, self.blo.chain[:1])
+        other.new_block([transfer(7, "dave", "bob")])
+        self.blo.replace_from(1, other.chain[1:])
+        replayed = Ledger()
+        replayed.catch_up(self.blo.chain)
+        self.assertEqual(self.blo.ledger.balances, replayed.balances)
+        self.assertEqual({a: list(h) for a, h in self.blo.ledger.history.items()},
+                         {a: list(h) for a, h in replayed.history.items()})
+
+    def test_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ledger.snap')
+            ledger = Ledger(path)
+            ledger.catch_up(self.blo.chain)
+            ledger.snapshot()
+            restored = Ledger(path)
+            self.assertTrue(restored.load())
+            self.assertEqual((restored.balances, restored.height, restored.tip),
+                             (ledger.balances, ledger.height, ledger.tip))
+            # A snapshot of another chain is thrown away and the chain is replayed instead
+            other = Blobchain()
+            other.new_block([transfer(9, "erin", "frank")])
+            stale = Ledger(path)
+            stale.catch_up(other.chain)
+            self.assertEqual(stale.balances, {"erin": -9, "frank": 9})
+
+
+if __name__ == '__main__':
+    unittest.main()
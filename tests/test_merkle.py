@@ -0,0 +1,74 @@
+from hashlib import sha256
+from blobchain.blockchain import Blobchain, verify_inclusion
+from blobchain.mempool import transaction_hash
+from blobchain.merkle import EMPTY_ROOT, MerkleTree, hash_pair, unique_root, verify_proof
+from tests.test_validation import EasyMining, transfer
+import unittest
+
+"""Merkle roots and inclusion proofs, on their own and against mined Blocks"""
+
+
+def leaves(count):
+    return [sha256(f"leaf {n}".encode()).hexdigest() for n in range(count)]
+
+
+class MerkleTreeTest(unittest.TestCase):
+    def test_small_roots(self):
+        a, b, c = leaves(3)
+        self.assertEqual(MerkleTree([]).root, EMPTY_ROOT)
+        self.assertEqual(MerkleTree([a]).root, a)
+        self.assertEqual(MerkleTree([a, b]).root, hash_pair(a, b))
+        self.assertEqual(MerkleTree([a, b, c]).root, hash_pair(hash_pair(a, b), hash_pair(c, c)))
+
+    def test_order_matters(self):
+        a, b = leaves(2)
+        self.assertNotEqual(MerkleTree([a, b]).root, MerkleTree([b, a]).root)
+
+    def test_every_proof_verifies(self):
+        for count in range(1, 18):
+            hashes = leaves(count)
+            tree = MerkleTree(hashes)
+            for position, leaf in enumerate(hashes):
+                self.assertTrue(verify_proof(leaf, tree.proof(position), tree.root), msg=f'{position} of {count}')
+
+    def test_proof_rejects_other_leaf_and_root(self):
+        hashes = leaves(7)
+        tree = MerkleTree(hashes)
+        proof = tree.proof(2)
+        self.assertFalse(verify_proof(hashes[3], proof, tree.root))
+        self.assertFalse(verify_proof(hashes[2], proof, MerkleTree(hashes[:6]).root))
+
+    def test_unique_root(self):
+        hashes = leaves(5)
+        self.assertEqual(unique_root(hashes), MerkleTree(hashes).root)
+        self.assertIsNone(unique_root(hashes + hashes[-1:]))
+        self.assertEqual(unique_root([]), EMPTY_ROOT)
+
+
+class InclusionTest(EasyMining):
+    def setUp(self):
+        super().setUp()
+        self.blo = Blobchain()
+        self.transactions = [transfer(n) for n in range(5)]
+        self.blo.new_block(self.transactions)
+
+    def test_proof_from_chain(self):
+        for transaction in self.transactions:
+            reply = self.blo.inclusion_proof(transaction_hash(transaction))
+            self.assertTrue(verify_inclusion(transaction, reply["header"], reply["proof"]))
+
+    def test_missing_transaction(self):
+        self.assertIsNone(self.blo.inclusion_proof(transaction_hash(transfer(99))))
+
+    def test_forged_header(self):
+        transaction = self.transactions[0]
+        reply = self.blo.inclusion_proof(transaction_hash(transaction))
+        self.assertFalse(verify_inclusion(transfer(99), reply["header"], reply["proof"]))
+        # Any change to the header breaks its hash, so the Proof of Work has to be redone to forge one
+        for field, forged in (("timestamp", 0.0), ("merkle_root", MerkleTree(leaves(2)).root)):
+            header = dict(reply["header"], **{field: forged})
+            self.assertFalse(verify_inclusion(transaction, header, reply["proof"]), msg=field)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+from blobchain.blockchain import Blobchain
+import blobchain.mining as mining
+import unittest
+
+"""Retargeting, and the Proof of Work engines and their cancellation"""
+
+# Target no digest can meet, so that a job only ends when it is cancelled
+UNSOLVABLE = bytes(32)
+
+
+class RetargetTest(unittest.TestCase):
+    # Every fourth Block is retargeted, from a target far from both bounds
+    TARGET = 2 ** 200
+
+    def setUp(self):
+        self.interval = mining.RETARGET_INTERVAL
+        mining.RETARGET_INTERVAL = 4
+
+    def tearDown(self):
+        mining.RETARGET_INTERVAL = self.interval
+
+    def lookup(self, spacing):
+        # Blocks found every spacing seconds, all carrying TARGET
+        return lambda height: (height * spacing, self.TARGET)
+
+    def test_genesis_and_between_retargets(self):
+        self.assertEqual(mining.next_target(0, self.lookup(1)), mining.initial_target())
+        for height in (1, 2, 3, 5, 7):
+            self.assertEqual(mining.next_target(height, self.lookup(0.1)), self.TARGET)
+
+    def test_on_schedule_keeps_target(self):
+        self.assertEqual(mining.next_target(8, self.lookup(mining.BLOCK_INTERVAL)), self.TARGET)
+
+    def test_fast_blocks_lower_target(self):
+        self.assertEqual(mining.next_target(8, self.lookup(mining.BLOCK_INTERVAL / 2)), self.TARGET // 2)
+
+    def test_slow_blocks_raise_target(self):
+        self.assertEqual(mining.next_target(8, self.lookup(mining.BLOCK_INTERVAL * 2)), self.TARGET * 2)
+
+    def test_adjustment_is_bounded(self):
+        bound = mining.MAX_ADJUSTMENT
+        self.assertEqual(mining.next_target(8, self.lookup(0)), self.TARGET // bound)
+        self.assertEqual(mining.next_target(8, self.lookup(-100)), self.TARGET // bound)
+        self.assertEqual(mining.next_target(8, self.lookup(mining.BLOCK_INTERVAL * 100)), self.TARGET * bound)
+
+    def test_target_stays_in_range(self):
+        self.assertEqual(mining.retarget(1, 0, 4), 1)
+        self.assertEqual(mining.retarget(mining.MAX_TARGET, 1000, 4), mining.MAX_TARGET)
+
+    def test_first_retarget_looks_back_to_genesis(self):
+        # The Block at height 4 is retargeted over the 3 intervals since the genesis Block
+        expected = mining.retarget(self.TARGET, 3 * mining.BLOCK_INTERVAL / 2, 3)
+        self.assertEqual(mining.next_target(4, self.lookup(mining.BLOCK_INTERVAL / 2)), expected)
+        self.assertEqual(expected, self.TARGET // 2)
+
+
+class CancelTest(unittest.TestCase):
+    def test_cancel_before_start_abandons_job(self):
+        miner = mining.SerialMiner(chunk=10)
+        job = miner.job()
+        miner.cancel()
+        self.assertIsNone(job.mine('header', UNSOLVABLE))
+
+    def test_job_after_cancel_still_mines(self):
+        miner = mining.SerialMiner(chunk=10)
+        miner.cancel()
+        job = miner.job()
+        self.assertIsNotNone(job.mine('header', mining.difficulty_target(1)))
+
+    def test_chains_have_their_own_miner(self):
+        first, second = Blobchain(), Blobchain()
+        self.assertIsNot(first.miner, second.miner)
+        job = second.miner.job()
+        first.miner.cancel()
+        self.assertEqual(job.generation, second.miner.generation)
+
+
+if __name__ == '__main__':
+    unittest.main()
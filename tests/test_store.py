@@ -0,0 +1,164 @@
+from hashlib import sha256
+from blobchain.store import BlockStore, LENGTH
+import blobchain.mining as mining
+import os
+import tempfile
+import unittest
+
+"""Crash recovery and truncation of the on-disk BlockStore"""
+
+
+def make_block(index):
+    """:return: <tuple> (Block, hex hash) shaped like the ones a Blobchain stores"""
+    own_hash = sha256(f"block {index}".encode()).hexdigest()
+    block = {"index": index, "timestamp": 1.5 * index, "previous_hash": "1", "merkle_root": own_hash,
+             "target": mining.initial_target() >> index % 8, "nonce": index, "own_hash": own_hash,
+             "transactions": [{"recipient": "bob", "sender": "alice", "amount": index}]}
+    return block, own_hash
+
+
+class StoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+        self.hashes = []
+        store = self.open()
+        for index in range(5):
+            self.append(store, index)
+        store.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open(self):
+        return BlockStore(self.path)
+
+    def append(self, store, index):
+        block, own_hash = make_block(index)
+        store.append(block, own_hash)
+        self.hashes.append(own_hash)
+
+    def size(self, name):
+        return os.path.getsize(os.path.join(self.path, name))
+
+    def write(self, name, data):
+        with open(os.path.join(self.path, name), 'ab') as handle:
+            handle.write(data)
+
+    def assert_intact(self, store, length):
+        self.assertEqual(len(store), length)
+        for height in range(length):
+            self.assertEqual(store.read(height)["index"], height)
+            self.assertEqual(store.block_hash(height), self.hashes[height])
+            self.assertEqual(store.height(self.hashes[height]), height)
+        self.assertEqual(store.work(length), sum(mining.block_work(make_block(height)[0]["target"])
+                                                 for height in range(length)))
+
+    def test_reopen(self):
+        store = self.open()
+        self.assert_intact(store, 5)
+        store.close()
+
+    def test_recover_half_written_record(self):
+        # A crash after the index entries were written but before the whole record reached the segment
+        end = self.size('blocks.dat')
+        self.write('blocks.dat', LENGTH.pack(1000) + b'partial')
+        self.write('heights.idx', end.to_bytes(8, 'big'))
+        self.write('hashes.idx', bytes.fromhex(make_block(5)[1]))
+        store = self.open()
+        self.assert_intact(store, 5)
+        self.assertEqual(self.size('blocks.dat'), end)
+        self.assertIsNone(store.height(make_block(5)[1]))
+        store.close()
+
+    def test_recover_missing_index_entry(self):
+        # A crash between the writes of the two indexes leaves a record which only one of them points to
+        self.write('blocks.dat', LENGTH.pack(3) + b'abc')
+        self.write('hashes.idx', bytes.fromhex(make_block(5)[1]))
+        store = self.open()
+        self.assert_intact(store, 5)
+        self.assertEqual(self.size('hashes.idx'), 5 * 32)
+        self.append(store, 5)
+        self.assert_intact(store, 6)
+        store.close()
+
+    def test_recover_missing_work(self):
+        # A store written before works.idx existed has its totals rebuilt from the Blocks
+        os.remove(os.path.join(self.path, 'works.idx'))
+        store = self.open()
+        self.assert_intact(store, 5)
+        store.close()
+
+    def test_recover_lost_hash_table(self):
+        store = self.open()
+        self.assert_intact(store, 5)
+        store.close()
+        with open(os.path.join(self.path, 'lookup.idx'), 'r+b') as handle:
+            handle.truncate(100)
+        store = self.open()
+        self.assert_intact(store, 5)
+        store.close()
+
+    def test_truncate(self):
+        store = self.open()
+        store.height(self.hashes[0])
+        dropped = self.hashes[2:]
+        store.truncate(2)
+        del self.hashes[2:]
+        self.assert_intact(store, 2)
+        for own_hash in dropped:
+            self.assertIsNone(store.height(own_hash))
+        self.append(store, 7)
+        self.assertEqual(store.height(self.hashes[2]), 2)
+        store.close()
+
+        store = self.open()
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.read(2)["index"], 7)
+        self.assertEqual(store.height(self.hashes[2]), 2)
+        self.assertIsNone(store.height(dropped[0]))
+        store.close()
+
+    def test_truncate_before_lookup(self):
+        # Heights dropped while the hash table is not in use must not stay indexed once it is
+        store = self.open()
+        store.height(self.hashes[0])
+        store.close()
+        store = self.open()
+        store.truncate(1)
+        del self.hashes[1:]
+        for index in range(10, 14):
+            self.append(store, index)
+        store.close()
+        store = self.open()
+        for height, own_hash in enumerate(self.hashes):
+            self.assertEqual(store.height(own_hash), height)
+        store.close()
+
+    def test_truncate_everything(self):
+        store = self.open()
+        store.truncate(0)
+        self.assertEqual(len(store), 0)
+        self.assertEqual(self.size('blocks.dat'), 0)
+        self.assertEqual(store.work(0), 0)
+        self.assertIsNone(store.height(self.hashes[0]))
+        store.close()
+
+    def test_lookup_grows(self):
+        store = self.open()
+        store.height(self.hashes[0])
+        for index in range(5, 3000):
+            self.append(store, index)
+        for height in range(0, 3000, 7):
+            self.assertEqual(store.height(self.hashes[height]), height)
+        store.close()
+
+    def test_malformed_hashes(self):
+        store = self.open()
+        for own_hash in ('not hex', 'abcd', None, 42, sha256(b'unknown').hexdigest()):
+            self.assertIsNone(store.height(own_hash))
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+from blobchain.connection import extract_data, process_message, read_packet, write_packet
+from blobchain.mempool import transaction_hash
+from tests.test_validation import EasyMining, transfer
+import blobchain.peer as peer
+import asyncio
+import unittest
+
+"""Headers-first sync and discovery between BlobNodes over localhost"""
+
+HOST = '127.0.0.1'
+
+
+class SyncTest(EasyMining, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.servers = []
+        self.ahead = await self.start()
+        self.behind = await self.start()
+        # Both start from the same genesis Block, as they would after their first sync
+        self.behind.blo.replace_from(0, self.ahead.blo.chain[:1])
+        self.batch = peer.SYNC_BATCH
+        # Small batches, so that a sync takes several HEAD and BODY requests
+        peer.SYNC_BATCH = 2
+
+    async def asyncTearDown(self):
+        peer.SYNC_BATCH = self.batch
+        for _, node in self.servers:
+            node.pool.close()
+        # Lets the servers see the connections close, so that no handler is left waiting on one
+        await asyncio.sleep(0.01)
+        for server, _ in self.servers:
+            server.close()
+            await server.wait_closed()
+
+    async def start(self):
+        node = peer.BlobNode(0, HOST, seeds=[])
+        server = await asyncio.start_server(node.handle_echo, HOST, 0)
+        node.port = server.sockets[0].getsockname()[1]
+        node.address = (HOST, node.port)
+        self.servers.append((server, node))
+        return node
+
+    def hashes(self, node):
+        return [block.own_hash for block in node.blo.chain]
+
+    async def test_catches_up_in_batches(self):
+        for amount in range(5):
+            self.ahead.blo.new_block([transfer(amount)])
+        self.assertTrue(await self.behind.sync(HOST, self.ahead.port))
+        self.assertEqual(self.hashes(self.behind), self.hashes(self.ahead))
+        self.assertEqual(self.behind.blo.balance("bob"), 10)
+        self.assertFalse(await self.behind.sync(HOST, self.ahead.port))
+
+    async def test_peer_behind_is_ignored(self):
+        for amount in range(2):
+            self.ahead.blo.new_block([transfer(amount)])
+        self.behind.blo.new_block([transfer(5)])
+        tip = self.hashes(self.ahead)
+        self.assertFalse(await self.ahead.sync(HOST, self.behind.port))
+        self.assertEqual(self.hashes(self.ahead), tip)
+
+    async def test_reorganisation_returns_dropped_transactions(self):
+        shared, dropped = transfer(1), transfer(2, "carol", "dave")
+        self.behind.blo.new_block([shared, dropped])
+        for transactions in ([shared], [transfer(3)], [transfer(4)]):
+            self.ahead.blo.new_block(transactions)
+        self.assertTrue(await self.behind.sync(HOST, self.ahead.port))
+        self.assertEqual(self.hashes(self.behind), self.hashes(self.ahead))
+        self.assertIn(transaction_hash(dropped), self.behind.blo.mempool)
+        self.assertNotIn(transaction_hash(shared), self.behind.blo.mempool)
+        self.assertEqual(self.behind.blo.balance("dave"), 0)
+
+    async def test_invalid_header_stops_sync(self):
+        for amount in range(3):
+            self.ahead.blo.new_block([transfer(amount)])
+        headers_after = self.ahead.blo.headers_after
+
+        def forged(locator, limit):
+            start, headers = headers_after(locator, limit)
+            return start, [dict(header, timestamp=0.0) for header in headers]
+
+        self.ahead.blo.headers_after = forged
+        self.assertFalse(await self.behind.sync(HOST, self.ahead.port))
+        self.assertEqual(len(self.behind.blo.chain), 1)
+
+    async def test_mismatched_body_stops_sync(self):
+        for amount in range(3):
+            self.ahead.blo.new_block([transfer(amount)])
+        bodies = self.ahead.blo.bodies
+        self.ahead.blo.bodies = lambda hashes: bodies(hashes)[::-1]
+        self.assertFalse(await self.behind.sync(HOST, self.ahead.port))
+        self.assertEqual(len(self.behind.blo.chain), 1)
+
+    async def test_sync_forever_follows_peer(self):
+        self.behind.sync_interval = 0.05
+        self.behind.peers.add((HOST, self.ahead.port))
+        syncing = asyncio.create_task(self.behind.sync_forever())
+        try:
+            for amount in range(3):
+                self.ahead.blo.new_block([transfer(amount)])
+                for _ in range(100):
+                    if self.hashes(self.behind) == self.hashes(self.ahead):
+                        break
+                    await asyncio.sleep(0.01)
+                self.assertEqual(self.hashes(self.behind), self.hashes(self.ahead))
+        finally:
+            syncing.cancel()
+
+    async def test_discover_skips_malformed_list(self):
+        async def liar(reader, writer):
+            # Answers PING, and LIST with a list holding something other than addresses
+            try:
+                while True:
+                    request_id, data = await read_packet(reader)
+                    msgtype, _ = extract_data(data)
+                    reply = [5, [HOST, self.ahead.port]] if msgtype == 'LIST' else None
+                    write_packet(writer, request_id, process_message(f'REPL-{msgtype}', reply))
+                    await writer.drain()
+            except (OSError, EOFError):
+                writer.close()
+
+        server = await asyncio.start_server(liar, HOST, 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            queried = await self.behind.discover([(HOST, port), [HOST, 'nowhere'], (HOST, self.ahead.port)])
+        finally:
+            server.close()
+        self.assertEqual(queried, 2)
+        self.assertIn((HOST, self.ahead.port), self.behind.peers)
+        self.assertGreater(self.behind.peers.rank((HOST, self.ahead.port)), self.behind.peers.rank((HOST, port)))
+
+
+if __name__ == '__main__':
+    unittest.main()
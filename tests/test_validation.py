@@ -0,0 +1,70 @@
+from blobchain.blockchain import Blobchain
+from blobchain.mempool import transaction_hash
+from blobchain.merkle import MerkleTree, unique_root
+from blobchain.validation import ChainValidator
+import blobchain.mining as mining
+import unittest
+
+"""Validation of Block bodies and whole chains received from peers"""
+
+
+def transfer(amount, sender="alice", recipient="bob"):
+    return {"sender": sender, "recipient": recipient, "amount": amount}
+
+
+class EasyMining(unittest.TestCase):
+    # Mines at the lowest difficulty, without retargeting, so that a chain is built in milliseconds
+    def setUp(self):
+        self.settings = mining.DIFFICULTY, mining.RETARGET_INTERVAL
+        mining.DIFFICULTY, mining.RETARGET_INTERVAL = 1, 0
+
+    def tearDown(self):
+        mining.DIFFICULTY, mining.RETARGET_INTERVAL = self.settings
+
+
+class BodyTest(EasyMining):
+    def setUp(self):
+        super().setUp()
+        self.blo = Blobchain()
+        self.transactions = [transfer(1), transfer(2), transfer(3)]
+        self.header = self.blo.new_block(self.transactions).header()
+
+    def test_matching_body(self):
+        self.assertTrue(self.blo.valid_body(self.header, self.transactions))
+        self.assertTrue(self.blo.valid_body(self.blo.chain[0].header(), []))
+
+    def test_other_bodies(self):
+        for transactions in (self.transactions[::-1], self.transactions[:2], self.transactions + [transfer(4)],
+                             [transfer(1), transfer(2), transfer(30)], []):
+            self.assertFalse(self.blo.valid_body(self.header, transactions), msg=transactions)
+
+
+class DuplicateTransactionTest(EasyMining):
+    def setUp(self):
+        super().setUp()
+        self.blo = Blobchain()
+        self.transactions = [transfer(1), transfer(2), transfer(3)]
+        self.block = self.blo.new_block(self.transactions)
+        self.padded = self.transactions + [self.transactions[-1]]
+
+    def test_odd_node_is_paired_with_itself(self):
+        hashes = [transaction_hash(t) for t in self.padded]
+        self.assertEqual(MerkleTree(hashes).root, self.block.merkle_root)
+        self.assertIsNone(unique_root(hashes))
+        self.assertEqual(unique_root(hashes[:3]), self.block.merkle_root)
+
+    def test_valid_body_rejects_repeated_transaction(self):
+        header = self.block.header()
+        self.assertTrue(self.blo.valid_body(header, self.transactions))
+        self.assertFalse(self.blo.valid_body(header, self.padded))
+
+    def test_validator_rejects_repeated_transaction(self):
+        chain = [block.to_dict() for block in self.blo.chain]
+        validator = ChainValidator(workers=0)
+        self.assertIsNone(validator.validate_blocks(chain))
+        chain[1]["transactions"] = self.padded
+        self.assertEqual(validator.validate_blocks(chain), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+from blobchain.key_generator import Domain, PairKey
+from blobchain.verifier import BatchVerifier, key_address, sign_transaction, signing_message
+import asyncio
+import unittest
+
+"""Verification of signed transactions, and the binding of the sender to the key which signed"""
+
+
+class VerifierTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        domain = Domain(1024, 160, 224)
+        cls.alice = PairKey(1024, 160, 224, domain)
+        cls.mallory = PairKey(1024, 160, 224, domain)
+
+    def verify(self, transaction):
+        async def run():
+            return await asyncio.wait_for(BatchVerifier(workers=0).verify(transaction), 5)
+        return asyncio.run(run())
+
+    def test_valid_signature(self):
+        transaction = sign_transaction(self.alice, {"recipient": "bob", "amount": 5})
+        self.assertEqual(transaction["sender"], key_address(transaction["key"]))
+        self.assertTrue(self.verify(transaction))
+
+    def test_tampered_amount(self):
+        transaction = sign_transaction(self.alice, {"recipient": "bob", "amount": 5})
+        transaction["amount"] = 500
+        self.assertFalse(self.verify(transaction))
+
+    def test_sender_of_another_key(self):
+        # Mallory signs, with a valid signature of her own key, a transaction claiming to come from alice
+        alice = key_address([self.alice.p, self.alice.q, self.alice.g, self.alice.y])
+        transaction = {"recipient": "mallory", "sender": alice, "amount": 5,
+                       "key": [self.mallory.p, self.mallory.q, self.mallory.g, self.mallory.y]}
+        transaction["signature"] = list(self.mallory.gen_signature(signing_message(transaction)))
+        self.assertTrue(self.mallory.verify_signature(signing_message(transaction), *transaction["signature"]))
+        self.assertFalse(self.verify(transaction))
+
+    def test_sender_renamed(self):
+        transaction = sign_transaction(self.alice, {"recipient": "bob", "amount": 5})
+        transaction["sender"] = "alice"
+        self.assertFalse(self.verify(transaction))
+
+    def test_non_invertible_signature(self):
+        # q = 15 is composite and shares a factor with s = 3, which has no inverse modulo q
+        transaction = {"recipient": "bob", "amount": 1, "key": [31, 15, 2, 4], "signature": [1, 3]}
+        transaction["sender"] = key_address(transaction["key"])
+        self.assertFalse(self.verify(transaction))
+
+
+if __name__ == '__main__':
+    unittest.main()
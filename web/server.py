@@ -3,8 +3,15 @@ from abc import ABC
 from tornado.web import Application, RequestHandler
 from tornado.options import define, options, parse_command_line
 from tornado.ioloop import IOLoop
+from blobchain.explorer import Explorer
+from blobchain.gateway import Gateway, GatewayError
 
 define('port', default=5000, help='Port to listen on')
+define('node_host', default='127.0.0.1', help='Host of the node transactions are sent to and balances queried from')
+define('node_port', default=8888, help='Port of the node transactions are sent to and balances queried from')
+define('node_timeout', default=5, help='Seconds to wait for the node')
+define('cache_size', default=1024, help='Most block explorer replies cached, 0 to disable the cache')
+define('poll_interval', default=0.5, help='Seconds between two checks for new blocks, which clear the cache')
 
 STATIC_DIRNAME = "assets"
 settings = {
@@ -19,25 +26,129 @@ class InfoView(RequestHandler, ABC):
     def get(self):
         self.render('index.html')
 
-    def post(self):
+    async def post(self):
         if self.get_argument("send", None) is not None:
             sender = self.get_body_argument("sender")
             recipient = self.get_body_argument("recipient")
             amount = self.get_body_argument("amount")
             transaction = {'sender': sender, 'recipient': recipient, 'amount': amount}
+            try:
+                ack = await self.settings["gateway"].submit(transaction)
+            except GatewayError:
+                self.set_status(503)
+                self.write({"error": "The node could not be reached"})
+                return
+            if ack is None:
+                self.set_status(400)
+                self.write({"error": "The transaction was declined by the node"})
+                return
+            self.set_status(202)
+            self.write({"ack": ack})
 
         if self.get_argument("check", None) is not None:
             key = self.get_body_argument("key")
+            try:
+                _, reply = await self.settings["gateway"].request('BALN', key)
+            except GatewayError:
+                self.set_status(503)
+                self.write({"error": "The node could not be reached"})
+                return
+            self.write({"key": key, "balance": reply["balance"], "history": reply["history"]})
 
         if self.get_argument("download", None) is not None:
-            pass
+            await download(self)
+
+
+async def download(handler):
+    # Streams the chain to the browser as a file, flushing every page instead of building it in memory
+    handler.set_header("Content-Type", "application/json")
+    handler.set_header("Content-Disposition", 'attachment; filename="blobchain.json"')
+    try:
+        async for chunk in handler.settings["explorer"].download():
+            handler.write(chunk)
+            await handler.flush()
+    except GatewayError:
+        # Part of the file has gone out already, so the download is cut short for the browser to report it failed
+        handler.request.connection.close()
+
+
+class ExplorerView(RequestHandler, ABC):
+    """Read-only JSON endpoints of the block explorer, answered from the cache of the explorer when possible
+    Every reply carries an ETag, and a conditional GET whose If-None-Match still matches gets an empty 304"""
+    SUPPORTED_METHODS = ["GET"]
+
+    async def reply(self, query):
+        try:
+            tag, body = await query
+        except GatewayError:
+            self.set_status(503)
+            self.write({"error": "The node could not be reached"})
+            return
+        if body is None:
+            self.set_status(404)
+            self.write({"error": "Not found"})
+            return
+        self.set_header("Etag", tag)
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        self.set_header("Content-Type", "application/json")
+        self.write(body)
+
+
+class BlocksView(ExplorerView):
+    async def get(self):
+        try:
+            before = self.get_query_argument("before", None)
+            before = int(before) if before is not None else None
+            limit = int(self.get_query_argument("limit", 20))
+        except ValueError:
+            self.set_status(400)
+            self.write({"error": "before and limit have to be integers"})
+            return
+        await self.reply(self.settings["explorer"].blocks(before, limit))
+
+
+class BlockView(ExplorerView):
+    async def get(self, key):
+        # Heights are short runs of digits, and hashes 64 hexadecimal digits
+        await self.reply(self.settings["explorer"].block(int(key) if len(key) < 64 and key.isdigit() else key))
+
+
+class TransactionView(ExplorerView):
+    async def get(self, tx_hash):
+        await self.reply(self.settings["explorer"].transaction(tx_hash))
+
+
+class StatsView(ExplorerView):
+    async def get(self):
+        await self.reply(self.settings["explorer"].stats())
+
+
+class DownloadView(RequestHandler, ABC):
+    SUPPORTED_METHODS = ["GET"]
+
+    async def get(self):
+        await download(self)
+
+
+def make_app(gateway, explorer, **kwargs):
+    return Application([
+        (r"/", InfoView),
+        (r"/api/blocks", BlocksView),
+        (r"/api/blocks/([0-9a-fA-F]+)", BlockView),
+        (r"/api/transactions/([0-9a-fA-F]+)", TransactionView),
+        (r"/api/stats", StatsView),
+        (r"/download", DownloadView),
+    ], gateway=gateway, explorer=explorer, **settings, **kwargs)
 
 
 def main():
     parse_command_line()
-    app = Application([
-        (r"/", InfoView),
-    ], debug=True, **settings)
+    # Shared by every request, so that they reuse its connection to the node and their transactions are batched
+    gateway = Gateway([(options.node_host, options.node_port)], timeout=options.node_timeout)
+    explorer = Explorer(gateway, options.cache_size, options.poll_interval)
+    app = make_app(gateway, explorer, debug=True)
     app.listen(options.port)
     IOLoop.current().start()
 